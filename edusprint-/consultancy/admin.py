@@ -1,7 +1,25 @@
 from django.contrib import admin
-from .models import Consultant, ConsultancySlot, Booking
+from django.utils import timezone
+from .models import AvailabilityRule, Consultant, ConsultancySlot, Booking, OutboxEvent
 
 # Register your models here.
 admin.site.register(Consultant)
 admin.site.register(ConsultancySlot)
+admin.site.register(AvailabilityRule)
 admin.site.register(Booking)
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'status', 'attempts', 'available_at', 'created_at', 'processed_at')
+    list_filter = ('status', 'topic')
+    ordering = ('-id',)
+    readonly_fields = ('claim_token', 'last_error', 'created_at', 'processed_at')
+
+    actions = ['retry_events']
+
+    def retry_events(self, request, queryset):
+        """Queue selected events again, with a fresh attempt budget"""
+        updated = queryset.exclude(status=OutboxEvent.DONE).update(
+            status=OutboxEvent.PENDING, attempts=0, available_at=timezone.now())
+        self.message_user(request, f"{updated} events queued for retry.")
+    retry_events.short_description = "Retry selected events"
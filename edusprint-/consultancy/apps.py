@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class ConsultancyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'consultancy'
+
+    def ready(self):
+        from . import cache
+        from .models import AvailabilityRule, Booking, Consultant, ConsultancySlot
+        for model in (ConsultancySlot, AvailabilityRule):
+            post_save.connect(cache.slot_changed, sender=model, dispatch_uid=f'slot_cache_{model.__name__}_save')
+            post_delete.connect(cache.slot_changed, sender=model, dispatch_uid=f'slot_cache_{model.__name__}_delete')
+        post_save.connect(cache.booking_changed, sender=Booking, dispatch_uid='slot_cache_booking_save')
+        post_delete.connect(cache.booking_changed, sender=Booking, dispatch_uid='slot_cache_booking_delete')
+        post_save.connect(cache.consultant_changed, sender=Consultant, dispatch_uid='slot_cache_consultant_save')
+
+        from django.contrib.auth import get_user_model
+        from . import search
+        post_save.connect(search.consultant_saved, sender=Consultant, dispatch_uid='consultant_search_save')
+        post_delete.connect(search.consultant_deleted, sender=Consultant, dispatch_uid='consultant_search_delete')
+        post_save.connect(search.user_saved, sender=get_user_model(), dispatch_uid='consultant_search_user_save')
@@ -0,0 +1,101 @@
+"""Expansion of availability rules into bookable slots.
+
+Rule occurrences are generated lazily and in (start_time, rule) order, so a
+caller that needs one page of slots only generates that page, whatever the
+length of the window. Occurrences that already have a ConsultancySlot row
+(because they were booked) are skipped; the row itself is listed, or not,
+like any other slot.
+"""
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+
+from .models import AvailabilityRule, ConsultancySlot
+
+# How far ahead open-ended listings expand rules.
+MAX_HORIZON = timedelta(days=366)
+
+# Occurrences checked against existing slot rows per query.
+CHUNK_SIZE = 200
+
+
+def sort_key(slot):
+    """(start_time, tiebreak) position of a slot in listing order.
+
+    Unsaved slots from a rule sort before concrete slots starting at the same
+    time, ordered by rule id.
+    """
+    return slot.start_time, slot.id if slot.id is not None else -slot.rule_id
+
+
+def active_rules(window_start, window_end):
+    return AvailabilityRule.objects.filter(is_active=True, valid_from__lte=window_end.date()).exclude(
+        valid_until__lt=window_start.date())
+
+
+def _rule_slots(rule, window_start, window_end):
+    for start, end in rule.occurrences(window_start, window_end):
+        yield ConsultancySlot(consultant=rule.consultant, rule=rule, start_time=start, end_time=end)
+
+
+def expand_rules(rules, window_start, window_end=None, after=None):
+    """Yield unsaved ConsultancySlot instances for the rules' free occurrences, in listing order.
+
+    ``after`` is a ``sort_key`` position; only slots sorting after it are
+    yielded.
+    """
+    if window_end is None:
+        window_end = window_start + MAX_HORIZON
+    if after is not None:
+        window_start = max(window_start, after[0])
+    merged = heapq.merge(*(_rule_slots(rule, window_start, window_end) for rule in rules), key=sort_key)
+    if after is not None:
+        merged = (slot for slot in merged if sort_key(slot) > tuple(after))
+    while True:
+        chunk = list(islice(merged, CHUNK_SIZE))
+        if not chunk:
+            return
+        taken = set(ConsultancySlot.objects.filter(
+            rule_id__in={slot.rule_id for slot in chunk},
+            start_time__gte=chunk[0].start_time,
+            start_time__lte=chunk[-1].start_time,
+        ).values_list('rule_id', 'start_time'))
+        for slot in chunk:
+            if (slot.rule_id, slot.start_time) not in taken:
+                yield slot
+
+
+def free_busy(consultant_id, window_start, window_end, zone):
+    """Count a consultant's free and booked slots per hour of ``zone``.
+
+    Returns ``{hour: [free, booked]}`` for the hours with at least one slot
+    starting in [window_start, window_end). Concrete slots are counted by a
+    single grouped query; free occurrences of availability rules are added
+    without building slot objects.
+    """
+    counts = defaultdict(lambda: [0, 0])
+    rows = (
+        ConsultancySlot.objects
+        .filter(consultant_id=consultant_id, start_time__gte=window_start, start_time__lt=window_end)
+        .annotate(hour=TruncHour('start_time', tzinfo=zone))
+        .values('hour')
+        .annotate(free=Count('id', filter=Q(is_booked=False)), booked=Count('id', filter=Q(is_booked=True)))
+        .order_by()
+    )
+    for row in rows:
+        counts[row['hour']][0] += row['free']
+        counts[row['hour']][1] += row['booked']
+    rules = list(active_rules(window_start, window_end).filter(consultant_id=consultant_id))
+    if rules:
+        materialized = set(ConsultancySlot.objects.filter(
+            rule__in=rules, start_time__gte=window_start, start_time__lt=window_end,
+        ).values_list('rule_id', 'start_time'))
+        for rule in rules:
+            for start, _ in rule.occurrences(window_start, window_end):
+                if (rule.id, start) not in materialized:
+                    counts[start.astimezone(zone).replace(minute=0, second=0, microsecond=0)][0] += 1
+    return dict(counts)
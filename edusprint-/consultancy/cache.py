@@ -0,0 +1,109 @@
+"""Versioned cache for the public slot listing.
+
+Cached pages are keyed by the request's host and query string plus a
+version number: the consultant's version when the listing is filtered by
+consultant, otherwise a global version. Any change to a consultant's slots,
+rules or bookings bumps both once the transaction commits, so the next
+request misses the cache instead of being served a slot that was just
+booked. Stale entries are never deleted; they expire after TIMEOUT.
+
+Versions live in the cache itself, so the local-memory default only
+invalidates within one process. Deployments running several processes
+should point ALIAS at a shared cache such as Redis or Memcached.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Name of the cache in CACHES to use.
+    'ALIAS': 'default',
+    # Seconds a page is served from the cache at most. This also bounds how
+    # long a slot stays listed after its start time has passed.
+    'TIMEOUT': 30,
+    'KEY_PREFIX': 'slots',
+}
+
+
+def get_config():
+    """Return the SLOT_LIST_CACHE setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'SLOT_LIST_CACHE', {}))
+    return config
+
+
+def get_cache(config=None):
+    return caches[(config or get_config())['ALIAS']]
+
+
+def _version_key(config, consultant_id=None):
+    scope = 'all' if consultant_id is None else f'c{consultant_id}'
+    return f"{config['KEY_PREFIX']}:version:{scope}"
+
+
+def _initial_version():
+    # Versions start from the clock rather than 1, so a version key that was
+    # evicted never comes back with a number older pages were cached under.
+    return time.time_ns()
+
+
+def get_version(consultant_id=None):
+    config = get_config()
+    cache = get_cache(config)
+    key = _version_key(config, consultant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(consultant_id=None):
+    """Invalidate the cached listings of a consultant and the unfiltered listings."""
+    config = get_config()
+    cache = get_cache(config)
+    keys = [_version_key(config)]
+    if consultant_id is not None:
+        keys.append(_version_key(config, consultant_id))
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), timeout=None)
+
+
+def invalidate_consultant(consultant_id):
+    """Bump the consultant's version once the current transaction commits."""
+    transaction.on_commit(lambda: bump_version(consultant_id))
+
+
+def listing_key(request, consultant_id=None):
+    config = get_config()
+    params = sorted((name, value) for name, values in request.query_params.lists() for value in values)
+    digest = hashlib.sha1(repr((request.get_host(), params)).encode('utf-8')).hexdigest()
+    return f"{config['KEY_PREFIX']}:list:{get_version(consultant_id)}:{digest}"
+
+
+# Signal receivers, connected in ConsultancyConfig.ready().
+
+def slot_changed(sender, instance, **kwargs):
+    invalidate_consultant(instance.consultant_id)
+
+
+def booking_changed(sender, instance, **kwargs):
+    from .models import ConsultancySlot
+    consultant_id = ConsultancySlot.objects.filter(id=instance.slot_id).values_list(
+        'consultant_id', flat=True).first()
+    if consultant_id is None:
+        # The slot is gone as well; its own signal covers the consultant.
+        transaction.on_commit(bump_version)
+    else:
+        invalidate_consultant(consultant_id)
+
+
+def consultant_changed(sender, instance, **kwargs):
+    invalidate_consultant(instance.id)
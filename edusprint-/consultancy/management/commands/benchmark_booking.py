@@ -0,0 +1,102 @@
+import random
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from consultancy.models import Booking, Consultant, ConsultancySlot, OutboxEvent
+from consultancy.views import BookSlotView
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer BookSlotView from many threads on a small set of slots and check that '
+        'every slot is booked exactly once. Benchmark data is removed afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=20, help='Number of contended slots.')
+        parser.add_argument('--clients', type=int, default=300, help='Number of distinct booking users.')
+        parser.add_argument('--attempts', type=int, default=3, help='Booking attempts per client.')
+        parser.add_argument('--threads', type=int, default=32, help='Worker threads.')
+
+    def handle(self, *args, **options):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        owner = CustomUser.objects.create(username=f'{prefix}-consultant', role='client')
+        try:
+            slot_ids, clients = self.create_fixtures(prefix, owner, options)
+            results, elapsed = self.run(slot_ids, clients, options)
+            self.report(slot_ids, results, elapsed)
+        finally:
+            self.cleanup(prefix, owner)
+
+    def cleanup(self, prefix, owner):
+        # Bookings go with their users, but the outbox events they queued
+        # only refer to them by id.
+        booking_ids = list(Booking.objects.filter(slot__consultant__user=owner).values_list('id', flat=True))
+        OutboxEvent.objects.filter(payload__booking_id__in=booking_ids).delete()
+        CustomUser.objects.filter(username__startswith=prefix).delete()
+
+    def create_fixtures(self, prefix, owner, options):
+        consultant = Consultant.objects.create(user=owner, expertise='Benchmark')
+        start = timezone.now() + timedelta(days=1)
+        ConsultancySlot.objects.bulk_create([
+            ConsultancySlot(consultant=consultant, start_time=start + timedelta(hours=i),
+                            end_time=start + timedelta(hours=i, minutes=30))
+            for i in range(options['slots'])
+        ])
+        slot_ids = list(ConsultancySlot.objects.filter(consultant=consultant).values_list('id', flat=True))
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefix}-client-{i}', password='!') for i in range(options['clients'])
+        ])
+        clients = list(CustomUser.objects.filter(username__startswith=f'{prefix}-client-'))
+        return slot_ids, clients
+
+    def run(self, slot_ids, clients, options):
+        factory = APIRequestFactory()
+        view = BookSlotView.as_view()
+
+        def run_client(user):
+            statuses = []
+            try:
+                for _ in range(options['attempts']):
+                    request = factory.post('/api/consultancy/book/', {'slot_id': random.choice(slot_ids)}, format='json')
+                    force_authenticate(request, user=user)
+                    statuses.append(view(request).status_code)
+            finally:
+                # Each worker thread has its own connection.
+                connection.close()
+            return statuses
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = Counter(code for statuses in pool.map(run_client, clients) for code in statuses)
+        return results, time.perf_counter() - start
+
+    def report(self, slot_ids, results, elapsed):
+        total = sum(results.values())
+        self.stdout.write(f'{total} booking attempts in {elapsed:.2f}s ({total / elapsed:.1f} req/s)')
+        for code, count in sorted(results.items()):
+            self.stdout.write(f'  HTTP {code}: {count}')
+
+        per_slot = dict(
+            Booking.objects.filter(slot_id__in=slot_ids).values_list('slot_id').annotate(n=Count('id'))
+        )
+        double_booked = [slot_id for slot_id, n in per_slot.items() if n > 1]
+        booked_flags = ConsultancySlot.objects.filter(id__in=slot_ids, is_booked=True).count()
+        if double_booked or results[201] != len(per_slot) or booked_flags != len(per_slot):
+            raise CommandError(
+                f'Inconsistent bookings: {len(double_booked)} double-booked slots, '
+                f'{results[201]} successes, {len(per_slot)} booked slots, {booked_flags} flagged.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'OK: {len(per_slot)}/{len(slot_ids)} slots booked exactly once; losers got 409.'
+        ))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from consultancy.outbox import OutboxWorker, get_config
+
+
+class Command(BaseCommand):
+    help = 'Carry out pending booking side effects from the outbox, in batches, until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due events and exit.')
+        parser.add_argument('--workers', type=int, help='Threads processing each batch.')
+        parser.add_argument('--batch-size', type=int, help='Events claimed per batch.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when no events are due.')
+
+    def handle(self, *args, **options):
+        config = get_config()
+        if options['workers']:
+            config['WORKERS'] = options['workers']
+        if options['batch_size']:
+            config['BATCH_SIZE'] = options['batch_size']
+        worker = OutboxWorker(config)
+        total_succeeded = total_failed = 0
+        try:
+            while True:
+                succeeded, failed = worker.run_once()
+                total_succeeded += succeeded
+                total_failed += failed
+                if succeeded or failed:
+                    self.stdout.write(f"Processed {succeeded} events, {failed} failed.")
+                    continue
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Done: {total_succeeded} processed, {total_failed} failed.'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultancy', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultancyslot',
+            index=models.Index(condition=models.Q(('is_booked', False)), fields=['start_time', 'id'], name='slot_open_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultancyslot',
+            index=models.Index(fields=['consultant', 'start_time'], name='slot_consultant_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultant',
+            index=models.Index(fields=['expertise'], name='consultant_expertise_idx'),
+        ),
+    ]
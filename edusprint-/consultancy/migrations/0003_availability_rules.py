@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:22
+
+import django.core.validators
+import django.db.models.deletion
+import re
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultancy', '0002_slot_and_expertise_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekdays', models.CharField(help_text='Comma-separated weekdays, 0 = Monday to 6 = Sunday, e.g. "0,2".', max_length=20, validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30)),
+                ('valid_from', models.DateField()),
+                ('valid_until', models.DateField(blank=True, help_text='Last day of the rule; empty for no end.', null=True)),
+                ('time_zone', models.CharField(default='UTC', max_length=64)),
+                ('is_active', models.BooleanField(default=True)),
+                ('consultant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_rules', to='consultancy.consultant')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='consultancyslot',
+            name='rule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slots', to='consultancy.availabilityrule'),
+        ),
+        migrations.AddConstraint(
+            model_name='consultancyslot',
+            constraint=models.UniqueConstraint(fields=('rule', 'start_time'), name='slot_unique_rule_start'),
+        ),
+    ]
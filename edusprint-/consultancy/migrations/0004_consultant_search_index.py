@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:26
+
+from itertools import islice
+
+from django.db import OperationalError, migrations
+
+# The table and its first contents as of this migration, written out here
+# rather than imported from consultancy.search so that later changes there
+# cannot break replaying it.
+TABLE = 'consultancy_consultant_fts'
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    # Databases without FTS5 get no table; search then falls back to LIKE.
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+                f"USING fts5(name, expertise, bio, tokenize='unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5.
+            return
+        Consultant = apps.get_model('consultancy', 'Consultant')
+        consultants = Consultant.objects.using(connection.alias).values_list(
+            'id', 'user__first_name', 'user__last_name', 'user__username', 'expertise', 'bio').iterator()
+        rows = (
+            [consultant_id, ' '.join(part for part in (first_name, last_name, username) if part), expertise, bio]
+            for consultant_id, first_name, last_name, username, expertise, bio in consultants
+        )
+        while batch := list(islice(rows, 1000)):
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, name, expertise, bio) VALUES (%s, %s, %s, %s)', batch)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultancy', '0003_availability_rules'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,5 +1,10 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from django.core.validators import validate_comma_separated_integer_list
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Consultant(models.Model):
     """A consultant who can offer consultancy slots."""
@@ -7,6 +12,11 @@ class Consultant(models.Model):
     bio = models.TextField(blank=True)
     expertise = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['expertise'], name='consultant_expertise_idx'),
+        ]
+
     def __str__(self):
         # Fallback if get_full_name is not implemented
         if hasattr(self.user, 'get_full_name'):  # type: ignore
@@ -15,12 +25,85 @@ class Consultant(models.Model):
                 return name
         return str(self.user)
 
+class AvailabilityRule(models.Model):
+    """Recurring weekly availability, e.g. Mon/Wed 9:00-12:00 in 30-minute slots.
+
+    Rules are expanded into slots on the fly when slots are listed; a
+    ConsultancySlot row is only created for an occurrence once it is booked.
+    Times are wall-clock times in the rule's time zone.
+    """
+    consultant = models.ForeignKey(Consultant, on_delete=models.CASCADE, related_name='availability_rules')
+    weekdays = models.CharField(
+        max_length=20, validators=[validate_comma_separated_integer_list],
+        help_text='Comma-separated weekdays, 0 = Monday to 6 = Sunday, e.g. "0,2".')
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+    valid_from = models.DateField()
+    valid_until = models.DateField(null=True, blank=True, help_text='Last day of the rule; empty for no end.')
+    time_zone = models.CharField(max_length=64, default=settings.TIME_ZONE)
+    is_active = models.BooleanField(default=True)  # type: ignore
+
+    def __str__(self):
+        return f"{self.consultant} | days {self.weekdays} {self.start_time}-{self.end_time}"
+
+    def weekday_set(self):
+        return {int(day) for day in self.weekdays.split(',') if day.strip()}
+
+    def occurrences(self, window_start, window_end):
+        """Yield (start, end) of the rule's slots starting in [window_start, window_end), in order."""
+        zone = ZoneInfo(self.time_zone)
+        weekdays = self.weekday_set()
+        length = timedelta(minutes=self.slot_minutes)
+        if not weekdays or not self.slot_minutes:
+            return
+        day = max(self.valid_from, window_start.astimezone(zone).date())
+        last_day = window_end.astimezone(zone).date()
+        if self.valid_until is not None:
+            last_day = min(last_day, self.valid_until)
+        while day <= last_day:
+            if day.weekday() in weekdays:
+                start = datetime.combine(day, self.start_time, zone)
+                day_end = datetime.combine(day, self.end_time, zone)
+                while start + length <= day_end:
+                    if start >= window_end:
+                        return
+                    if start >= window_start:
+                        yield start, start + length
+                    start += length
+            day += timedelta(days=1)
+
+    def is_occurrence(self, start_time):
+        """Whether a slot of this rule starts exactly at ``start_time``."""
+        return any(start == start_time for start, _ in self.occurrences(start_time, start_time + timedelta(seconds=1)))
+
 class ConsultancySlot(models.Model):
     """A time slot offered by a consultant for booking."""
     consultant = models.ForeignKey(Consultant, on_delete=models.CASCADE, related_name='slots')
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     is_booked = models.BooleanField(default=False)  # type: ignore
+    # Set on slots materialized from an availability rule when booked.
+    rule = models.ForeignKey(
+        AvailabilityRule, on_delete=models.SET_NULL, null=True, blank=True, related_name='slots')
+
+    class Meta:
+        constraints = [
+            # One concrete slot per rule occurrence, however many clients
+            # try to book it at once.
+            models.UniqueConstraint(fields=['rule', 'start_time'], name='slot_unique_rule_start'),
+        ]
+        indexes = [
+            # Partial index holding only open slots, in the (start_time, id)
+            # order AvailableSlotsView pages through.
+            models.Index(
+                fields=['start_time', 'id'],
+                condition=models.Q(is_booked=False),
+                name='slot_open_start_idx',
+            ),
+            # Per-consultant lookups over a time range.
+            models.Index(fields=['consultant', 'start_time'], name='slot_consultant_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.consultant} | {self.start_time} - {self.end_time}"
@@ -34,3 +117,43 @@ class Booking(models.Model):
 
     def __str__(self):
         return f"{self.user} booked {self.slot}"
+
+class OutboxEvent(models.Model):
+    """A side effect of a booking, recorded in the booking's transaction.
+
+    Events are written together with the data they describe and carried out
+    later by the process_outbox worker (see consultancy.outbox), so the
+    request that caused them pays for one INSERT, however many side effects
+    there are.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Pending events are not picked up before this time (retry backoff);
+    # claimed events may be reclaimed after it (lease expiry).
+    available_at = models.DateTimeField(default=timezone.now)
+    # Identifies the worker batch that claimed the event.
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.status})"
@@ -0,0 +1,213 @@
+"""Transactional outbox for booking side effects.
+
+Booking views record one OutboxEvent per side effect (confirmation email,
+consultant notification, calendar invite) with a single INSERT in the
+booking's own transaction, so the events exist if and only if the booking
+does. The process_outbox command drains them in batches on a thread pool.
+
+A batch is claimed with one conditional UPDATE that stamps the events with
+a claim token and a lease, so concurrent workers never pick up the same
+event. Failed events are retried with exponential backoff until
+MAX_ATTEMPTS, then marked failed. A worker that dies mid-batch leaves its
+events to be reclaimed when the lease runs out, which can repeat a side
+effect whose completion was not yet recorded; every message carries the
+event id in an X-Outbox-Event header so receivers can drop duplicates.
+
+Messages go through Django's email backend; the console and file backends
+stand in for a real mail server during development.
+"""
+import logging
+import random
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Booking, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    # Threads processing a batch; 1 processes events in the calling thread.
+    'WORKERS': 4,
+    'MAX_ATTEMPTS': 8,
+    # Retry n waits BACKOFF_BASE * 2 ** (n - 1) seconds, at most
+    # BACKOFF_MAX, plus up to 10% jitter.
+    'BACKOFF_BASE': 5,
+    'BACKOFF_MAX': 3600,
+    # Seconds a claimed event stays reserved for its worker before it is
+    # considered abandoned and reclaimed.
+    'LEASE': 300,
+}
+
+
+def get_config():
+    """Return the BOOKING_OUTBOX setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'BOOKING_OUTBOX', {}))
+    return config
+
+
+HANDLERS = {}
+
+
+def handler(topic):
+    """Register a function that carries out the events of ``topic``."""
+    def register(func):
+        HANDLERS[topic] = func
+        return func
+    return register
+
+
+def _booking(event):
+    return Booking.objects.select_related('user', 'slot__consultant__user').filter(
+        id=event.payload['booking_id']).first()
+
+
+def _send(event, to, subject, body, attachments=()):
+    to = [address for address in to if address]
+    if not to:
+        logger.info('Outbox event %s has no recipient; nothing to send', event.id)
+        return
+    message = EmailMessage(subject, body, to=to, headers={'X-Outbox-Event': str(event.id)})
+    for attachment in attachments:
+        message.attach(*attachment)
+    message.send()
+
+
+@handler('booking.confirmation')
+def send_confirmation(event):
+    booking = _booking(event)
+    if booking is None:
+        return
+    slot = booking.slot
+    _send(event, [booking.user.email], 'Your consultancy session is booked',
+          f"You are booked with {slot.consultant} from {slot.start_time:%Y-%m-%d %H:%M} "
+          f"to {slot.end_time:%H:%M} UTC.")
+
+
+@handler('booking.consultant_notification')
+def notify_consultant(event):
+    booking = _booking(event)
+    if booking is None:
+        return
+    slot = booking.slot
+    body = f"{booking.user} booked your slot on {slot.start_time:%Y-%m-%d %H:%M} UTC."
+    if booking.notes:
+        body += f"\n\nNotes:\n{booking.notes}"
+    _send(event, [slot.consultant.user.email], 'New booking', body)
+
+
+@handler('booking.calendar_update')
+def send_calendar_invite(event):
+    booking = _booking(event)
+    if booking is None:
+        return
+    slot = booking.slot
+    stamp = '%Y%m%dT%H%M%SZ'
+    ics = '\r\n'.join([
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Edusprint//Bookings//EN', 'METHOD:REQUEST',
+        'BEGIN:VEVENT',
+        f'UID:booking-{booking.id}@edusprint',
+        f'DTSTAMP:{booking.booked_at:{stamp}}',
+        f'DTSTART:{slot.start_time:{stamp}}',
+        f'DTEND:{slot.end_time:{stamp}}',
+        f'SUMMARY:Consultancy session with {slot.consultant}',
+        'END:VEVENT', 'END:VCALENDAR', '',
+    ])
+    _send(event, [booking.user.email, slot.consultant.user.email], 'Calendar invite', 'See the attached invite.',
+          attachments=[('invite.ics', ics, 'text/calendar')])
+
+
+BOOKING_TOPICS = ['booking.confirmation', 'booking.consultant_notification', 'booking.calendar_update']
+
+
+def enqueue_booking_events(bookings):
+    """Record the side effects of new bookings; call inside the booking transaction."""
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=topic, payload={'booking_id': booking.id})
+        for booking in bookings for topic in BOOKING_TOPICS
+    ])
+
+
+def backoff(attempts, config):
+    delay = min(config['BACKOFF_BASE'] * 2 ** (attempts - 1), config['BACKOFF_MAX'])
+    return timedelta(seconds=delay * (1 + random.random() / 10))
+
+
+class OutboxWorker:
+    """Claims batches of due events and runs their handlers."""
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+
+    def claim(self):
+        """Claim up to BATCH_SIZE due events; returns (token, events)."""
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        # Pending events past their backoff, and processing events whose
+        # lease has run out.
+        due = OutboxEvent.objects.filter(
+            status__in=[OutboxEvent.PENDING, OutboxEvent.PROCESSING], available_at__lte=now)
+        ids = list(due.order_by('available_at', 'id').values_list('id', flat=True)[:self.config['BATCH_SIZE']])
+        if not ids:
+            return token, []
+        due.filter(id__in=ids).update(
+            status=OutboxEvent.PROCESSING,
+            claim_token=token,
+            available_at=now + timedelta(seconds=self.config['LEASE']),
+            attempts=F('attempts') + 1,
+        )
+        return token, list(OutboxEvent.objects.filter(id__in=ids, claim_token=token).order_by('id'))
+
+    def process(self, event, token):
+        """Run one claimed event's handler and record the outcome; returns True on success."""
+        try:
+            return self._process(event, token)
+        finally:
+            # Pool threads outlive the event; release their connections the
+            # way Django does at the end of a request.
+            if self.config['WORKERS'] > 1:
+                close_old_connections()
+
+    def _process(self, event, token):
+        try:
+            func = HANDLERS.get(event.topic)
+            if func is None:
+                raise LookupError(f"No handler for outbox topic {event.topic!r}")
+            func(event)
+        except Exception:
+            logger.exception('Outbox event %s (%s) failed on attempt %d', event.id, event.topic, event.attempts)
+            if event.attempts >= self.config['MAX_ATTEMPTS']:
+                outcome = {'status': OutboxEvent.FAILED}
+            else:
+                outcome = {
+                    'status': OutboxEvent.PENDING,
+                    'available_at': timezone.now() + backoff(event.attempts, self.config),
+                }
+            OutboxEvent.objects.filter(id=event.id, claim_token=token).update(
+                last_error=traceback.format_exc(), **outcome)
+            return False
+        OutboxEvent.objects.filter(id=event.id, claim_token=token).update(
+            status=OutboxEvent.DONE, processed_at=timezone.now(), last_error='')
+        return True
+
+    def run_once(self):
+        """Process one batch; returns (succeeded, failed)."""
+        token, events = self.claim()
+        if not events:
+            return 0, 0
+        if self.config['WORKERS'] > 1:
+            with ThreadPoolExecutor(max_workers=self.config['WORKERS'], thread_name_prefix='outbox') as pool:
+                results = list(pool.map(lambda event: self.process(event, token), events))
+        else:
+            results = [self.process(event, token) for event in events]
+        succeeded = sum(results)
+        return succeeded, len(results) - succeeded
@@ -0,0 +1,26 @@
+import heapq
+from itertools import islice
+
+from edusprint.pagination import KeysetPagination
+from .availability import sort_key
+
+class SlotCursorPagination(KeysetPagination):
+    """Pages slots in (start_time, id) order.
+
+    If the view defines ``get_rule_slots(after)``, the unsaved slots it
+    returns (expanded from availability rules, with no id) are merged into
+    the page; they carry ``-rule_id`` in place of the id in the cursor.
+    """
+    ordering = ('start_time', 'id')
+    page_size = 50
+
+    def paginate_queryset(self, queryset, request, view=None):
+        rows = self.fetch_rows(queryset, request)
+        get_rule_slots = getattr(view, 'get_rule_slots', None)
+        if get_rule_slots is not None:
+            merged = heapq.merge(rows, get_rule_slots(self.position), key=sort_key)
+            rows = list(islice(merged, self.page_size + 1))
+        return self.finish_page(rows)
+
+    def position_of(self, obj):
+        return list(sort_key(obj))
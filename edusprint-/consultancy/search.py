@@ -0,0 +1,71 @@
+"""Full-text search over consultants' names, expertise and bios.
+
+On SQLite with FTS5, consultants are indexed in an FTS5 table that the
+signal receivers below keep in sync, and results are ranked with bm25,
+expertise weighing most. Elsewhere, search falls back to LIKE queries
+ranked by which fields matched.
+"""
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Case, Q, Value, When
+
+from edusprint.fts import FullTextIndex
+from .models import Consultant
+
+consultant_index = FullTextIndex(
+    'consultancy_consultant_fts', ['name', 'expertise', 'bio'], weights=[5.0, 10.0, 1.0])
+
+# User fields that make up a consultant's indexed name.
+NAME_FIELDS = ('first_name', 'last_name', 'username')
+
+
+def document(first_name, last_name, username, expertise, bio):
+    """The indexed column values, in index column order."""
+    return [' '.join(part for part in (first_name, last_name, username) if part), expertise, bio]
+
+
+def index_consultant(consultant, using=DEFAULT_DB_ALIAS):
+    user = consultant.user
+    values = document(*(getattr(user, field) for field in NAME_FIELDS), consultant.expertise, consultant.bio)
+    consultant_index.index(consultant.id, values, using)
+
+
+def search_consultants(text, limit, offset=0):
+    """Return the consultants best matching ``text``, most relevant first."""
+    if consultant_index.is_available():
+        ids = consultant_index.search(text, limit, offset)
+        consultants = Consultant.objects.select_related('user').in_bulk(ids)
+        return [consultants[consultant_id] for consultant_id in ids if consultant_id in consultants]
+    words = text.split()
+    if not words:
+        return []
+    queryset = Consultant.objects.select_related('user')
+    score = Value(0)
+    for word in words:
+        in_name = (Q(user__first_name__icontains=word) | Q(user__last_name__icontains=word)
+                   | Q(user__username__icontains=word))
+        queryset = queryset.filter(Q(expertise__icontains=word) | Q(bio__icontains=word) | in_name)
+        score = score + Case(When(expertise__icontains=word, then=Value(10)), default=Value(0)) \
+            + Case(When(in_name, then=Value(5)), default=Value(0)) \
+            + Case(When(bio__icontains=word, then=Value(1)), default=Value(0))
+    queryset = queryset.annotate(score=score).order_by('-score', 'id')
+    return list(queryset[offset:offset + limit])
+
+
+# Signal receivers, connected in ConsultancyConfig.ready().
+
+def consultant_saved(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    index_consultant(instance, using)
+
+
+def consultant_deleted(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    consultant_index.remove(instance.id, using)
+
+
+def user_saved(sender, instance, using=DEFAULT_DB_ALIAS, update_fields=None, **kwargs):
+    # Logins save last_login only; skip saves that cannot change the name.
+    if update_fields is not None and not set(update_fields) & set(NAME_FIELDS):
+        return
+    consultant = Consultant.objects.using(using).filter(user=instance).first()
+    if consultant is not None:
+        consultant.user = instance
+        index_consultant(consultant, using)
@@ -10,10 +10,10 @@ class ConsultancySlotSerializer(serializers.ModelSerializer):
     consultant = ConsultantSerializer(read_only=True)
     class Meta:
         model = ConsultancySlot
-        fields = ['id', 'consultant', 'start_time', 'end_time', 'is_booked']
+        fields = ['id', 'consultant', 'rule', 'start_time', 'end_time', 'is_booked']
 
 class BookingSerializer(serializers.ModelSerializer):
     slot = ConsultancySlotSerializer(read_only=True)
     class Meta:
         model = Booking
-        fields = ['id', 'slot', 'user', 'booked_at', 'notes'] 
\ No newline at end of file
+        fields = ['id', 'slot', 'user', 'booked_at', 'notes'] 
\ No newline at end of file
@@ -1,3 +1,598 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users.models import CustomUser
+from . import cache as slot_cache
+from .search import consultant_index
+from .models import AvailabilityRule, Booking, Consultant, ConsultancySlot, OutboxEvent
+from .outbox import HANDLERS, OutboxWorker, enqueue_booking_events, get_config as get_outbox_config
+from .views import (
+    AvailableSlotsView, BatchBookSlotView, BookSlotView, ConsultantCalendarView, ConsultantSearchView,
+)
+
+
+# These tests add slots with bulk_create, which sends no signals, so they
+# read through to the database.
+@override_settings(SLOT_LIST_CACHE={'ENABLED': False})
+class AvailableSlotsViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.start = timezone.now() + timedelta(days=1)
+        cls.consultants = [
+            Consultant.objects.create(
+                user=CustomUser.objects.create(username=f'consultant{i}'),
+                expertise='Career coaching' if i % 2 else 'Visa applications',
+            )
+            for i in range(4)
+        ]
+
+    def make_slots(self, count):
+        ConsultancySlot.objects.bulk_create([
+            ConsultancySlot(
+                consultant=self.consultants[i % len(self.consultants)],
+                start_time=self.start + timedelta(minutes=30 * i),
+                end_time=self.start + timedelta(minutes=30 * i + 30),
+            )
+            for i in range(count)
+        ])
+
+    def get(self, params=None):
+        request = APIRequestFactory().get('/api/consultancy/slots/', params or {})
+        response = AvailableSlotsView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_count_does_not_grow_with_slots(self):
+        # One query for the slots and one for the availability rules.
+        self.make_slots(3)
+        with self.assertNumQueries(2):
+            small = self.get({'page_size': 200})
+        self.make_slots(120)
+        with self.assertNumQueries(2):
+            large = self.get({'page_size': 200})
+        self.assertEqual(len(small['results']), 3)
+        self.assertEqual(len(large['results']), 123)
+
+    def test_cursor_walks_every_slot_once_in_order(self):
+        self.make_slots(25)
+        ConsultancySlot.objects.filter(id__in=ConsultancySlot.objects.values('id')[:5]).update(
+            start_time=self.start)
+        seen = []
+        params = {'page_size': 10}
+        while True:
+            data = self.get(params)
+            seen.extend((slot['start_time'], slot['id']) for slot in data['results'])
+            if not data['next']:
+                break
+            params['cursor'] = parse_qs(urlsplit(data['next']).query)['cursor'][0]
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len({slot_id for _, slot_id in seen}), 25)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_filters(self):
+        self.make_slots(8)
+        consultant = self.consultants[1]
+        data = self.get({'consultant': consultant.id})
+        self.assertEqual({slot['consultant']['id'] for slot in data['results']}, {consultant.id})
+        data = self.get({'expertise': 'visa'})
+        self.assertEqual(len(data['results']), 4)
+        end = (self.start + timedelta(hours=1)).isoformat()
+        data = self.get({'end': end})
+        self.assertEqual(len(data['results']), 2)
+
+
+class AvailabilityRuleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.consultant = Consultant.objects.create(
+            user=CustomUser.objects.create(username='recurring'), expertise='Interview prep')
+        cls.client_user = CustomUser.objects.create(username='student')
+        # Next Monday, so every occurrence below is in the future.
+        today = timezone.now().date()
+        cls.monday = today + timedelta(days=7 - today.weekday())
+        cls.rule = AvailabilityRule.objects.create(
+            consultant=cls.consultant, weekdays='0,2', start_time=time(9), end_time=time(12),
+            slot_minutes=30, valid_from=cls.monday, valid_until=cls.monday + timedelta(days=13),
+            time_zone='UTC',
+        )
+
+    def setUp(self):
+        slot_cache.get_cache().clear()
+
+    def at(self, day, hour, minute=0):
+        return datetime.combine(self.monday + timedelta(days=day), time(hour, minute), dt_timezone.utc)
+
+    def get(self, params=None):
+        request = APIRequestFactory().get('/api/consultancy/slots/', params or {})
+        response = AvailableSlotsView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def book(self, data):
+        request = APIRequestFactory().post('/api/consultancy/book/', data, format='json')
+        force_authenticate(request, user=self.client_user)
+        return BookSlotView.as_view()(request)
+
+    def test_occurrences(self):
+        starts = [start for start, _ in self.rule.occurrences(self.at(0, 0), self.at(14, 0))]
+        # Two weeks of Mondays and Wednesdays, six slots each.
+        self.assertEqual(len(starts), 24)
+        self.assertEqual(starts[:2], [self.at(0, 9), self.at(0, 9, 30)])
+        self.assertEqual(starts[6], self.at(2, 9))
+        self.assertTrue(self.rule.is_occurrence(self.at(2, 11, 30)))
+        self.assertFalse(self.rule.is_occurrence(self.at(2, 12)))
+        self.assertFalse(self.rule.is_occurrence(self.at(1, 9)))
+
+    def test_rule_slots_are_listed_without_rows(self):
+        data = self.get({'end': self.at(1, 0).isoformat()})
+        self.assertEqual(len(data['results']), 6)
+        self.assertEqual({slot['rule'] for slot in data['results']}, {self.rule.id})
+        self.assertEqual({slot['id'] for slot in data['results']}, {None})
+        self.assertFalse(ConsultancySlot.objects.exists())
+
+    def test_booking_materializes_one_slot(self):
+        response = self.book({'rule_id': self.rule.id, 'start_time': self.at(2, 10).isoformat()})
+        self.assertEqual(response.status_code, 201, response.data)
+        slot = ConsultancySlot.objects.get()
+        self.assertEqual((slot.rule_id, slot.start_time, slot.is_booked), (self.rule.id, self.at(2, 10), True))
+        self.assertEqual(Booking.objects.get().slot, slot)
+        response = self.book({'rule_id': self.rule.id, 'start_time': self.at(2, 10).isoformat()})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(ConsultancySlot.objects.count(), 1)
+        starts = [slot['start_time'] for slot in self.get({'page_size': 200})['results']]
+        self.assertEqual(len(starts), 23)
+
+    def test_booking_rejects_times_off_the_rule(self):
+        response = self.book({'rule_id': self.rule.id, 'start_time': self.at(2, 10, 15).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        response = self.book({'rule_id': self.rule.id + 1, 'start_time': self.at(2, 10).isoformat()})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(ConsultancySlot.objects.exists())
+
+    def test_cursor_walks_rule_and_concrete_slots(self):
+        ConsultancySlot.objects.create(consultant=self.consultant, start_time=self.at(0, 9), end_time=self.at(0, 10))
+        ConsultancySlot.objects.create(consultant=self.consultant, start_time=self.at(3, 9), end_time=self.at(3, 10))
+        self.book({'rule_id': self.rule.id, 'start_time': self.at(0, 10).isoformat()})
+        seen = []
+        params = {'page_size': 5}
+        while True:
+            data = self.get(params)
+            seen.extend((slot['start_time'], slot['id'], slot['rule']) for slot in data['results'])
+            if not data['next']:
+                break
+            params['cursor'] = parse_qs(urlsplit(data['next']).query)['cursor'][0]
+        # 24 occurrences, one of them booked, plus two one-off slots.
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual([start for start, _, _ in seen], sorted(start for start, _, _ in seen))
+
+
+class SlotListCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(days=1)
+        cls.consultants = [
+            Consultant.objects.create(user=CustomUser.objects.create(username=f'cached{i}'), expertise='Essays')
+            for i in range(2)
+        ]
+        cls.slots = [
+            ConsultancySlot.objects.create(
+                consultant=consultant, start_time=start + timedelta(hours=i), end_time=start + timedelta(hours=i, minutes=30))
+            for i, consultant in enumerate(cls.consultants * 2)
+        ]
+        cls.client_user = CustomUser.objects.create(username='reader')
+
+    def setUp(self):
+        slot_cache.get_cache().clear()
+
+    def get(self, params=None):
+        request = APIRequestFactory().get('/api/consultancy/slots/', params or {})
+        response = AvailableSlotsView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def book(self, slot):
+        request = APIRequestFactory().post('/api/consultancy/book/', {'slot_id': slot.id}, format='json')
+        force_authenticate(request, user=self.client_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = BookSlotView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+
+    def ids(self, data):
+        return [slot['id'] for slot in data['results']]
+
+    def test_repeated_listing_is_served_from_cache(self):
+        first = self.get()
+        with self.assertNumQueries(0):
+            second = self.get()
+        self.assertEqual(first, second)
+        # A different query string is a different page.
+        with self.assertNumQueries(2):
+            self.get({'page_size': 2})
+
+    def test_booking_invalidates_listings(self):
+        self.get()
+        other = self.get({'consultant': self.consultants[1].id})
+        self.book(self.slots[0])
+        self.assertNotIn(self.slots[0].id, self.ids(self.get()))
+        # The other consultant's listing is untouched and still cached.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get({'consultant': self.consultants[1].id}), other)
+
+    def test_slot_changes_invalidate_listings(self):
+        listed = self.ids(self.get({'consultant': self.consultants[0].id}))
+        deleted_id = self.slots[0].id
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsultancySlot.objects.get(id=deleted_id).delete()
+        self.assertEqual(self.ids(self.get({'consultant': self.consultants[0].id})),
+                         [slot_id for slot_id in listed if slot_id != deleted_id])
+
+
+class ConsultantCalendarViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.consultant = Consultant.objects.create(
+            user=CustomUser.objects.create(username='calendar'), expertise='Admissions')
+        today = timezone.now().date()
+        cls.monday = today + timedelta(days=7 - today.weekday())
+        start = datetime.combine(cls.monday, time(9), dt_timezone.utc)
+        ConsultancySlot.objects.bulk_create([
+            ConsultancySlot(
+                consultant=cls.consultant,
+                start_time=start + timedelta(days=i // 4, minutes=30 * (i % 4)),
+                end_time=start + timedelta(days=i // 4, minutes=30 * (i % 4) + 30),
+                is_booked=i % 4 == 0,
+            )
+            for i in range(8)
+        ])
+        AvailabilityRule.objects.create(
+            consultant=cls.consultant, weekdays='1', start_time=time(14), end_time=time(15),
+            slot_minutes=20, valid_from=cls.monday, time_zone='UTC',
+        )
+
+    def get(self, consultant_id, params):
+        request = APIRequestFactory().get(f'/api/consultancy/consultants/{consultant_id}/calendar/', params)
+        return ConsultantCalendarView.as_view()(request, pk=consultant_id)
+
+    def test_counts_per_day_and_hour(self):
+        params = {'start': f'{self.monday}T00:00:00Z', 'end': f'{self.monday + timedelta(days=7)}T00:00:00Z'}
+        with self.assertNumQueries(4):
+            response = self.get(self.consultant.id, params)
+        self.assertEqual(response.status_code, 200)
+        days = {str(day['date']): (day['free'], day['booked']) for day in response.data['days']}
+        self.assertEqual(days, {
+            str(self.monday): (3, 1),
+            str(self.monday + timedelta(days=1)): (6, 1),
+        })
+        hours = [(hour['hour'].hour, hour['free'], hour['booked']) for hour in response.data['hours']]
+        self.assertEqual(hours, [(9, 1, 1), (10, 2, 0), (9, 1, 1), (10, 2, 0), (14, 3, 0)])
+
+    def test_time_zone_shifts_buckets(self):
+        params = {'start': f'{self.monday}T00:00:00Z', 'end': f'{self.monday + timedelta(days=2)}T00:00:00Z',
+                  'tz': 'Asia/Kolkata'}
+        response = self.get(self.consultant.id, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([hour['hour'].hour for hour in response.data['hours']][:2], [14, 15])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get(self.consultant.id + 1, {}).status_code, 404)
+        self.assertEqual(self.get(self.consultant.id, {'tz': 'Not/AZone'}).status_code, 400)
+        params = {'start': f'{self.monday}T00:00:00Z', 'end': f'{self.monday + timedelta(days=200)}T00:00:00Z'}
+        self.assertEqual(self.get(self.consultant.id, params).status_code, 400)
+
+
+class BookSlotViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        consultant = Consultant.objects.create(user=CustomUser.objects.create(username='tutor'), expertise='Tutoring')
+        start = timezone.now() + timedelta(days=1)
+        cls.slot = ConsultancySlot.objects.create(
+            consultant=consultant, start_time=start, end_time=start + timedelta(hours=1))
+        cls.first = CustomUser.objects.create(username='first')
+        cls.second = CustomUser.objects.create(username='second')
+
+    def book(self, user, slot_id):
+        request = APIRequestFactory().post('/api/consultancy/book/', {'slot_id': slot_id}, format='json')
+        force_authenticate(request, user=user)
+        return BookSlotView.as_view()(request)
+
+    def test_invalid_slot_ids(self):
+        self.assertEqual(self.book(self.first, 'abc').status_code, 400)
+        self.assertEqual(self.book(self.first, None).status_code, 400)
+        response = self.book(self.first, self.slot.id + 1)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data, {'error': 'Slot not found.'})
+        self.assertFalse(Booking.objects.exists())
+
+    def test_second_booker_gets_a_conflict(self):
+        self.assertEqual(self.book(self.first, self.slot.id).status_code, 201)
+        response = self.book(self.second, self.slot.id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data, {'error': 'Slot not available.'})
+        self.assertEqual(list(Booking.objects.values_list('user', flat=True)), [self.first.id])
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+
+    def test_competing_bookings_claim_the_slot_once(self):
+        # The second request arrives while the first is between its claim and
+        # its commit, which is as close as one connection gets to a race.
+        responses = []
+
+        def enqueue_and_compete(bookings):
+            enqueue_booking_events(bookings)
+            responses.append(self.book(self.second, self.slot.id))
+
+        with mock.patch('consultancy.views.enqueue_booking_events', side_effect=enqueue_and_compete):
+            self.assertEqual(self.book(self.first, self.slot.id).status_code, 201)
+        self.assertEqual([response.status_code for response in responses], [409])
+        booking = Booking.objects.get()
+        self.assertEqual(booking.user, self.first)
+        self.assertEqual([event.payload for event in OutboxEvent.objects.all()], [{'booking_id': booking.id}] * 3)
+
+    def test_stale_booking_row_is_a_conflict(self):
+        # A booking left behind while the slot was flagged free again makes
+        # the insert fail after the claim; the claim is rolled back with it.
+        Booking.objects.create(slot=self.slot, user=self.first)
+        ConsultancySlot.objects.filter(id=self.slot.id).update(is_booked=False)
+        response = self.book(self.second, self.slot.id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(Booking.objects.values_list('user', flat=True)), [self.first.id])
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.slot.refresh_from_db()
+        self.assertFalse(self.slot.is_booked)
+
+
+class BatchBookSlotViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        consultants = [
+            Consultant.objects.create(user=CustomUser.objects.create(username=f'series{i}'), expertise='Tutoring')
+            for i in range(2)
+        ]
+        start = timezone.now() + timedelta(days=1)
+        cls.slots = [
+            ConsultancySlot.objects.create(
+                consultant=consultants[i % 2], start_time=start + timedelta(days=i),
+                end_time=start + timedelta(days=i, hours=1))
+            for i in range(30)
+        ]
+        cls.client_user = CustomUser.objects.create(username='series-student')
+        today = timezone.now().date()
+        cls.monday = today + timedelta(days=7 - today.weekday())
+        cls.rule = AvailabilityRule.objects.create(
+            consultant=consultants[0], weekdays='0', start_time=time(9), end_time=time(17),
+            slot_minutes=30, valid_from=cls.monday, time_zone='UTC',
+        )
+
+    def book(self, slot_ids, occurrences=None):
+        data = {'slot_ids': slot_ids}
+        if occurrences is not None:
+            data['occurrences'] = occurrences
+        request = APIRequestFactory().post('/api/consultancy/book/batch/', data, format='json')
+        force_authenticate(request, user=self.client_user)
+        return BatchBookSlotView.as_view()(request)
+
+    def occurrences(self, *hours, week=0):
+        return [
+            {'rule_id': self.rule.id, 'start_time': datetime.combine(
+                self.monday + timedelta(weeks=week), time(int(hour), int(hour % 1 * 60)), dt_timezone.utc).isoformat()}
+            for hour in hours
+        ]
+
+    def test_statement_count_does_not_depend_on_batch_size(self):
+        with self.assertNumQueries(6):
+            response = self.book([slot.id for slot in self.slots[:2]])
+        self.assertEqual(response.status_code, 201)
+        ids = [slot.id for slot in self.slots[2:]]
+        with self.assertNumQueries(6):
+            response = self.book(ids)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([booking['slot']['id'] for booking in response.data], ids)
+        self.assertEqual(ConsultancySlot.objects.filter(is_booked=True).count(), 30)
+        self.assertEqual(Booking.objects.filter(user=self.client_user).count(), 30)
+
+    def test_conflict_books_nothing(self):
+        self.assertEqual(self.book([self.slots[1].id]).status_code, 201)
+        missing = self.slots[-1].id + 1
+        response = self.book([self.slots[0].id, self.slots[1].id, missing])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'], [
+            {'slot_id': self.slots[1].id, 'reason': 'booked'},
+            {'slot_id': missing, 'reason': 'not_found'},
+        ])
+        self.assertFalse(ConsultancySlot.objects.get(id=self.slots[0].id).is_booked)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_invalid_input(self):
+        for slot_ids in ('12', [], ['x'], [self.slots[0].id] * 2, list(range(1, 102))):
+            self.assertEqual(self.book(slot_ids).status_code, 400, slot_ids)
+        for occurrences in ('x', [1], [{'rule_id': 'x'}], self.occurrences(9) * 2, self.occurrences(9.25),
+                            self.occurrences(*range(9, 17), week=-1)):
+            self.assertEqual(self.book([], occurrences).status_code, 400, occurrences)
+        missing_rule = [{**self.occurrences(9)[0], 'rule_id': self.rule.id + 1}]
+        self.assertEqual(self.book([], missing_rule).status_code, 404)
+        self.assertEqual(self.book(list(range(1, 100)), self.occurrences(9, 10)).status_code, 400)
+
+    def test_books_rule_occurrences_in_the_same_batch(self):
+        with self.assertNumQueries(10):
+            response = self.book([self.slots[0].id], self.occurrences(9, 9.5))
+        self.assertEqual(response.status_code, 201, response.data)
+        with self.assertNumQueries(10):
+            response = self.book([], self.occurrences(*range(9, 17), week=1))
+        self.assertEqual(response.status_code, 201, response.data)
+        materialized = ConsultancySlot.objects.filter(rule=self.rule)
+        self.assertEqual(materialized.count(), 10)
+        self.assertFalse(materialized.filter(is_booked=False).exists())
+        self.assertEqual(Booking.objects.filter(slot__rule=self.rule).count(), 10)
+
+    def test_occurrence_conflict_books_and_materializes_nothing(self):
+        self.assertEqual(self.book([], self.occurrences(9.5)).status_code, 201)
+        response = self.book([self.slots[0].id], self.occurrences(9, 9.5))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'], [
+            {'rule_id': self.rule.id, 'start_time': datetime.combine(self.monday, time(9, 30), dt_timezone.utc),
+             'reason': 'booked'},
+        ])
+        self.assertEqual(ConsultancySlot.objects.filter(rule=self.rule).count(), 1)
+        self.assertFalse(ConsultancySlot.objects.get(id=self.slots[0].id).is_booked)
+
+
+class ConsultantSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def make(username, expertise, bio='', **names):
+            return Consultant.objects.create(
+                user=CustomUser.objects.create(username=username, **names), expertise=expertise, bio=bio)
+        cls.visa = make('amrit', 'Student visa applications', 'Former embassy officer.')
+        cls.essays = make('jo', 'Admission essays', 'Helps with visa interviews too.', first_name='Jo', last_name='Malik')
+        cls.loans = make('sam', 'Education loans')
+
+    def search(self, params):
+        request = APIRequestFactory().get('/api/consultancy/consultants/search/', params)
+        response = ConsultantSearchView.as_view()(request)
+        return response
+
+    def ids(self, params):
+        response = self.search(params)
+        self.assertEqual(response.status_code, 200)
+        return [consultant['id'] for consultant in response.data['results']]
+
+    def test_ranks_expertise_matches_first(self):
+        self.assertEqual(self.ids({'q': 'visa'}), [self.visa.id, self.essays.id])
+        self.assertEqual(self.ids({'q': 'malik'}), [self.essays.id])
+        self.assertEqual(self.ids({'q': 'educ'}), [self.loans.id])
+        self.assertEqual(self.ids({'q': 'visa embassy'}), [self.visa.id])
+        self.assertEqual(self.search({'q': ' '}).status_code, 400)
+
+    def test_pages(self):
+        response = self.search({'q': 'visa', 'page_size': 1})
+        self.assertEqual([c['id'] for c in response.data['results']], [self.visa.id])
+        self.assertIn('page=2', response.data['next'])
+        response = self.search({'q': 'visa', 'page_size': 1, 'page': 2})
+        self.assertEqual([c['id'] for c in response.data['results']], [self.essays.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_index_follows_changes(self):
+        self.loans.expertise = 'Visa renewals'
+        self.loans.save()
+        self.assertIn(self.loans.id, self.ids({'q': 'renewals'}))
+        self.assertEqual(self.ids({'q': 'loans'}), [])
+        user = self.visa.user
+        user.first_name = 'Amritpal'
+        user.save()
+        self.assertEqual(self.ids({'q': 'amritpal'}), [self.visa.id])
+        self.essays.delete()
+        self.assertEqual(self.ids({'q': 'essays'}), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'The FTS5 index exists on SQLite only.')
+    def test_query_count_is_constant(self):
+        self.assertTrue(consultant_index.is_available())
+        with self.assertNumQueries(2):
+            self.ids({'q': 'visa'})
+
+    def test_like_fallback(self):
+        with mock.patch.object(consultant_index, 'is_available', return_value=False):
+            self.assertEqual(self.ids({'q': 'visa'}), [self.visa.id, self.essays.id])
+            self.assertEqual(self.ids({'q': 'malik'}), [self.essays.id])
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.consultant = Consultant.objects.create(
+            user=CustomUser.objects.create(username='mentor', email='mentor@example.com'), expertise='Mentoring')
+        start = timezone.now() + timedelta(days=2)
+        cls.slot = ConsultancySlot.objects.create(
+            consultant=cls.consultant, start_time=start, end_time=start + timedelta(hours=1))
+        cls.client_user = CustomUser.objects.create(username='mentee', email='mentee@example.com')
+
+    def book(self):
+        request = APIRequestFactory().post('/api/consultancy/book/', {'slot_id': self.slot.id}, format='json')
+        force_authenticate(request, user=self.client_user)
+        self.assertEqual(BookSlotView.as_view()(request).status_code, 201)
+
+    def worker(self, **overrides):
+        # Pool threads would use their own connections, which cannot see
+        # this test's transaction.
+        return OutboxWorker({**get_outbox_config(), 'WORKERS': 1, **overrides})
+
+    def test_booking_records_events_and_worker_sends_them(self):
+        self.book()
+        events = OutboxEvent.objects.order_by('id')
+        self.assertEqual([event.topic for event in events], [
+            'booking.confirmation', 'booking.consultant_notification', 'booking.calendar_update'])
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(self.worker().run_once(), (3, 0))
+        self.assertEqual(set(OutboxEvent.objects.values_list('status', flat=True)), {OutboxEvent.DONE})
+        self.assertEqual([message.to for message in mail.outbox], [
+            ['mentee@example.com'], ['mentor@example.com'], ['mentee@example.com', 'mentor@example.com']])
+        self.assertEqual(mail.outbox[2].attachments[0][0], 'invite.ics')
+        # Nothing is processed twice.
+        self.assertEqual(self.worker().run_once(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_claimed_events_are_not_claimed_again(self):
+        self.book()
+        token, claimed = self.worker().claim()
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(self.worker().claim()[1], [])
+
+    def test_failures_back_off_then_give_up(self):
+        event = OutboxEvent.objects.create(topic='booking.confirmation', payload={'booking_id': 1})
+        failing = mock.Mock(side_effect=RuntimeError('mail server down'))
+        with mock.patch.dict(HANDLERS, {'booking.confirmation': failing}), self.assertLogs('consultancy.outbox'):
+            self.assertEqual(self.worker(MAX_ATTEMPTS=2).run_once(), (0, 1))
+            event.refresh_from_db()
+            self.assertEqual((event.status, event.attempts), (OutboxEvent.PENDING, 1))
+            self.assertIn('mail server down', event.last_error)
+            self.assertGreater(event.available_at, timezone.now())
+            # Not due until the backoff has passed.
+            self.assertEqual(self.worker(MAX_ATTEMPTS=2).run_once(), (0, 0))
+            OutboxEvent.objects.update(available_at=timezone.now())
+            self.assertEqual(self.worker(MAX_ATTEMPTS=2).run_once(), (0, 1))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.FAILED, 2))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is checked for SQLite only.')
+class ConsultancyIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        consultant = Consultant.objects.create(
+            user=CustomUser.objects.create(username='indexed'), expertise='Scholarships')
+        start = timezone.now() - timedelta(days=30)
+        ConsultancySlot.objects.bulk_create([
+            ConsultancySlot(
+                consultant=consultant,
+                start_time=start + timedelta(hours=i),
+                end_time=start + timedelta(hours=i, minutes=30),
+                is_booked=i % 3 == 0,
+            )
+            for i in range(200)
+        ])
+        cls.consultant = consultant
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_open_slot_listing_uses_partial_index(self):
+        view = AvailableSlotsView()
+        view.request = view.initialize_request(APIRequestFactory().get('/api/consultancy/slots/'))
+        queryset = view.get_queryset().order_by('start_time', 'id')[:51]
+        self.assertUsesIndex(queryset, 'slot_open_start_idx')
+
+    def test_consultant_time_range_uses_composite_index(self):
+        now = timezone.now()
+        queryset = ConsultancySlot.objects.filter(
+            consultant=self.consultant, start_time__gte=now - timedelta(days=1), start_time__lt=now)
+        self.assertUsesIndex(queryset, 'slot_consultant_start_idx')
+
+    def test_expertise_lookup_uses_index(self):
+        self.assertUsesIndex(Consultant.objects.filter(expertise='Scholarships'), 'consultant_expertise_idx')
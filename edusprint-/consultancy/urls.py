@@ -1,8 +1,11 @@
 from django.urls import path
-from .views import ConsultantListView, AvailableSlotsView, BookSlotView
+from .views import ConsultantListView, ConsultantSearchView, ConsultantCalendarView, AvailableSlotsView, BookSlotView, BatchBookSlotView
 
 urlpatterns = [
     path('consultants/', ConsultantListView.as_view(), name='consultant-list'),
+    path('consultants/search/', ConsultantSearchView.as_view(), name='consultant-search'),
+    path('consultants/<int:pk>/calendar/', ConsultantCalendarView.as_view(), name='consultant-calendar'),
     path('slots/', AvailableSlotsView.as_view(), name='available-slots'),
     path('book/', BookSlotView.as_view(), name='book-slot'),
-] 
\ No newline at end of file
+    path('book/batch/', BatchBookSlotView.as_view(), name='book-slot-batch'),
+] 
\ No newline at end of file
@@ -1,7 +1,20 @@
+from datetime import timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.shortcuts import render
-from rest_framework import generics, permissions, status
+from django.utils.dateparse import parse_datetime
+from rest_framework import generics, permissions, serializers, status
 from rest_framework.response import Response
-from .models import Consultant, ConsultancySlot, Booking
+from edusprint.pagination import RankedPagination
+from . import cache as slot_cache
+from .availability import MAX_HORIZON, active_rules, expand_rules, free_busy
+from .models import AvailabilityRule, Consultant, ConsultancySlot, Booking
+from .outbox import enqueue_booking_events
+from .pagination import SlotCursorPagination
+from .search import search_consultants
 from .serializers import ConsultantSerializer, ConsultancySlotSerializer, BookingSerializer
 from django.utils import timezone
 
@@ -12,27 +25,361 @@ class ConsultantListView(generics.ListAPIView):
     serializer_class = ConsultantSerializer
     permission_classes = [permissions.AllowAny]
 
+class ConsultantSearchView(generics.ListAPIView):
+    """Consultants matching ``q`` in their name, expertise or bio, best matches first.
+
+    Paginated by ``page`` and ``page_size``; see consultancy.search for
+    how matches are found and ranked.
+    """
+    serializer_class = ConsultantSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = RankedPagination
+
+    def list(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'q is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginator.paginate_search(
+            lambda limit, offset: search_consultants(text, limit, offset), request)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+def parse_datetime_param(params, name):
+    """Parse an ISO 8601 query parameter; naive values are taken as UTC."""
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise serializers.ValidationError({name: 'Enter a valid ISO 8601 datetime.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+def parse_occurrence(data):
+    """Return ((rule id, start time), None) for a rule occurrence in request data.
+
+    On invalid input, returns (None, error response) instead.
+    """
+    try:
+        rule_id = int(data.get('rule_id'))
+    except (TypeError, ValueError):
+        return None, Response({'error': 'rule_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start_time = parse_datetime_param(data, 'start_time')
+    except (serializers.ValidationError, TypeError):
+        start_time = None
+    if start_time is None:
+        return None, Response({'error': 'start_time must be an ISO 8601 datetime.'},
+                              status=status.HTTP_400_BAD_REQUEST)
+    return (rule_id, start_time), None
+
+def check_occurrence(rule, start_time):
+    """An error response unless ``start_time`` is a future slot of ``rule`` (None if not found)."""
+    if rule is None:
+        return Response({'error': 'Availability rule not found.'}, status=status.HTTP_404_NOT_FOUND)
+    if start_time <= timezone.now() or not rule.is_occurrence(start_time):
+        return Response({'error': 'start_time is not a slot of this rule.'}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
 class AvailableSlotsView(generics.ListAPIView):
+    """Future unbooked slots, filterable by consultant, expertise and time window.
+
+    Pages are cached per query string; see consultancy.cache for how
+    bookings and slot changes invalidate them.
+
+    Slots expanded from availability rules are listed alongside concrete
+    slots; they have no id yet and are booked by ``rule`` and
+    ``start_time`` instead.
+
+    Query parameters: ``consultant`` (id), ``expertise`` (substring),
+    ``start`` and ``end`` (ISO 8601, on the slot start time), plus
+    ``cursor`` and ``page_size`` for keyset pagination.
+    """
     serializer_class = ConsultancySlotSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = SlotCursorPagination
 
-    def get_queryset(self):
+    def list(self, request, *args, **kwargs):
+        config = slot_cache.get_config()
+        if not config['ENABLED']:
+            return super().list(request, *args, **kwargs)
+        cache = slot_cache.get_cache(config)
+        key = slot_cache.listing_key(request, self.get_consultant_filters().get('consultant_id'))
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            cache.set(key, response.data, config['TIMEOUT'])
+            return response
+        return Response(data)
+
+    def get_window(self):
+        params = self.request.query_params
+        start = parse_datetime_param(params, 'start')
+        end = parse_datetime_param(params, 'end')
         now = timezone.now()
-        return ConsultancySlot.objects.filter(is_booked=False, start_time__gte=now)
+        return (max(start, now) if start else now), end
+
+    def get_consultant_filters(self):
+        params = self.request.query_params
+        filters = {}
+        if params.get('consultant'):
+            try:
+                filters['consultant_id'] = int(params['consultant'])
+            except ValueError:
+                raise serializers.ValidationError({'consultant': 'Must be an integer id.'})
+        if params.get('expertise'):
+            filters['consultant__expertise__icontains'] = params['expertise']
+        return filters
+
+    def get_queryset(self):
+        start, end = self.get_window()
+        queryset = ConsultancySlot.objects.filter(
+            is_booked=False, start_time__gte=start, **self.get_consultant_filters(),
+        ).select_related('consultant')
+        if end:
+            queryset = queryset.filter(start_time__lt=end)
+        return queryset
+
+    def get_rule_slots(self, after):
+        """Free rule occurrences in the window, after the ``after`` position."""
+        start, end = self.get_window()
+        rules = active_rules(start, end or start + MAX_HORIZON).filter(
+            **self.get_consultant_filters()).select_related('consultant')
+        return expand_rules(rules, start, end, after)
+
+class ConsultantCalendarView(generics.GenericAPIView):
+    """Per-day and per-hour counts of a consultant's free and booked slots.
+
+    Query parameters: ``start`` and ``end`` (ISO 8601; default: the next
+    seven days from midnight today) and ``tz`` (IANA time zone the days and
+    hours are taken in; default: TIME_ZONE). Ranges are limited to
+    MAX_RANGE.
+    """
+    queryset = Consultant.objects.all()
+    permission_classes = [permissions.AllowAny]
+    MAX_RANGE = timedelta(days=93)
+
+    def get(self, request, *args, **kwargs):
+        consultant = self.get_object()
+        params = request.query_params
+        try:
+            zone = ZoneInfo(params.get('tz') or settings.TIME_ZONE)
+        except (ValueError, ZoneInfoNotFoundError):
+            return Response({'error': 'tz must be an IANA time zone name.'}, status=status.HTTP_400_BAD_REQUEST)
+        start = parse_datetime_param(params, 'start') or timezone.now().astimezone(zone).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        end = parse_datetime_param(params, 'end') or start + timedelta(days=7)
+        if end <= start or end - start > self.MAX_RANGE:
+            return Response({'error': f'end must be after start and at most {self.MAX_RANGE.days} days later.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        hours = sorted(free_busy(consultant.id, start, end, zone).items())
+        days = {}
+        for hour, (free, booked) in hours:
+            day = days.setdefault(hour.date(), {'date': hour.date(), 'free': 0, 'booked': 0})
+            day['free'] += free
+            day['booked'] += booked
+        return Response({
+            'consultant': consultant.id,
+            'start': start,
+            'end': end,
+            'tz': str(zone),
+            'days': list(days.values()),
+            'hours': [{'hour': hour, 'free': free, 'booked': booked} for hour, (free, booked) in hours],
+        })
 
 class BookSlotView(generics.CreateAPIView):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        slot_id = request.data.get('slot_id')
         notes = request.data.get('notes', '')
+        if request.data.get('rule_id') is not None:
+            slot_id, error = self.materialize_rule_slot(request.data)
+            if error is not None:
+                return error
+        else:
+            try:
+                slot_id = int(request.data.get('slot_id'))
+            except (TypeError, ValueError):
+                return Response({'error': 'slot_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            slot = ConsultancySlot.objects.get(id=slot_id, is_booked=False)
-        except ConsultancySlot.DoesNotExist:
-            return Response({'error': 'Slot not available.'}, status=status.HTTP_400_BAD_REQUEST)
-        slot.is_booked = True
-        slot.save()
-        booking = Booking.objects.create(slot=slot, user=request.user, notes=notes)
+            with transaction.atomic():
+                # Claim the slot with one conditional UPDATE: only one of any
+                # number of concurrent requests can flip is_booked.
+                claimed = ConsultancySlot.objects.filter(id=slot_id, is_booked=False).update(is_booked=True)
+                if claimed:
+                    booking = Booking.objects.create(slot_id=slot_id, user=request.user, notes=notes)
+                    enqueue_booking_events([booking])
+        except IntegrityError:
+            # A stale Booking row already holds the slot; nothing was changed.
+            claimed = 0
+        if not claimed:
+            if not ConsultancySlot.objects.filter(id=slot_id).exists():
+                return Response({'error': 'Slot not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'error': 'Slot not available.'}, status=status.HTTP_409_CONFLICT)
         serializer = self.get_serializer(booking)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def materialize_rule_slot(self, data):
+        """Return (slot id, None) for a rule occurrence, creating its slot row if needed.
+
+        On invalid input, returns (None, error response) instead.
+        """
+        occurrence, error = parse_occurrence(data)
+        if error is not None:
+            return None, error
+        rule_id, start_time = occurrence
+        rule = AvailabilityRule.objects.filter(id=rule_id, is_active=True).first()
+        error = check_occurrence(rule, start_time)
+        if error is not None:
+            return None, error
+        # get_or_create retries the lookup if a concurrent request inserted
+        # the row first; the unique (rule, start_time) constraint makes sure
+        # there is only ever one.
+        slot, _ = ConsultancySlot.objects.get_or_create(
+            rule=rule, start_time=start_time,
+            defaults={
+                'consultant_id': rule.consultant_id,
+                'end_time': start_time + timedelta(minutes=rule.slot_minutes),
+            },
+        )
+        return slot.id, None
+
+class BatchBookSlotView(generics.CreateAPIView):
+    """Book several slots at once, all or nothing.
+
+    Takes ``slot_ids`` (a list of slot ids) and/or ``occurrences`` (a list
+    of ``{"rule_id": ..., "start_time": ...}`` rule occurrences, as listed
+    by AvailableSlotsView), up to MAX_SLOTS in total, and optional
+    ``notes``. Occurrences without a slot row yet are materialized in the
+    same transaction. The slots are claimed with a single conditional
+    UPDATE and the bookings inserted with a single INSERT, so the number of
+    statements does not depend on the number of slots. If any slot cannot
+    be claimed, nothing is booked (or materialized) and the response lists
+    the conflicting slots.
+    """
+    serializer_class = BookingSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_SLOTS = 100
+
+    def create(self, request, *args, **kwargs):
+        if hasattr(request.data, 'getlist'):
+            slot_ids = request.data.getlist('slot_ids')
+        else:
+            slot_ids = request.data.get('slot_ids', [])
+        notes = request.data.get('notes', '')
+        try:
+            if not isinstance(slot_ids, list):
+                raise TypeError
+            slot_ids = [int(slot_id) for slot_id in slot_ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'slot_ids must be a list of integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        occurrences, error = self.parse_occurrences(request.data.get('occurrences', []))
+        if error is not None:
+            return error
+        if not 0 < len(slot_ids) + len(occurrences) <= self.MAX_SLOTS:
+            return Response({'error': f'Book between 1 and {self.MAX_SLOTS} slots at a time.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(set(slot_ids)) != len(slot_ids) or len(set(occurrences)) != len(occurrences):
+            return Response({'error': 'slot_ids and occurrences must not contain duplicates.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rules = AvailabilityRule.objects.filter(
+            id__in={rule_id for rule_id, _ in occurrences}, is_active=True).in_bulk() if occurrences else {}
+        for rule_id, start_time in occurrences:
+            error = check_occurrence(rules.get(rule_id), start_time)
+            if error is not None:
+                return error
+        bookings = None
+        try:
+            with transaction.atomic():
+                materialized = self.materialize(occurrences, rules)
+                booked_ids = slot_ids + [materialized[occurrence] for occurrence in occurrences]
+                claimed = ConsultancySlot.objects.filter(id__in=booked_ids, is_booked=False).update(is_booked=True)
+                if claimed == len(booked_ids):
+                    Booking.objects.bulk_create([
+                        Booking(slot_id=slot_id, user=request.user, notes=notes) for slot_id in booked_ids
+                    ])
+                    bookings = list(
+                        Booking.objects.filter(slot_id__in=booked_ids).select_related('slot__consultant'))
+                    enqueue_booking_events(bookings)
+                    # bulk_create sends no signals, so invalidate the
+                    # cached listings here.
+                    for consultant_id in {booking.slot.consultant_id for booking in bookings}:
+                        slot_cache.invalidate_consultant(consultant_id)
+                else:
+                    transaction.set_rollback(True)
+        except IntegrityError:
+            # Stale Booking rows hold some of the slots; nothing was changed.
+            bookings = None
+        if bookings is None:
+            return Response({
+                'error': 'Some slots are not available; nothing was booked.',
+                'conflicts': self.get_conflicts(slot_ids, occurrences),
+            }, status=status.HTTP_409_CONFLICT)
+        order = {slot_id: index for index, slot_id in enumerate(booked_ids)}
+        bookings.sort(key=lambda booking: order[booking.slot_id])
+        serializer = self.get_serializer(bookings, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def parse_occurrences(self, data):
+        """Return ([(rule id, start time)], None), or (None, error response) on invalid input."""
+        if not isinstance(data, list) or not all(isinstance(entry, dict) for entry in data):
+            return None, Response({'error': 'occurrences must be a list of {rule_id, start_time} objects.'},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        occurrences = []
+        for entry in data:
+            occurrence, error = parse_occurrence(entry)
+            if error is not None:
+                return None, error
+            occurrences.append(occurrence)
+        return occurrences, None
+
+    def existing_slots(self, occurrences):
+        """{(rule id, start time): slot id} for the occurrences that have a slot row."""
+        if not occurrences:
+            return {}
+        query = Q()
+        for rule_id, start_time in occurrences:
+            query |= Q(rule_id=rule_id, start_time=start_time)
+        return {
+            (rule_id, start_time): slot_id
+            for slot_id, rule_id, start_time in ConsultancySlot.objects.filter(query).values_list(
+                'id', 'rule_id', 'start_time')
+        }
+
+    def materialize(self, occurrences, rules):
+        """Slot ids for rule occurrences, inserting the missing slot rows in one statement."""
+        slots = self.existing_slots(occurrences)
+        missing = [occurrence for occurrence in occurrences if occurrence not in slots]
+        if missing:
+            # Rows a concurrent booking inserted first are skipped by the
+            # unique (rule, start_time) constraint and picked up below.
+            ConsultancySlot.objects.bulk_create([
+                ConsultancySlot(
+                    rule_id=rule_id, consultant_id=rules[rule_id].consultant_id, start_time=start_time,
+                    end_time=start_time + timedelta(minutes=rules[rule_id].slot_minutes),
+                )
+                for rule_id, start_time in missing
+            ], ignore_conflicts=True)
+            slots = self.existing_slots(occurrences)
+        return slots
+
+    def get_conflicts(self, slot_ids, occurrences=()):
+        """Explain, per slot, why a batch could not be booked."""
+        materialized = self.existing_slots(occurrences)
+        ids = slot_ids + list(materialized.values())
+        found = dict(ConsultancySlot.objects.filter(id__in=ids).values_list('id', 'is_booked'))
+        held = set(Booking.objects.filter(slot_id__in=ids).values_list('slot_id', flat=True))
+        conflicts = []
+        for slot_id in slot_ids:
+            if slot_id not in found:
+                conflicts.append({'slot_id': slot_id, 'reason': 'not_found'})
+            elif found[slot_id] or slot_id in held:
+                conflicts.append({'slot_id': slot_id, 'reason': 'booked'})
+        for rule_id, start_time in occurrences:
+            # Occurrences without a slot row were free; their rows were rolled back.
+            slot_id = materialized.get((rule_id, start_time))
+            if slot_id is not None and (found[slot_id] or slot_id in held):
+                conflicts.append({'rule_id': rule_id, 'start_time': start_time, 'reason': 'booked'})
+        return conflicts
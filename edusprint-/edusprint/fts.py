@@ -0,0 +1,98 @@
+"""SQLite FTS5 full-text indexes kept next to ordinary model tables.
+
+A FullTextIndex is an FTS5 virtual table whose rowid is the primary key of
+the indexed row. The table is created by a migration (when the SQLite build
+has FTS5) and kept in sync by the owning app, usually from signals. Callers
+check ``is_available()`` and fall back to LIKE queries when it is False,
+e.g. on other databases.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    Only word characters are kept, so user input can never be parsed as
+    FTS5 query syntax. Returns None if no words are left.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class FullTextIndex:
+    """An FTS5 table indexing ``columns`` of rows identified by their id."""
+
+    def __init__(self, table, columns, weights=None):
+        self.table = table
+        self.columns = list(columns)
+        # bm25 column weights, in column order; higher means more relevant.
+        self.weights = list(weights or [1.0] * len(self.columns))
+        self._available = set()
+
+    def is_available(self, using=DEFAULT_DB_ALIAS):
+        """Whether the index table exists on the ``using`` database."""
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            return False
+        key = (using, connection.settings_dict['NAME'])
+        if key in self._available:
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table])
+            exists = cursor.fetchone() is not None
+        if exists:
+            self._available.add(key)
+        return exists
+
+    def _insert_sql(self):
+        placeholders = ', '.join(['%s'] * (len(self.columns) + 1))
+        return f"INSERT INTO {self.table} (rowid, {', '.join(self.columns)}) VALUES ({placeholders})"
+
+    def index(self, rowid, values, using=DEFAULT_DB_ALIAS):
+        """Add or replace the entry for ``rowid``; ``values`` are in column order."""
+        if not self.is_available(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [rowid])
+            cursor.execute(self._insert_sql(), [rowid, *values])
+
+    def remove(self, rowid, using=DEFAULT_DB_ALIAS):
+        if not self.is_available(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [rowid])
+
+    def subquery(self, text):
+        """(sql, params) selecting the rowids matching ``text``, for RawSQL; None if nothing can match."""
+        query = match_query(text)
+        if query is None:
+            return None
+        return f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [query]
+
+    def search(self, text, limit, offset=0, using=DEFAULT_DB_ALIAS, restrict=None):
+        """Return the ids of the best matches for ``text``, most relevant first.
+
+        ``restrict`` is an optional (sql, params) subquery selecting the ids
+        that may be returned; it is applied before ranking and paging.
+        """
+        query = match_query(text)
+        if query is None:
+            return []
+        weights = ', '.join(str(float(weight)) for weight in self.weights)
+        where, params = f'{self.table} MATCH %s', [query]
+        if restrict is not None:
+            # The unary plus keeps SQLite from pushing the IN list into the
+            # FTS5 table, which would run the MATCH once per listed id.
+            where += f' AND +rowid IN ({restrict[0]})'
+            params += list(restrict[1])
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {where} '
+                f'ORDER BY bm25({self.table}, {weights}), rowid LIMIT %s OFFSET %s',
+                [*params, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
@@ -84,6 +84,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so concurrent
+            # writers (bookings, the request log flusher) queue on the busy
+            # timeout instead of failing on a lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -143,6 +150,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Runs tests with the buffered writers below writing synchronously; see
+# edusprint/test_runner.py.
+TEST_RUNNER = 'edusprint.test_runner.TestRunner'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -151,5 +162,160 @@ REST_FRAMEWORK = {
 
 import os
 
+# Nothing is routed at MEDIA_URL: portfolio files are only served through
+# /api/portfolio/<id>/file/, which checks who may see them.
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Portfolio files are stored once per distinct content under
+# MEDIA_ROOT/portfolio/blobs (portfolio.storage).
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'portfolio': {
+        'BACKEND': 'portfolio.storage.ContentAddressedStorage',
+        'OPTIONS': {'prefix': 'portfolio/blobs'},
+    },
+}
+
+# Request logging (tracking app). Log records are queued in memory and
+# written in batches by a background thread; see tracking/buffer.py.
+REQUEST_LOG_BUFFER = {
+    'ENABLED': True,
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 2.0,
+    'OVERFLOW': 'drop_newest',
+}
+
+# How much of each request body the tracking middleware records. Multipart
+# uploads are only ever logged by size; see tracking/capture.py for modes.
+REQUEST_LOG_BODY_CAPTURE = {
+    'DEFAULT_MODE': 'prefix',
+    'MAX_PREFIX_BYTES': 1024,
+    'MAX_READ_BYTES': 64 * 1024,
+    'CONTENT_TYPES': {
+        'multipart/form-data': 'meta',
+        'application/octet-stream': 'meta',
+    },
+    'PATHS': {
+        '/api/login/': 'meta',
+        '/api/register/': 'meta',
+        '/api/portfolio/uploads/': 'meta',
+    },
+}
+
+# Retention for request logs once they are rolled up
+# (python manage.py rollup_request_logs --prune).
+REQUEST_LOG_RETENTION = {
+    'RAW_DAYS': 30,
+    'MINUTE_ROLLUP_DAYS': 7,
+    'BATCH_SIZE': 5000,
+}
+
+# Which requests get logged. Logged rows carry sample_weight = 1 / rate so
+# counts can still be estimated; see tracking/sampling.py.
+REQUEST_LOG_SAMPLING = {
+    'DEFAULT_RATE': 1.0,
+    'METHOD_RATES': {},
+    'PATH_RATES': {
+        '/admin/jsi18n/': 0.0,
+        '/admin/': 0.1,
+    },
+    'URL_NAME_RATES': {
+        'homepage': 0.1,
+    },
+    'EXCLUDE_PREFIXES': ['/static/', '/media/', '/favicon.ico'],
+    'ALWAYS_LOG_STATUS': 500,
+    'ALWAYS_LOG_SLOWER_THAN_MS': 1000,
+    'MAX_WRITES_PER_SECOND': 200,
+}
+
+# Where archive_request_logs writes its daily .ndjson.gz / .csv.gz files.
+REQUEST_LOG_ARCHIVE_DIR = BASE_DIR / 'archives' / 'request_logs'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'edusprint',
+    },
+}
+
+# Cache for the public slot listing (consultancy.cache). The local-memory
+# cache only invalidates within one process; point ALIAS at a shared cache,
+# e.g. django.core.cache.backends.redis.RedisCache, when running several
+# workers.
+SLOT_LIST_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 30,
+}
+
+# Booking side effects are sent as email by the process_outbox worker. The
+# console backend prints them; use
+# 'django.core.mail.backends.filebased.EmailBackend' with EMAIL_FILE_PATH to
+# keep them as files, or an SMTP backend in production.
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'bookings@edusprint.local'
+
+BOOKING_OUTBOX = {
+    'BATCH_SIZE': 100,
+    'WORKERS': 4,
+    'MAX_ATTEMPTS': 8,
+    'BACKOFF_BASE': 5,
+    'BACKOFF_MAX': 3600,
+    'LEASE': 300,
+}
+
+# Buffered PortfolioItem view counting (portfolio.counters).
+PORTFOLIO_VIEW_COUNTER = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 5.0,
+    'MAX_PENDING': 1000,
+}
+
+# Chunked portfolio uploads (portfolio.uploads). Partial files live in
+# TEMP_DIR until finalized; run cleanup_uploads periodically to remove
+# abandoned ones.
+PORTFOLIO_UPLOADS = {
+    'TEMP_DIR': BASE_DIR / 'tmp' / 'uploads',
+    'MAX_FILE_SIZE': 2 * 1024 ** 3,
+    'MAX_CHUNK_SIZE': 8 * 1024 ** 2,
+    'EXPIRY_HOURS': 24,
+}
+
+# Thumbnail and preview renditions of portfolio images (portfolio.renditions).
+# Existing items: python manage.py generate_renditions
+PORTFOLIO_RENDITIONS = {
+    'ENABLED': True,
+    'SIZES': {
+        'thumbnail': (200, 200),
+        'preview': (1024, 1024),
+    },
+    'FORMAT': 'JPEG',
+    'QUALITY': 82,
+    'WORKERS': 2,
+}
+
+# Blobs unreferenced for GRACE_HOURS are removed by
+# python manage.py collect_blobs (portfolio.blobs).
+PORTFOLIO_BLOBS = {
+    'GRACE_HOURS': 24,
+}
+
+# Serving portfolio files through /api/portfolio/<id>/file/ (portfolio.media).
+# Behind nginx, set OFFLOAD to 'x-accel-redirect' with an internal location
+# at ACCEL_REDIRECT_PREFIX aliasing MEDIA_ROOT; behind Apache with
+# mod_xsendfile, 'x-sendfile'.
+PORTFOLIO_MEDIA = {
+    'OFFLOAD': '',
+    'ACCEL_REDIRECT_PREFIX': '/protected-media/',
+    'MAX_AGE': 3600,
+}
+
+# Ranking of the public portfolio feed (portfolio.feed). After changing
+# these, rescore existing items with python manage.py rebuild_feed.
+PORTFOLIO_FEED = {
+    'RECENCY_HOURS': 12,
+    'VIEW_WEIGHT': 1.0,
+    'FEATURED_BOOST': 2.0,
+}
@@ -0,0 +1,25 @@
+"""The project's test runner.
+
+The request log buffer (tracking.buffer) and the portfolio view counter
+(portfolio.counters) write from background threads and again at process
+exit, on connections of their own and after the test database is gone.
+Tests therefore run with both writing synchronously; tests that exercise
+buffering enable it themselves with override_settings.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.synchronous_writes = override_settings(
+            REQUEST_LOG_BUFFER={**settings.REQUEST_LOG_BUFFER, 'ENABLED': False},
+            PORTFOLIO_VIEW_COUNTER={**settings.PORTFOLIO_VIEW_COUNTER, 'ENABLED': False},
+        )
+        self.synchronous_writes.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.synchronous_writes.disable()
+        super().teardown_test_environment(**kwargs)
@@ -16,8 +16,6 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 from django.http import HttpResponse
 
 def homepage(request):
@@ -29,7 +27,5 @@ urlpatterns = [
     path('api/', include('users.urls')),
     path('api/portfolio/', include('portfolio.urls')),
     path('api/consultancy/', include('consultancy.urls')),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path('api/tracking/', include('tracking.urls')),
+]
\ No newline at end of file
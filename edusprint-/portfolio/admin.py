@@ -2,10 +2,15 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from django.db.models import Count, Sum
+from django.db.models import Count, Q, Sum
+from django.db.models.expressions import RawSQL
 from django.http import HttpResponse
+from django.utils import timezone
 import csv
-from .models import PortfolioItem, Category, Comment
+from .counters import get_counter
+from .search import portfolio_index
+from .signals import comments_changed, items_changed
+from .models import Blob, PortfolioItem, Category, Comment, ViewerSketch
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -19,11 +24,11 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(PortfolioItem)
 class PortfolioItemAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'category', 'status', 'is_featured', 'views_count', 'file_preview', 'created_at', 'description_preview')
+    list_display = ('title', 'user', 'category', 'status', 'is_featured', 'views_count', 'unique_viewers', 'file_preview', 'created_at', 'description_preview')
     list_filter = ('status', 'is_featured', 'category', 'created_at', 'user__role', 'user')
     search_fields = ('title', 'description', 'user__username', 'user__email')
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'updated_at', 'views_count', 'file_preview')
+    readonly_fields = ('created_at', 'updated_at', 'views_count', 'unique_viewers', 'file_preview')
     list_editable = ('status', 'is_featured')
     
     fieldsets = (
@@ -34,7 +39,7 @@ class PortfolioItemAdmin(admin.ModelAdmin):
             'fields': ('file', 'file_preview')
         }),
         ('Status & Settings', {
-            'fields': ('status', 'is_featured', 'views_count')
+            'fields': ('status', 'is_featured', 'views_count', 'unique_viewers')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -47,10 +52,11 @@ class PortfolioItemAdmin(admin.ModelAdmin):
     def file_preview(self, obj):
         """Display file preview in admin list"""
         if obj.file:
-            if obj.file.name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
+            if obj.thumbnail:
+                # Never the original: a list page would download every full-size image.
                 return format_html(
-                    '<img src="{}" style="max-width: 50px; max-height: 50px;" />',
-                    obj.file.url
+                    '<img src="{}" loading="lazy" style="max-width: 50px; max-height: 50px;" />',
+                    obj.thumbnail.url
                 )
             else:
                 return format_html(
@@ -71,6 +77,17 @@ class PortfolioItemAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize queries by selecting related user data"""
         return super().get_queryset(request).select_related('user', 'category')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search the full-text index (see portfolio.search) instead of LIKE scans, when there is one"""
+        subquery = portfolio_index.subquery(search_term) if portfolio_index.is_available() else None
+        if subquery is None:
+            return super().get_search_results(request, queryset, search_term)
+        # A subquery rather than a list of ids, so the changelist's COUNT and
+        # LIMIT stay in SQL however many items match. Emails are not
+        # indexed; an exact address still finds its owner's items.
+        matches = Q(id__in=RawSQL(*subquery)) | Q(user__email__iexact=search_term.strip())
+        return queryset.filter(matches), False
     
     def save_model(self, request, obj, form, change):
         """Set user automatically if not set"""
@@ -78,29 +95,41 @@ class PortfolioItemAdmin(admin.ModelAdmin):
             obj.user = request.user
         super().save_model(request, obj, form, change)
     
+    def update_items(self, queryset, **values):
+        """Update the selected items and let listeners (e.g. the feed) know which changed."""
+        ids = list(queryset.values_list('id', flat=True))
+        # Queryset updates skip auto_now; listings' ETags rely on it.
+        updated = PortfolioItem.objects.filter(id__in=ids).update(updated_at=timezone.now(), **values)
+        items_changed.send(sender=PortfolioItem, item_ids=ids)
+        return updated
+
     # Custom actions
     def approve_items(self, request, queryset):
-        updated = queryset.update(status='approved')
+        updated = self.update_items(queryset, status='approved')
         self.message_user(request, f'{updated} portfolio items have been approved.')
     approve_items.short_description = "Approve selected items"
     
     def reject_items(self, request, queryset):
-        updated = queryset.update(status='rejected')
+        updated = self.update_items(queryset, status='rejected')
         self.message_user(request, f'{updated} portfolio items have been rejected.')
     reject_items.short_description = "Reject selected items"
     
     def feature_items(self, request, queryset):
-        updated = queryset.update(is_featured=True)
+        updated = self.update_items(queryset, is_featured=True)
         self.message_user(request, f'{updated} portfolio items have been featured.')
     feature_items.short_description = "Feature selected items"
     
     def unfeature_items(self, request, queryset):
-        updated = queryset.update(is_featured=False)
+        updated = self.update_items(queryset, is_featured=False)
         self.message_user(request, f'{updated} portfolio items have been unfeatured.')
     unfeature_items.short_description = "Unfeature selected items"
     
     def reset_views(self, request, queryset):
-        updated = queryset.update(views_count=0)
+        ids = list(queryset.values_list('id', flat=True))
+        get_counter().discard(ids)
+        updated = PortfolioItem.objects.filter(id__in=ids).update(views_count=0, unique_viewers=0, viewers_sketch=b'')
+        ViewerSketch.objects.filter(item_id__in=ids).delete()
+        items_changed.send(sender=PortfolioItem, item_ids=ids)
         self.message_user(request, f'{updated} portfolio items have had their view counts reset.')
     reset_views.short_description = "Reset view counts"
     
@@ -110,7 +139,7 @@ class PortfolioItemAdmin(admin.ModelAdmin):
         response['Content-Disposition'] = 'attachment; filename="portfolio_export.csv"'
         
         writer = csv.writer(response)
-        writer.writerow(['Title', 'User', 'Category', 'Status', 'Featured', 'Views', 'Description', 'File', 'Created At'])
+        writer.writerow(['Title', 'User', 'Category', 'Status', 'Featured', 'Views', 'Unique Viewers', 'Description', 'File', 'Created At'])
         
         for item in queryset:
             writer.writerow([
@@ -120,6 +149,7 @@ class PortfolioItemAdmin(admin.ModelAdmin):
                 item.status,
                 'Yes' if item.is_featured else 'No',
                 item.views_count,
+                item.unique_viewers,
                 item.description,
                 item.file.name if item.file else '',
                 item.created_at.strftime('%Y-%m-%d %H:%M:%S')
@@ -159,12 +189,16 @@ class CommentAdmin(admin.ModelAdmin):
     content_preview.short_description = 'Content'
     
     def approve_comments(self, request, queryset):
+        item_ids = list(queryset.order_by().values_list('portfolio_item_id', flat=True).distinct())
         updated = queryset.update(is_approved=True)
+        comments_changed.send(sender=Comment, item_ids=item_ids)
         self.message_user(request, f'{updated} comments have been approved.')
     approve_comments.short_description = "Approve selected comments"
     
     def reject_comments(self, request, queryset):
+        item_ids = list(queryset.order_by().values_list('portfolio_item_id', flat=True).distinct())
         updated = queryset.update(is_approved=False)
+        comments_changed.send(sender=Comment, item_ids=item_ids)
         self.message_user(request, f'{updated} comments have been rejected.')
     reject_comments.short_description = "Reject selected comments"
     
@@ -187,3 +221,20 @@ class CommentAdmin(admin.ModelAdmin):
         
         return response
     export_comments.short_description = "Export selected comments to CSV"
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    """Stored portfolio files; reference counts are maintained automatically."""
+    list_display = ('name', 'size', 'ref_count', 'created_at', 'updated_at')
+    list_filter = ('created_at',)
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'ref_count', 'created_at', 'updated_at')
+    ordering = ('-created_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting the row would leave the file behind; collect_blobs
+        # removes both once nothing uses them.
+        return False
@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class PortfolioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'portfolio'
+
+    def ready(self):
+        from . import blobs, feed, renditions, search
+        from .models import Comment, PortfolioItem
+        from .signals import comments_changed, items_changed
+        pre_save.connect(blobs.item_pre_save, sender=PortfolioItem, dispatch_uid='portfolio_blob_pre_save')
+        post_save.connect(blobs.item_saved, sender=PortfolioItem, dispatch_uid='portfolio_blob_refs')
+        post_delete.connect(blobs.item_deleted, sender=PortfolioItem, dispatch_uid='portfolio_blob_release')
+        post_save.connect(renditions.item_saved, sender=PortfolioItem, dispatch_uid='portfolio_renditions')
+        post_save.connect(feed.item_saved, sender=PortfolioItem, dispatch_uid='portfolio_feed')
+        items_changed.connect(feed.items_changed, sender=PortfolioItem, dispatch_uid='portfolio_feed_bulk')
+        post_save.connect(search.item_saved, sender=PortfolioItem, dispatch_uid='portfolio_search_save')
+        post_delete.connect(search.item_deleted, sender=PortfolioItem, dispatch_uid='portfolio_search_delete')
+        post_save.connect(search.comment_changed, sender=Comment, dispatch_uid='portfolio_search_comment_save')
+        post_delete.connect(search.comment_changed, sender=Comment, dispatch_uid='portfolio_search_comment_delete')
+        comments_changed.connect(search.comments_changed, sender=Comment, dispatch_uid='portfolio_search_comments')
+        post_save.connect(search.user_saved, sender=get_user_model(), dispatch_uid='portfolio_search_user_save')
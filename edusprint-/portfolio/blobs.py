@@ -0,0 +1,200 @@
+"""Reference counting and garbage collection of portfolio blobs.
+
+Every file in content-addressed storage (portfolio.storage) has a Blob row
+counting the items that use it. Signal receivers add a reference when an
+item is saved with a new file and drop one when its file is replaced or
+the item is deleted. Queryset updates and deletes bypass signals;
+``collect_blobs --recount`` recomputes the counts from the items.
+
+Nothing is deleted when a count reaches zero: the file may be about to be
+reused by an upload in flight. collect_blobs removes blobs that have been
+unreferenced for GRACE_HOURS, files on disk without a Blob row, and
+temporary files left by interrupted writes. Renditions (portfolio.renditions)
+are named after their original's SHA-256 rather than counted; they go once
+no blob with that content is left and no item points at them.
+
+Files stored before content-addressed storage keep their old names and are
+not counted or collected.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Blob, PortfolioItem
+from .renditions import RENDITION_RE, rendition_names
+from .storage import delete_if_unused_since
+
+DEFAULTS = {
+    # Hours a blob must have been unreferenced (and its file untouched)
+    # before collect_blobs removes it.
+    'GRACE_HOURS': 24,
+}
+
+
+def get_config():
+    """Return the PORTFOLIO_BLOBS setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'PORTFOLIO_BLOBS', {}))
+    return config
+
+
+def get_storage():
+    return PortfolioItem._meta.get_field('file').storage
+
+
+def add_reference(name):
+    """Count one more item using ``name``; returns the Blob, or None for names outside blob storage."""
+    storage = get_storage()
+    digest = storage.digest(name)
+    if digest is None:
+        return None
+    try:
+        size = storage.size(name)
+    except OSError:
+        size = 0
+    blob, _ = Blob.objects.get_or_create(name=name, defaults={'sha256': digest, 'size': size})
+    Blob.objects.filter(id=blob.id).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+    return blob
+
+
+def drop_reference(name):
+    if not name or get_storage().digest(name) is None:
+        return
+    Blob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+def find_blob(sha256, size):
+    """A stored blob with this content, marked as just used, or None."""
+    storage = get_storage()
+    for blob in Blob.objects.filter(sha256=sha256, size=size).order_by('-ref_count'):
+        if storage.touch(blob.name):
+            Blob.objects.filter(id=blob.id).update(updated_at=timezone.now())
+            return blob
+    return None
+
+
+def recount():
+    """Recompute every blob's ref_count from the items; returns the number of rows corrected or created."""
+    storage = get_storage()
+    counts = {
+        name: count
+        for name, count in PortfolioItem.objects.exclude(file='').values_list('file').annotate(count=Count('id'))
+        if storage.digest(name)
+    }
+    now = timezone.now()
+    changed = []
+    for blob in Blob.objects.all().iterator():
+        count = counts.pop(blob.name, 0)
+        if blob.ref_count != count:
+            blob.ref_count = count
+            blob.updated_at = now
+            changed.append(blob)
+    Blob.objects.bulk_update(changed, ['ref_count', 'updated_at'], batch_size=500)
+    created = 0
+    for name, count in counts.items():
+        if add_reference(name):
+            Blob.objects.filter(name=name).update(ref_count=count)
+            created += 1
+    return len(changed) + created
+
+
+def collect_garbage(now=None, dry_run=False):
+    """Remove unreferenced blobs, their renditions and stray files; returns counts of what was (or would be) removed."""
+    storage = get_storage()
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=get_config()['GRACE_HOURS'])
+    removed = {'blobs': 0, 'orphans': 0, 'renditions': 0, 'temporary': 0, 'bytes': 0}
+    # Blobs a dry run would have removed, so their renditions are counted too.
+    would_remove = []
+
+    for blob in Blob.objects.filter(ref_count=0, updated_at__lt=cutoff).iterator():
+        if PortfolioItem.objects.filter(file=blob.name).exists():
+            # The count drifted (e.g. a queryset update); fix it, keep the file.
+            Blob.objects.filter(id=blob.id).update(
+                ref_count=PortfolioItem.objects.filter(file=blob.name).count(), updated_at=now)
+            continue
+        if dry_run:
+            would_remove.append(blob.id)
+            removed['blobs'] += 1
+            removed['bytes'] += blob.size
+            continue
+        with transaction.atomic():
+            # Only if still unreferenced: an item may have picked it up since.
+            deleted, _ = Blob.objects.filter(id=blob.id, ref_count=0, updated_at__lt=cutoff).delete()
+            if deleted and not storage.delete_if_unused_since(blob.name, cutoff.timestamp()):
+                transaction.set_rollback(True)
+                continue
+        if deleted:
+            removed['blobs'] += 1
+            removed['bytes'] += blob.size
+
+    known = set(Blob.objects.values_list('name', flat=True))
+    for name in storage.blob_names():
+        if name in known or PortfolioItem.objects.filter(file=name).exists():
+            continue
+        path = storage.path(name)
+        if os.path.getmtime(path) >= cutoff.timestamp():
+            continue
+        size = os.path.getsize(path)
+        if dry_run or storage.delete_if_unused_since(name, cutoff.timestamp()):
+            removed['orphans'] += 1
+            removed['bytes'] += size
+
+    # After the blobs, so renditions of a blob removed above go in the same run.
+    rendition_storage = PortfolioItem._meta.get_field('thumbnail').storage
+    for name in rendition_names(rendition_storage):
+        prefix = RENDITION_RE.match(name).group(1)
+        if Blob.objects.filter(sha256__startswith=prefix).exclude(id__in=would_remove).exists():
+            continue
+        # Files stored before content-addressed storage have no Blob row.
+        if PortfolioItem.objects.filter(Q(thumbnail=name) | Q(preview=name)).exists():
+            continue
+        path = rendition_storage.path(name)
+        if os.path.getmtime(path) >= cutoff.timestamp():
+            continue
+        size = os.path.getsize(path)
+        if dry_run or delete_if_unused_since(path, cutoff.timestamp()):
+            removed['renditions'] += 1
+            removed['bytes'] += size
+
+    temp_dir = storage.path(f'{storage.prefix}/tmp')
+    if os.path.isdir(temp_dir):
+        for filename in os.listdir(temp_dir):
+            path = os.path.join(temp_dir, filename)
+            if os.path.getmtime(path) < cutoff.timestamp():
+                if not dry_run:
+                    os.remove(path)
+                removed['temporary'] += 1
+    return removed
+
+
+# Signal receivers, connected in PortfolioConfig.ready().
+
+def item_pre_save(sender, instance, raw, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and 'file' not in update_fields:
+        instance._previous_file = instance.file.name or ''
+    elif instance.pk is None:
+        instance._previous_file = ''
+    else:
+        instance._previous_file = PortfolioItem.objects.filter(pk=instance.pk).values_list(
+            'file', flat=True).first() or ''
+
+
+def item_saved(sender, instance, raw, **kwargs):
+    previous = instance.__dict__.pop('_previous_file', None)
+    current = instance.file.name or ''
+    if raw or previous is None or previous == current:
+        return
+    with transaction.atomic():
+        add_reference(current)
+        drop_reference(previous)
+
+
+def item_deleted(sender, instance, **kwargs):
+    drop_reference(instance.file.name)
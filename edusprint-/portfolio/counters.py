@@ -0,0 +1,323 @@
+"""Buffered view counting for PortfolioItem.
+
+Views are added to an in-process dict of pending increments and return
+immediately. A background flusher thread writes them out every
+FLUSH_INTERVAL seconds (or sooner once MAX_PENDING items are waiting) as
+``UPDATE ... SET views_count = views_count + n``, one statement per distinct
+``n``, so a hot item costs one row update per flush instead of one write
+transaction per view. Increments that fail to write are put back and
+retried, and whatever is pending is flushed when the process exits.
+
+Views by a known user are also added to a pending HyperLogLog sketch per
+item and day (see portfolio.hll). Flushing merges those into the item's
+all-time sketch and the day's ViewerSketch row and refreshes the
+``unique_viewers`` estimates, with the rows locked so concurrent flushes
+cannot overwrite each other's merges.
+
+Pending increments live in the process that recorded them: ``get_views``
+adds this process's pending count to the stored one, and a hard crash loses
+at most one flush interval of views. ``pending_version`` changes whenever
+they do, for ETags computed from the stored counts.
+"""
+import atexit
+import logging
+import threading
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .signals import items_changed
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Set to False to write every view straight away (one UPDATE each).
+    'ENABLED': True,
+    # Seconds between flushes.
+    'FLUSH_INTERVAL': 5.0,
+    # Flush early once this many distinct items have pending views.
+    'MAX_PENDING': 1000,
+}
+
+
+def get_config():
+    """Return the PORTFOLIO_VIEW_COUNTER setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'PORTFOLIO_VIEW_COUNTER', {}))
+    return config
+
+
+class ViewCounter:
+    """Pending per-item view increments with a background flusher."""
+
+    def __init__(self, flush_interval=5.0, max_pending=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = Counter()
+        # (item id, day) -> HyperLogLog of the viewers not flushed yet.
+        self.pending_viewers = {}
+        self.flushed = 0
+        # Bumped on every change to the pending state; see version().
+        self.generation = 0
+        self._token = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    def start(self):
+        """Start the flusher thread if it is not already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='portfolio-view-flusher', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def increment(self, item_id, count=1, viewer=None):
+        """Record ``count`` views of an item, by ``viewer`` if known, without touching the database."""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        with self._lock:
+            self.generation += 1
+            self.pending[item_id] += count
+            if viewer is not None:
+                key = (item_id, timezone.localdate())
+                sketch = self.pending_viewers.get(key)
+                if sketch is None:
+                    sketch = self.pending_viewers[key] = HyperLogLog()
+                sketch.add(viewer)
+            full = len(self.pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def pending_for(self, item_ids):
+        """Pending (unflushed) views of the given items, as a dict."""
+        with self._lock:
+            return {item_id: self.pending[item_id] for item_id in item_ids if item_id in self.pending}
+
+    def with_pending_viewers(self, item_ids):
+        """The subset of ``item_ids`` with unflushed viewers."""
+        with self._lock:
+            return {item_id for item_id, _ in self.pending_viewers} & set(item_ids)
+
+    def version(self):
+        """A string that changes whenever the pending views do; '' when nothing is pending.
+
+        Includes a per-counter token, so other processes' counters never
+        produce the same value for different pending views.
+        """
+        with self._lock:
+            if not self.pending and not self.pending_viewers:
+                return ''
+            return f'{self._token}:{self.generation}'
+
+    def pending_viewers_for(self, item_id, days=None):
+        """Merged sketch of an item's unflushed viewers, optionally only from the last ``days`` days."""
+        since = timezone.localdate() - timedelta(days=days - 1) if days else None
+        merged = None
+        with self._lock:
+            for (pending_id, day), sketch in self.pending_viewers.items():
+                if pending_id == item_id and (since is None or day >= since):
+                    merged = HyperLogLog(sketch.precision, sketch.registers) if merged is None else merged.merge(sketch)
+        return merged
+
+    def discard(self, item_ids):
+        """Drop pending views of the given items, e.g. when their counts are reset."""
+        item_ids = set(item_ids)
+        with self._lock:
+            self.generation += 1
+            for item_id in item_ids:
+                self.pending.pop(item_id, None)
+            for key in [key for key in self.pending_viewers if key[0] in item_ids]:
+                del self.pending_viewers[key]
+
+    def flush(self):
+        """Write all pending views; returns the number of views written."""
+        from .models import PortfolioItem
+        with self._flush_lock:
+            with self._lock:
+                self.generation += 1
+                batch, self.pending = self.pending, Counter()
+                sketches, self.pending_viewers = self.pending_viewers, {}
+            if not batch:
+                return 0
+            by_count = defaultdict(list)
+            for item_id, count in batch.items():
+                by_count[count].append(item_id)
+            try:
+                with transaction.atomic():
+                    for count, item_ids in by_count.items():
+                        PortfolioItem.objects.filter(id__in=item_ids).update(views_count=F('views_count') + count)
+                    if sketches:
+                        write_viewer_sketches(sketches)
+            except Exception:
+                logger.exception('Could not write %d pending portfolio views; will retry', sum(batch.values()))
+                with self._lock:
+                    self.generation += 1
+                    self.pending.update(batch)
+                    for key, sketch in sketches.items():
+                        if key in self.pending_viewers:
+                            sketch.merge(self.pending_viewers[key])
+                        self.pending_viewers[key] = sketch
+                return 0
+            written = sum(batch.values())
+            with self._lock:
+                self.flushed += written
+            for receiver, error in items_changed.send_robust(sender=PortfolioItem, item_ids=list(batch)):
+                if error is not None:
+                    logger.error('items_changed receiver %r failed after a view flush', receiver, exc_info=error)
+            return written
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                # stop() writes what is left, on its own thread.
+                break
+            if not self.pending:
+                continue
+            self.flush()
+            # This thread lives for the whole process, so release the
+            # connection the same way Django does at the end of a request.
+            close_old_connections()
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher thread and write out anything still pending."""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+
+def write_viewer_sketches(sketches):
+    """Merge {(item id, day): HyperLogLog} into the stored sketches; call inside a transaction."""
+    from .models import PortfolioItem, ViewerSketch
+    item_ids = {item_id for item_id, _ in sketches}
+    days = {day for _, day in sketches}
+    items = PortfolioItem.objects.select_for_update().only('id', 'viewers_sketch').in_bulk(item_ids)
+    rows = {
+        (row.item_id, row.day): row
+        for row in ViewerSketch.objects.select_for_update().filter(item_id__in=item_ids, day__in=days)
+    }
+    item_sketches = {}
+    new_rows = []
+    for (item_id, day), pending in sketches.items():
+        item = items.get(item_id)
+        if item is None:
+            continue  # Deleted since it was viewed.
+        if item_id not in item_sketches:
+            item_sketches[item_id] = HyperLogLog.from_bytes(item.viewers_sketch)
+        item_sketches[item_id].merge(pending)
+        row = rows.get((item_id, day))
+        if row is None:
+            row = ViewerSketch(item_id=item_id, day=day)
+            new_rows.append(row)
+            sketch = pending
+        else:
+            sketch = HyperLogLog.from_bytes(row.sketch).merge(pending)
+        row.sketch = sketch.to_bytes()
+        row.unique_viewers = sketch.count()
+    for item_id, sketch in item_sketches.items():
+        items[item_id].viewers_sketch = sketch.to_bytes()
+        items[item_id].unique_viewers = sketch.count()
+    PortfolioItem.objects.bulk_update([items[item_id] for item_id in item_sketches], ['viewers_sketch', 'unique_viewers'])
+    ViewerSketch.objects.bulk_update(list(rows.values()), ['sketch', 'unique_viewers'])
+    ViewerSketch.objects.bulk_create(new_rows)
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_counter():
+    """Return the process-wide counter, creating it from settings on first use."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                config = get_config()
+                _counter = ViewCounter(flush_interval=config['FLUSH_INTERVAL'], max_pending=config['MAX_PENDING'])
+    return _counter
+
+
+def record_view(item_id, count=1, viewer=None):
+    """Count views of a portfolio item, buffered unless buffering is disabled.
+
+    ``viewer`` identifies who viewed it (e.g. a user id) for the unique
+    viewer estimates; anonymous views only count towards views_count.
+    """
+    if not get_config()['ENABLED']:
+        from .models import PortfolioItem
+        with transaction.atomic():
+            PortfolioItem.objects.filter(id=item_id).update(views_count=F('views_count') + count)
+            if viewer is not None:
+                sketch = HyperLogLog()
+                sketch.add(viewer)
+                write_viewer_sketches({(item_id, timezone.localdate()): sketch})
+        items_changed.send(sender=PortfolioItem, item_ids=[item_id])
+        return
+    get_counter().increment(item_id, count, viewer)
+
+
+def get_views(item):
+    """The item's view count including views not flushed yet."""
+    if _counter is None:
+        return item.views_count
+    return item.views_count + _counter.pending_for([item.id]).get(item.id, 0)
+
+
+def pending_version():
+    """Identifies this process's unflushed views (see ViewCounter.version)."""
+    return _counter.version() if _counter is not None else ''
+
+
+def load_viewer_sketches(items):
+    """Load, in one query, the stored sketches get_unique_viewers needs for ``items``.
+
+    Only items with unflushed viewers need theirs, and listings defer the
+    field; without this each of them would load its own.
+    """
+    if _counter is None:
+        return
+    pending = _counter.with_pending_viewers(item.id for item in items)
+    missing = [item for item in items if item.id in pending and 'viewers_sketch' in item.get_deferred_fields()]
+    if not missing:
+        return
+    from .models import PortfolioItem
+    sketches = dict(PortfolioItem.objects.filter(id__in=[item.id for item in missing]).values_list(
+        'id', 'viewers_sketch'))
+    for item in missing:
+        item.viewers_sketch = sketches.get(item.id, b'')
+
+
+def get_unique_viewers(item, days=None):
+    """Estimated distinct viewers of an item, all time or over the last ``days`` days.
+
+    Includes viewers not flushed yet in this process.
+    """
+    pending = _counter.pending_viewers_for(item.id, days) if _counter is not None else None
+    if days is None:
+        if pending is None:
+            return item.unique_viewers
+        return HyperLogLog.from_bytes(item.viewers_sketch).merge(pending).count()
+    from .models import ViewerSketch
+    since = timezone.localdate() - timedelta(days=days - 1)
+    merged = pending if pending is not None else HyperLogLog()
+    for data in ViewerSketch.objects.filter(item=item, day__gte=since).values_list('sketch', flat=True):
+        merged.merge(HyperLogLog.from_bytes(data))
+    return merged.count()
@@ -0,0 +1,109 @@
+"""The public feed of approved portfolio items.
+
+Each approved item has a FeedEntry holding its ranking score, and the feed
+is read from the (score, item) index, so a page costs the same however
+many items there are. The score mixes recency, views and featured status::
+
+    score = (created_at - EPOCH) / RECENCY_HOURS
+            + VIEW_WEIGHT * log10(1 + views_count)
+            + FEATURED_BOOST if featured
+
+Recency enters as a constant that grows with creation time rather than a
+decay applied at read time, so scores never need recomputing as time
+passes: a new item outranks one RECENCY_HOURS older unless the older one
+has about ten times the views. Entries change only when their item does:
+post_save for single saves, and the items_changed signal for queryset
+updates from admin actions and view count flushes.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import FeedEntry, PortfolioItem
+
+DEFAULTS = {
+    # Hours of recency worth one point of score.
+    'RECENCY_HOURS': 12,
+    # Points per tenfold increase in views.
+    'VIEW_WEIGHT': 1.0,
+    # Points added to featured items.
+    'FEATURED_BOOST': 2.0,
+}
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+ITEM_FIELDS = ('id', 'status', 'is_featured', 'views_count', 'created_at')
+
+
+def get_config():
+    """Return the PORTFOLIO_FEED setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'PORTFOLIO_FEED', {}))
+    return config
+
+
+def score(created_at, views_count, is_featured, config=None):
+    config = config or get_config()
+    recency = (created_at - EPOCH).total_seconds() / (config['RECENCY_HOURS'] * 3600)
+    popularity = config['VIEW_WEIGHT'] * math.log10(1 + views_count)
+    return recency + popularity + (config['FEATURED_BOOST'] if is_featured else 0.0)
+
+
+def write_entries(rows, entry_model=FeedEntry, using='default'):
+    """Bring the entries of ``rows`` (tuples of ITEM_FIELDS) up to date.
+
+    Approved items get their entry created or rescored in one upsert;
+    entries of the others are deleted.
+    """
+    config = get_config()
+    now = timezone.now()
+    entries = [
+        entry_model(item_id=item_id, score=score(created_at, views_count, is_featured, config), updated_at=now)
+        for item_id, status, is_featured, views_count, created_at in rows
+        if status == 'approved'
+    ]
+    listed = {entry.item_id for entry in entries}
+    entry_model.objects.using(using).filter(
+        item_id__in=[row[0] for row in rows if row[0] not in listed]).delete()
+    entry_model.objects.using(using).bulk_create(
+        entries, update_conflicts=True, unique_fields=['item'], update_fields=['score', 'updated_at'])
+
+
+def sync(item_ids):
+    """Update the entries of the given items from the database."""
+    item_ids = set(item_ids)
+    if not item_ids:
+        return
+    rows = list(PortfolioItem.objects.filter(id__in=item_ids).values_list(*ITEM_FIELDS))
+    # Items deleted meanwhile lose their entries by cascade.
+    write_entries(rows)
+
+
+def rebuild(item_model=PortfolioItem, entry_model=FeedEntry, using='default', batch_size=1000):
+    """Recompute the whole feed, e.g. after changing the score settings."""
+    with transaction.atomic(using=using):
+        entry_model.objects.using(using).all().delete()
+        queryset = item_model.objects.using(using).filter(status='approved').order_by('id')
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).values_list(*ITEM_FIELDS)[:batch_size])
+            if not rows:
+                break
+            write_entries(rows, entry_model, using)
+            last_id = rows[-1][0]
+
+
+# Signal receivers, connected in PortfolioConfig.ready().
+
+def item_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # The instance has everything the score needs; no need to read it back.
+    write_entries([tuple(getattr(instance, field) for field in ITEM_FIELDS)])
+
+
+def items_changed(sender, item_ids, **kwargs):
+    sync(item_ids)
@@ -0,0 +1,78 @@
+"""HyperLogLog sketches for estimating distinct counts in fixed space.
+
+A sketch with precision ``p`` keeps 2**p one-byte registers and estimates
+the number of distinct values added with a standard error of about
+1.04 / sqrt(2**p), 1.6% at the default p = 12, however many values it has
+seen. Sketches of the same precision merge losslessly (register-wise max),
+so per-day sketches can be combined into any longer period.
+
+Serialized sketches are zlib-compressed; a sketch that has seen few values
+is mostly zero registers and compresses to a few dozen bytes, and a full one
+stays around 3-4 KB.
+"""
+import hashlib
+import math
+import zlib
+
+DEFAULT_PRECISION = 12
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """A mergeable distinct-count sketch."""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"HyperLogLog precision must be between 4 and 16, not {precision}")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = bytearray(self.size)
+        elif len(registers) != self.size:
+            raise ValueError(f"Expected {self.size} registers for precision {precision}, got {len(registers)}")
+        self.registers = bytearray(registers)
+
+    def add(self, value):
+        """Add a value; returns True if the sketch changed."""
+        x = hash64(value)
+        bits = 64 - self.precision
+        index = x >> bits
+        # Position of the leftmost 1 in the remaining bits, counting from 1.
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one; returns self."""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added."""
+        m = self.size
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small cardinalities: linear counting is more accurate.
+            return round(m * math.log(m / zeros))
+        # With 64-bit hashes no large-range correction is needed.
+        return round(estimate)
+
+    def to_bytes(self):
+        return zlib.compress(bytes([self.precision]) + bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=DEFAULT_PRECISION):
+        """Load a serialized sketch; empty data gives an empty sketch."""
+        if not data:
+            return cls(precision)
+        raw = zlib.decompress(bytes(data))
+        return cls(raw[0], raw[1:])
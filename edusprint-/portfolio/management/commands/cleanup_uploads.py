@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.uploads import cleanup_expired
+
+
+class Command(BaseCommand):
+    help = 'Remove expired, unfinished chunked uploads and stray partial files.'
+
+    def handle(self, *args, **options):
+        sessions, files = cleanup_expired()
+        self.stdout.write(self.style.SUCCESS(f'Removed {sessions} expired uploads and {files} stray partial files.'))
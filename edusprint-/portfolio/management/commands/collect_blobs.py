@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.blobs import collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = 'Remove portfolio blobs no item has used for the grace period, their renditions, and stray blob files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from the items first.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be removed.')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f'Corrected {recount()} reference counts.')
+        removed = collect_garbage(dry_run=options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {removed['blobs']} unreferenced blobs, {removed['renditions']} of their renditions, "
+            f"{removed['orphans']} orphaned files and {removed['temporary']} temporary files "
+            f"({removed['bytes']} bytes)."))
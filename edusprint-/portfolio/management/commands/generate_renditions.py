@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from portfolio.models import PortfolioItem
+from portfolio.renditions import (
+    clear_renditions, get_config, is_image, process_pool, render, save_renditions, source_digest, source_for,
+)
+
+
+class Command(BaseCommand):
+    help = 'Create thumbnail and preview renditions for portfolio items that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every item, not just missing ones.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Items loaded per query.')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: PORTFOLIO_RENDITIONS WORKERS).')
+
+    def handle(self, *args, **options):
+        config = get_config()
+        workers = options['workers'] or config['WORKERS'] or 1
+        queryset = PortfolioItem.objects.exclude(file='').only('id', 'file', 'renditions_source')
+        if not options['all']:
+            queryset = queryset.exclude(renditions_source=F('file'))
+        rendered = skipped = failed = 0
+        last_id = 0
+        with process_pool(workers) as pool:
+            while True:
+                batch = list(queryset.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                images = []
+                for item in batch:
+                    if is_image(item.file.name):
+                        images.append(item)
+                    else:
+                        clear_renditions(item.id, item.file.name)
+                        skipped += 1
+                futures = [
+                    pool.submit(render, source_for(item), config['SIZES'], config['FORMAT'], config['QUALITY'],
+                                source_digest(item))
+                    for item in images
+                ]
+                for item, future in zip(images, futures):
+                    try:
+                        digest, renditions = future.result()
+                    except Exception as exc:
+                        self.stderr.write(f'Item {item.id} ({item.file.name}): {exc}')
+                        failed += 1
+                        continue
+                    save_renditions(item.id, item.file.name, digest, renditions, config['FORMAT'])
+                    rendered += 1
+                self.stdout.write(f'Up to item {last_id}: {rendered} rendered, {skipped} not images, {failed} failed.')
+        self.stdout.write(self.style.SUCCESS(f'Done: {rendered} rendered, {skipped} not images, {failed} failed.'))
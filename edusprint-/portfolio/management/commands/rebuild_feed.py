@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.feed import rebuild
+from portfolio.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = 'Recompute the public portfolio feed, e.g. after changing PORTFOLIO_FEED.'
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Feed rebuilt with {FeedEntry.objects.count()} items.'))
@@ -0,0 +1,180 @@
+"""Access-controlled serving of portfolio files.
+
+serve() answers a GET for a stored file after the caller has checked
+access. It handles conditional requests (ETag / If-None-Match and
+Last-Modified / If-Modified-Since) and single byte ranges, so a video
+player can seek without the worker reading the whole file.
+
+The bytes themselves are sent by whichever is cheapest:
+
+* OFFLOAD = 'x-accel-redirect': an empty response whose X-Accel-Redirect
+  header points nginx at an internal location serving MEDIA_ROOT, e.g.::
+
+      location /protected-media/ { internal; alias /srv/edusprint/media/; }
+
+* OFFLOAD = 'x-sendfile': the file's path in an X-Sendfile header, for
+  Apache's mod_xsendfile and lighttpd.
+
+* Otherwise a FileResponse. Under a WSGI server with wsgi.file_wrapper
+  (gunicorn, uWSGI) it is sent with sendfile(2) from the requested offset,
+  never passing through Python.
+
+The front server handles Range itself when offloading. Blob files are
+named by their SHA-256, which then doubles as a strong ETag.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+DEFAULTS = {
+    # '', 'x-accel-redirect' or 'x-sendfile'.
+    'OFFLOAD': '',
+    # The nginx internal location that maps onto MEDIA_ROOT.
+    'ACCEL_REDIRECT_PREFIX': '/protected-media/',
+    # Seconds browsers may reuse a file without revalidating; responses are
+    # always private since access depends on the user.
+    'MAX_AGE': 3600,
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_config():
+    """Return the PORTFOLIO_MEDIA setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'PORTFOLIO_MEDIA', {}))
+    return config
+
+
+class FileRange:
+    """A file positioned at ``start`` that reads at most ``length`` bytes.
+
+    Exposes fileno() so wsgi.file_wrapper can still use sendfile(2); the
+    server sends Content-Length bytes from the current offset.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """The (start, end) of a single byte range, end inclusive.
+
+    Returns None when the whole file should be sent (no header, a malformed
+    one, or several ranges) and raises ValueError if the range is
+    unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last ``last`` bytes.
+        suffix = int(last)
+        if not suffix:
+            raise ValueError(header)
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def etag_for(storage, name, stat):
+    digest = getattr(storage, 'digest', lambda name: None)(name)
+    if digest:
+        return f'"{digest}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def range_applies(request, etag, last_modified):
+    """False if an If-Range precondition says the client's copy is stale."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Only strong validators count.
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve(request, storage, name, download_name=None, as_attachment=False):
+    """Respond with a stored file, honouring conditional and Range requests."""
+    config = get_config()
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = etag_for(storage, name, stat)
+    last_modified = int(stat.st_mtime)
+    download_name = download_name or os.path.basename(name)
+
+    def add_validators(response):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        response.headers['Cache-Control'] = f"private, max-age={config['MAX_AGE']}"
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        # 304 Not Modified or 412 Precondition Failed.
+        return add_validators(conditional)
+
+    content_type = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    offload = config['OFFLOAD']
+    if offload:
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = quote(config['ACCEL_REDIRECT_PREFIX'].rstrip('/') + '/' + name)
+        elif offload == 'x-sendfile':
+            response.headers['X-Sendfile'] = path
+        else:
+            raise ValueError(f"Unknown PORTFOLIO_MEDIA OFFLOAD {offload!r}")
+        if as_attachment:
+            response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        return add_validators(response)
+
+    size = stat.st_size
+    byte_range = None
+    if range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return add_validators(response)
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        response = FileResponse(
+            FileRange(open(path, 'rb'), start, length), content_type=content_type,
+            as_attachment=as_attachment, filename=download_name,
+        )
+    response.headers['Content-Length'] = str(length)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return add_validators(response)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolioitem',
+            name='preview',
+            field=models.ImageField(blank=True, editable=False, upload_to='portfolio/'),
+        ),
+        migrations.AddField(
+            model_name='portfolioitem',
+            name='renditions_source',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='portfolioitem',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='portfolio/'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_content_addressed_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='portfolioitem',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='portfolio_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:41
+
+import math
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# The scoring as of this migration, written out here rather than imported
+# from portfolio.feed so that later changes there cannot break replaying it.
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+FEED_DEFAULTS = {'RECENCY_HOURS': 12, 'VIEW_WEIGHT': 1.0, 'FEATURED_BOOST': 2.0}
+
+
+def build_feed(apps, schema_editor):
+    PortfolioItem = apps.get_model('portfolio', 'PortfolioItem')
+    FeedEntry = apps.get_model('portfolio', 'FeedEntry')
+    using = schema_editor.connection.alias
+    config = {**FEED_DEFAULTS, **getattr(settings, 'PORTFOLIO_FEED', {})}
+    now = timezone.now()
+    rows = PortfolioItem.objects.using(using).filter(status='approved').order_by('id').values_list(
+        'id', 'is_featured', 'views_count', 'created_at').iterator()
+    entries = (
+        FeedEntry(
+            item_id=item_id,
+            score=(created_at - EPOCH).total_seconds() / (config['RECENCY_HOURS'] * 3600)
+            + config['VIEW_WEIGHT'] * math.log10(1 + views_count)
+            + (config['FEATURED_BOOST'] if is_featured else 0.0),
+            updated_at=now,
+        )
+        for item_id, is_featured, views_count, created_at in rows
+    )
+    while batch := list(islice(entries, 1000)):
+        FeedEntry.objects.using(using).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0007_item_listing_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_entry', serialize=False, to='portfolio.portfolioitem')),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Feed entries',
+                'indexes': [models.Index(fields=['-score', '-item'], name='feed_score_idx')],
+            },
+        ),
+        migrations.RunPython(build_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:43
+
+from itertools import groupby, islice
+
+from django.db import OperationalError, migrations
+
+# The table and its first contents as of this migration, written out here
+# rather than imported from portfolio.search so that later changes there
+# cannot break replaying it.
+TABLE = 'portfolio_portfolioitem_fts'
+
+
+def index_rows(items, comments):
+    """[id, title, description, comments, author] per item; both querysets are read once, in item order."""
+    by_item = groupby(
+        comments.order_by('portfolio_item_id', 'id').values_list('portfolio_item_id', 'content').iterator(),
+        key=lambda row: row[0])
+    pending = next(by_item, None)
+    for item_id, title, description, username in items.order_by('id').values_list(
+            'id', 'title', 'description', 'user__username').iterator():
+        while pending is not None and pending[0] < item_id:
+            pending = next(by_item, None)
+        texts = []
+        if pending is not None and pending[0] == item_id:
+            texts = [content for _, content in pending[1]]
+            pending = next(by_item, None)
+        yield [item_id, title, description, '\n'.join(texts), username]
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    # Databases without FTS5 get no table; search then falls back to LIKE.
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+                f"USING fts5(title, description, comments, author, tokenize='unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5.
+            return
+        PortfolioItem = apps.get_model('portfolio', 'PortfolioItem')
+        Comment = apps.get_model('portfolio', 'Comment')
+        rows = index_rows(
+            PortfolioItem.objects.using(connection.alias),
+            Comment.objects.using(connection.alias).filter(is_approved=True))
+        while batch := list(islice(rows, 1000)):
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, title, description, comments, author) VALUES (%s, %s, %s, %s, %s)',
+                batch)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_feed_entries'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
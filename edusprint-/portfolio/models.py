@@ -1,7 +1,9 @@
+import uuid
 from typing import ClassVar
 from django.db import models
 from django.db.models.manager import Manager
 from users.models import CustomUser
+from .storage import portfolio_storage
 
 class Category(models.Model):
     objects: ClassVar[Manager]
@@ -29,22 +31,141 @@ class PortfolioItem(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
-    file = models.FileField(upload_to='portfolio/')
+    # Stored once per distinct content and shared between items; see
+    # portfolio.storage and portfolio.blobs.
+    file = models.FileField(upload_to='portfolio/', storage=portfolio_storage)
+    # Downscaled copies of image files, made in the background; see
+    # portfolio.renditions.
+    thumbnail = models.ImageField(upload_to='portfolio/', blank=True, editable=False)
+    preview = models.ImageField(upload_to='portfolio/', blank=True, editable=False)
+    # The file name the renditions were made from.
+    renditions_source = models.CharField(max_length=255, blank=True, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     is_featured = models.BooleanField(default=False)
     views_count = models.PositiveIntegerField(default=0)
+    # Estimated distinct viewers, from the HyperLogLog sketch below, which
+    # covers all time; per-day sketches are kept in ViewerSketch.
+    unique_viewers = models.PositiveIntegerField(default=0)
+    viewers_sketch = models.BinaryField(default=b'', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # The owner's listing, paged on (-created_at, id).
+            models.Index(fields=['user', '-created_at', 'id'], name='portfolio_user_created_idx'),
+            # Public search restricts its matches to approved items.
+            models.Index(fields=['status'], name='portfolio_status_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
     def increment_views(self):
-        self.views_count += 1
-        self.save(update_fields=['views_count'])
+        """Count a view; buffered and flushed later, see portfolio.counters."""
+        from .counters import record_view
+        record_view(self.pk)
+
+class FeedEntry(models.Model):
+    """An approved item's place in the public feed; see portfolio.feed."""
+    objects: ClassVar[Manager]
+    item = models.OneToOneField(PortfolioItem, on_delete=models.CASCADE, primary_key=True, related_name='feed_entry')
+    score = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "Feed entries"
+        indexes = [
+            models.Index(fields=['-score', '-item'], name='feed_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} ({self.score:.3f})"
+
+class ViewerSketch(models.Model):
+    """HyperLogLog sketch of the users who viewed an item on one day.
+
+    Sketches merge, so unique viewers over any range of days are estimated
+    by merging that range's rows; see portfolio.hll.
+    """
+    objects: ClassVar[Manager]
+    item = models.ForeignKey(PortfolioItem, on_delete=models.CASCADE, related_name='viewer_sketches')
+    day = models.DateField()
+    sketch = models.BinaryField()
+    unique_viewers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'day'], name='viewer_sketch_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.item} on {self.day}: ~{self.unique_viewers} viewers"
+
+class Blob(models.Model):
+    """A file in content-addressed storage and how many items use it.
+
+    ``ref_count`` is kept up to date by signals (see portfolio.blobs);
+    blobs left unreferenced for a while are removed by collect_blobs.
+    """
+    objects: ClassVar[Manager]
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time a reference was added or dropped; unreferenced blobs are
+    # only collected once this is older than the grace period.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='blob_refcount_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+class UploadSession(models.Model):
+    """A chunked, resumable upload of a portfolio file; see portfolio.uploads.
+
+    The bytes received so far live in a temporary file until the upload is
+    finalized into a PortfolioItem.
+    """
+    objects: ClassVar[Manager]
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    # Bytes received so far, i.e. the offset the next chunk must start at.
+    received = models.PositiveBigIntegerField(default=0)
+    # Expected SHA-256 of the whole file, hex; checked on finalize if given.
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=UPLOADING)
+    # Set when the declared sha256 matched a stored file, in which case no
+    # bytes are uploaded and the item reuses that file.
+    blob = models.ForeignKey(Blob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    item = models.OneToOneField(
+        PortfolioItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='upload_status_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes)"
 
 class Comment(models.Model):
     objects: ClassVar[Manager]
@@ -0,0 +1,14 @@
+from edusprint.pagination import KeysetPagination
+
+
+class PortfolioCursorPagination(KeysetPagination):
+    """Pages portfolio items newest first, ties broken by id."""
+    ordering = ('-created_at', 'id')
+    page_size = 50
+
+
+class FeedPagination(KeysetPagination):
+    """Pages feed entries by descending score; see portfolio.feed."""
+    ordering = ('-score', '-item_id')
+    page_size = 20
+    max_page_size = 100
@@ -0,0 +1,260 @@
+"""Thumbnail and preview renditions of portfolio images.
+
+When an item is saved with a new image, rendering is scheduled on a process
+pool once the transaction commits, so neither the request nor the GIL pays
+for decoding and resizing. The pool's workers are started with forkserver
+(spawn where that is unavailable) rather than forked from the web process,
+whose other threads may hold locks at the time, and results are saved by
+a single background thread. Each rendition is stored under portfolio/ with
+a name derived from the original's SHA-256 (``<hash>.thumbnail.jpg``),
+so identical uploads share renditions and the URLs can be cached forever.
+The item is only updated if its file is still the one that was rendered.
+
+Items saved before this existed are handled by the generate_renditions
+command.
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Set to False to only render through the generate_renditions command.
+    'ENABLED': True,
+    # Rendition name -> (max width, max height); the aspect ratio is kept.
+    'SIZES': {
+        'thumbnail': (200, 200),
+        'preview': (1024, 1024),
+    },
+    'FORMAT': 'JPEG',
+    'QUALITY': 82,
+    # Worker processes; 0 renders in the calling thread.
+    'WORKERS': 2,
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+# What rendition_name() makes; group 1 is the start of the original's SHA-256.
+RENDITION_RE = re.compile(r'^portfolio/([0-9a-f]{32})\.[a-z]+\.[a-z0-9]+$')
+
+
+def get_config():
+    """Return the PORTFOLIO_RENDITIONS setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'PORTFOLIO_RENDITIONS', {}))
+    return config
+
+
+def is_image(name):
+    return bool(name) and name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def file_sha256(source):
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as handle:
+            for block in iter(lambda: handle.read(64 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def render(source, sizes, fmt='JPEG', quality=82, digest=None):
+    """Render an image into each size; returns (SHA-256 of the source, {name: encoded bytes}).
+
+    ``source`` is a file path or the image bytes. A path is handed to
+    Pillow, which only reads what it decodes, and large JPEGs are decoded
+    at a reduced scale, so memory follows the rendition sizes rather than
+    the file size. ``digest`` is the source's SHA-256 if already known
+    (blob names carry it); otherwise the file is hashed in blocks. Runs in
+    a worker process, so it only takes and returns picklable values.
+    """
+    from PIL import Image, ImageOps
+    digest = digest or file_sha256(source)
+    renditions = {}
+    largest = max(max(size) for size in sizes.values())
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with Image.open(source) as original:
+        original.seek(0)  # First frame of animated images.
+        # Decode JPEGs at the smallest scale that still covers every size,
+        # whichever way EXIF turns the image.
+        original.draft(None, (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if fmt == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGBA').convert('RGB') if image.mode == 'P' else image.convert('RGB')
+        for name, size in sizes.items():
+            rendition = image.copy()
+            rendition.thumbnail(size, Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            rendition.save(output, fmt, quality=quality, optimize=True)
+            renditions[name] = output.getvalue()
+    return digest, renditions
+
+
+def rendition_name(digest, rendition, fmt):
+    return f'portfolio/{digest[:32]}.{rendition}.{EXTENSIONS.get(fmt, fmt.lower())}'
+
+
+def rendition_names(storage):
+    """Every rendition name in ``storage``."""
+    try:
+        _, filenames = storage.listdir('portfolio')
+    except FileNotFoundError:
+        return
+    for filename in sorted(filenames):
+        if RENDITION_RE.match(f'portfolio/{filename}'):
+            yield f'portfolio/{filename}'
+
+
+def touch(storage, name):
+    """Mark a stored rendition as just used; returns False if it does not exist.
+
+    collect_blobs leaves recently touched renditions alone, so one that is
+    being reused for a new item is not removed underneath it.
+    """
+    try:
+        os.utime(storage.path(name))
+    except NotImplementedError:
+        return storage.exists(name)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def source_for(item):
+    """What render() should read: a local path when the storage has one, else the bytes."""
+    try:
+        return item.file.path
+    except NotImplementedError:
+        with item.file.open('rb') as handle:
+            return handle.read()
+
+
+def source_digest(item):
+    """The SHA-256 in the item's content-addressed file name, or None for other names."""
+    return getattr(item.file.storage, 'digest', lambda name: None)(item.file.name)
+
+
+def save_renditions(item_id, source_name, digest, renditions, fmt):
+    """Store rendered files and point the item at them, unless its file changed meanwhile."""
+    from .models import PortfolioItem
+    # Renditions are named by content already; they live in the default
+    # storage, not in the blob store with the originals.
+    storage = PortfolioItem._meta.get_field('thumbnail').storage
+    names = {}
+    for rendition, data in renditions.items():
+        name = rendition_name(digest, rendition, fmt)
+        if not touch(storage, name):
+            name = storage.save(name, ContentFile(data))
+        names[rendition] = name
+    # A queryset update, so saving renditions does not fire signals;
+    # updated_at is bumped for listings' ETags.
+    return PortfolioItem.objects.filter(id=item_id, file=source_name).update(
+        thumbnail=names.get('thumbnail', ''), preview=names.get('preview', ''), renditions_source=source_name,
+        updated_at=timezone.now())
+
+
+def clear_renditions(item_id, source_name):
+    from .models import PortfolioItem
+    return PortfolioItem.objects.filter(id=item_id, file=source_name).update(
+        thumbnail='', preview='', renditions_source=source_name, updated_at=timezone.now())
+
+
+def render_item(item, config=None):
+    """Render and save an item's renditions in the calling thread; returns True if saved."""
+    config = config or get_config()
+    name = item.file.name
+    if not is_image(name):
+        return bool(clear_renditions(item.id, name))
+    try:
+        digest, renditions = render(
+            source_for(item), config['SIZES'], config['FORMAT'], config['QUALITY'], source_digest(item))
+    except Exception:
+        logger.exception('Could not render portfolio item %s (%s)', item.id, name)
+        return False
+    return bool(save_renditions(item.id, name, digest, renditions, config['FORMAT']))
+
+
+def process_pool(workers):
+    """A process pool whose workers do not inherit the calling process's threads."""
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+_executor = None
+_saver = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = process_pool(workers)
+        return _executor
+
+
+def get_saver():
+    """The thread that stores rendered files, so the pool's own threads never touch the database."""
+    global _saver
+    with _executor_lock:
+        if _saver is None:
+            _saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='portfolio-renditions')
+        return _saver
+
+
+def save_result(future, item_id, source_name, fmt):
+    """Save a finished render; runs on the saver thread."""
+    close_old_connections()
+    try:
+        digest, renditions = future.result()
+        save_renditions(item_id, source_name, digest, renditions, fmt)
+    except Exception:
+        logger.exception('Could not render portfolio item %s (%s)', item_id, source_name)
+    finally:
+        # This thread lives for the whole process, so release the
+        # connection the same way Django does at the end of a request.
+        close_old_connections()
+
+
+def schedule(item):
+    """Render an item's renditions in the background."""
+    config = get_config()
+    if config['WORKERS'] <= 0:
+        render_item(item, config)
+        return
+    name = item.file.name
+    if not is_image(name):
+        clear_renditions(item.id, name)
+        return
+    future = get_executor(config['WORKERS']).submit(
+        render, source_for(item), config['SIZES'], config['FORMAT'], config['QUALITY'], source_digest(item))
+    # Done callbacks run on the pool's management thread; hand the save off.
+    future.add_done_callback(
+        lambda future: get_saver().submit(save_result, future, item.id, name, config['FORMAT']))
+
+
+def needs_renditions(item):
+    return bool(item.file) and item.file.name != item.renditions_source
+
+
+# Signal receiver, connected in PortfolioConfig.ready().
+
+def item_saved(sender, instance, **kwargs):
+    if get_config()['ENABLED'] and needs_renditions(instance):
+        transaction.on_commit(lambda: schedule(instance))
@@ -0,0 +1,136 @@
+"""Full-text search over portfolio items and their approved comments.
+
+On SQLite with FTS5, every item is indexed with its title, description,
+approved comments and author's username, and results are ranked with bm25,
+titles weighing most. The signal receivers below keep the index in step
+with items, comments and usernames. The public search only returns
+approved items, by their status; the admin searches everything through
+the same index.
+Elsewhere, search falls back to LIKE queries ranked by which fields
+matched.
+"""
+from itertools import groupby
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+
+from edusprint.fts import FullTextIndex
+from .models import Comment, PortfolioItem
+
+portfolio_index = FullTextIndex(
+    'portfolio_portfolioitem_fts', ['title', 'description', 'comments', 'author'], weights=[10.0, 3.0, 1.0, 5.0])
+
+ITEM_FIELDS = ('id', 'title', 'description', 'user__username')
+
+
+def document(title, description, comments, username):
+    """The indexed column values, in index column order."""
+    return [title, description, '\n'.join(comments), username]
+
+
+def index_rows(items, comments):
+    """(rowid, *values) for every item in ``items``.
+
+    ``comments`` are the approved comments to include; both querysets are
+    read once, in item order, so memory does not grow with the table.
+    """
+    by_item = groupby(
+        comments.order_by('portfolio_item_id', 'id').values_list('portfolio_item_id', 'content').iterator(),
+        key=lambda row: row[0])
+    pending = next(by_item, None)
+    for item_id, title, description, username in items.order_by('id').values_list(*ITEM_FIELDS).iterator():
+        while pending is not None and pending[0] < item_id:
+            pending = next(by_item, None)
+        texts = []
+        if pending is not None and pending[0] == item_id:
+            texts = [content for _, content in pending[1]]
+            pending = next(by_item, None)
+        yield [item_id, *document(title, description, texts, username)]
+
+
+def index_items(item_ids, using=DEFAULT_DB_ALIAS):
+    """Reindex the given items from the database; ids that no longer exist are removed."""
+    if not portfolio_index.is_available(using):
+        return
+    item_ids = set(item_ids)
+    items = PortfolioItem.objects.using(using).filter(id__in=item_ids)
+    comments = Comment.objects.using(using).filter(portfolio_item_id__in=item_ids, is_approved=True)
+    for item_id, *values in index_rows(items, comments):
+        portfolio_index.index(item_id, values, using)
+        item_ids.discard(item_id)
+    for item_id in item_ids:
+        portfolio_index.remove(item_id, using)
+
+
+def index_item(item, using=DEFAULT_DB_ALIAS):
+    if not portfolio_index.is_available(using):
+        return
+    comments = Comment.objects.using(using).filter(portfolio_item=item, is_approved=True).order_by('id')
+    values = document(item.title, item.description, comments.values_list('content', flat=True), item.user.username)
+    portfolio_index.index(item.id, values, using)
+
+
+def approved_items_sql():
+    # Read from portfolio_status_idx, which covers the id as well.
+    return f"SELECT id FROM {PortfolioItem._meta.db_table} WHERE status = %s", ['approved']
+
+
+def search_items(text, limit, offset=0):
+    """Return the approved items best matching ``text``, most relevant first."""
+    if portfolio_index.is_available():
+        ids = portfolio_index.search(text, limit, offset, restrict=approved_items_sql())
+        items = PortfolioItem.objects.select_related('user', 'category').defer('viewers_sketch').in_bulk(ids)
+        return [items[item_id] for item_id in ids if item_id in items]
+    words = text.split()
+    if not words:
+        return []
+    queryset = PortfolioItem.objects.filter(status='approved').select_related('user', 'category')
+    score = Value(0)
+    for word in words:
+        in_comments = Exists(Comment.objects.filter(
+            portfolio_item=OuterRef('pk'), is_approved=True, content__icontains=word))
+        queryset = queryset.filter(
+            Q(title__icontains=word) | Q(description__icontains=word) | Q(user__username__icontains=word)
+            | in_comments)
+        score = score + Case(When(title__icontains=word, then=Value(10)), default=Value(0)) \
+            + Case(When(user__username__icontains=word, then=Value(5)), default=Value(0)) \
+            + Case(When(description__icontains=word, then=Value(3)), default=Value(0)) \
+            + Case(When(in_comments, then=Value(1)), default=Value(0))
+    queryset = queryset.annotate(score=score).order_by('-score', 'id')
+    return list(queryset[offset:offset + limit])
+
+
+# Signal receivers, connected in PortfolioConfig.ready().
+
+def item_saved(sender, instance, using=DEFAULT_DB_ALIAS, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    # Saves that cannot change the indexed text (e.g. view counts) are skipped.
+    if update_fields is not None and not set(update_fields) & {'title', 'description', 'user'}:
+        return
+    index_item(instance, using)
+
+
+def item_deleted(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    portfolio_index.remove(instance.id, using)
+
+
+def comment_changed(sender, instance, using=DEFAULT_DB_ALIAS, raw=False, **kwargs):
+    if raw:
+        return
+    index_items([instance.portfolio_item_id], using)
+
+
+def comments_changed(sender, item_ids, **kwargs):
+    index_items(item_ids)
+
+
+def user_saved(sender, instance, using=DEFAULT_DB_ALIAS, update_fields=None, created=False, **kwargs):
+    # Logins save last_login only; skip saves that cannot change the username.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    if not portfolio_index.is_available(using):
+        return
+    item_ids = list(PortfolioItem.objects.using(using).filter(user=instance).values_list('id', flat=True))
+    for start in range(0, len(item_ids), 500):
+        index_items(item_ids[start:start + 500], using)
@@ -1,8 +1,92 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import PortfolioItem
+from .counters import get_unique_viewers, get_views
+from .models import PortfolioItem, UploadSession
+
+class ProtectedFileField(serializers.FileField):
+    """A file rendered as its URL under PortfolioFileView, which checks access, instead of under MEDIA_URL."""
+
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = reverse('portfolio-file', args=[value.instance.pk])
+        if self.rendition:
+            url += f'?rendition={self.rendition}'
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
 
 class PortfolioItemSerializer(serializers.ModelSerializer):
+    """Pass ``fields`` to render only some fields (``id`` is always kept)."""
+    file = ProtectedFileField(max_length=PortfolioItem._meta.get_field('file').max_length)
+    thumbnail = ProtectedFileField(rendition='thumbnail', read_only=True)
+    preview = ProtectedFileField(rendition='preview', read_only=True)
+    # Includes views counted but not yet flushed to the database.
+    views_count = serializers.SerializerMethodField()
+    unique_viewers = serializers.SerializerMethodField()
+
+    # Model fields the method fields above read.
+    METHOD_FIELD_SOURCES = {
+        'views_count': ['views_count'],
+        'unique_viewers': ['unique_viewers'],
+    }
+
+    class Meta:
+        model = PortfolioItem
+        exclude = ['viewers_sketch', 'renditions_source']
+        read_only_fields = ['user', 'status', 'is_featured', 'created_at', 'thumbnail', 'preview']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - {'id'}:
+                self.fields.pop(name)
+
+    @classmethod
+    def model_fields(cls, fields):
+        """The model fields needed to render ``fields``, for QuerySet.only()."""
+        needed = {'id'}
+        for name in fields:
+            needed.update(cls.METHOD_FIELD_SOURCES.get(name, [name]))
+        return needed
+
+    def get_views_count(self, obj):
+        return get_views(obj)
+
+    def get_unique_viewers(self, obj):
+        return get_unique_viewers(obj)
+
+class FeedItemSerializer(serializers.ModelSerializer):
+    """An item as shown in the public feed."""
+    author = serializers.CharField(source='user.username', read_only=True)
+    category = serializers.StringRelatedField()
+    thumbnail = ProtectedFileField(rendition='thumbnail', read_only=True)
+    preview = ProtectedFileField(rendition='preview', read_only=True)
+    views_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PortfolioItem
+        fields = ['id', 'title', 'description', 'author', 'category', 'thumbnail', 'preview', 'is_featured',
+                  'views_count', 'created_at']
+        read_only_fields = fields
+
+    def get_views_count(self, obj):
+        return get_views(obj)
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'size', 'received', 'sha256', 'status', 'item', 'expires_at']
+        read_only_fields = fields
+
+class UploadFinalizeSerializer(serializers.ModelSerializer):
+    """The PortfolioItem fields given when an upload is finalized.
+
+    The status is not among them: finalized items always go to review.
+    """
     class Meta:
         model = PortfolioItem
-        fields = '__all__'
-        read_only_fields = ['user', 'created_at']
+        fields = ['title', 'description', 'category']
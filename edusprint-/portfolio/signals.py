@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Sent with ``item_ids`` after PortfolioItem rows were changed by queryset
+# updates (admin actions, view count flushes), which send no post_save.
+items_changed = Signal()
+
+# Sent with ``item_ids`` after comments on those items were changed by
+# queryset updates (e.g. bulk approval in the admin).
+comments_changed = Signal()
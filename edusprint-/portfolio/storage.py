@@ -0,0 +1,128 @@
+"""Content-addressed storage for portfolio files.
+
+ContentAddressedStorage hashes a file with SHA-256 while streaming it to a
+temporary file, then moves it to a name derived from the digest::
+
+    portfolio/blobs/3f/3fa9...e1.pdf
+
+If that name already exists the new copy is dropped, so each distinct file
+is stored once however many items use it. The extension is kept so that
+content types and image detection still work from the name.
+
+Names handed out by this storage are shared between items, so deleting an
+item must not delete its file; portfolio.blobs counts the references and
+its collect_blobs command removes files nobody uses any more.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible(path='portfolio.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """A FileSystemStorage that names files by the SHA-256 of their content."""
+
+    def __init__(self, prefix='portfolio/blobs', **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix.strip('/')
+        self.name_re = re.compile(rf'^{re.escape(self.prefix)}/[0-9a-f]{{2}}/([0-9a-f]{{64}})(\.[a-z0-9]+)?$')
+
+    def blob_name(self, digest, original_name=''):
+        extension = os.path.splitext(original_name)[1].lower()
+        if not re.fullmatch(r'\.[a-z0-9]{1,10}', extension):
+            extension = ''
+        return f'{self.prefix}/{digest[:2]}/{digest}{extension}'
+
+    def digest(self, name):
+        """The SHA-256 a blob name was made from, or None for names this storage did not make."""
+        match = self.name_re.match(name or '')
+        return match.group(1) if match else None
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content has been hashed.
+        return name
+
+    def _save(self, name, content):
+        temp_dir = self.path(f'{self.prefix}/tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                if hasattr(content, 'seek') and getattr(content, 'seekable', lambda: True)():
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    digest.update(chunk)
+                    handle.write(chunk)
+            name = self.blob_name(digest.hexdigest(), name)
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.touch(name):
+                os.remove(temp_path)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                # Atomic, so readers never see a partly written blob and two
+                # uploads of the same content end up with the same file.
+                os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    def touch(self, name):
+        """Mark a blob as just used; returns False if it does not exist.
+
+        collect_blobs leaves files with a recent modification time alone, so
+        a blob that is being reused is never removed underneath its new user.
+        """
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete_if_unused_since(self, name, cutoff):
+        """Delete a blob unless it was touched at or after ``cutoff`` (a timestamp); returns True if deleted."""
+        return delete_if_unused_since(self.path(name), cutoff)
+
+    def blob_names(self):
+        """Every blob name on disk."""
+        root = self.path(self.prefix)
+        if not os.path.isdir(root):
+            return
+        for shard in sorted(os.listdir(root)):
+            if not re.fullmatch(r'[0-9a-f]{2}', shard):
+                continue
+            for filename in sorted(os.listdir(os.path.join(root, shard))):
+                name = f'{self.prefix}/{shard}/{filename}'
+                if self.digest(name):
+                    yield name
+
+
+def delete_if_unused_since(path, cutoff):
+    """Delete the file at ``path`` unless it was touched at or after ``cutoff``; returns True if deleted."""
+    trash = f'{path}.deleting'
+    # Move it out of the way first: a writer of the same content that
+    # comes in now finds no file and writes its own copy.
+    try:
+        os.replace(path, trash)
+    except FileNotFoundError:
+        return False
+    if os.path.getmtime(trash) >= cutoff:
+        os.replace(trash, path)
+        return False
+    os.remove(trash)
+    return True
+
+
+def portfolio_storage():
+    """The storage PortfolioItem.file uses, configured as STORAGES['portfolio']."""
+    return storages['portfolio']
@@ -1,3 +1,847 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.admin.sites import AdminSite
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users.models import CustomUser
+from .blobs import collect_garbage, recount
+from .counters import ViewCounter, get_config as get_counter_config, get_counter, get_unique_viewers
+from .hll import HyperLogLog
+from .admin import CommentAdmin, PortfolioItemAdmin
+from .models import Blob, Comment, FeedEntry, PortfolioItem, UploadSession, ViewerSketch
+from .pagination import PortfolioCursorPagination
+from .renditions import process_pool, render_item, save_renditions, source_digest
+from .search import portfolio_index
+from .serializers import FeedItemSerializer, PortfolioItemSerializer
+from .uploads import append_chunk, cleanup_expired, temp_path
+from .views import (
+    PortfolioFeedView, PortfolioFileView, PortfolioListCreateView, PortfolioSearchView, PortfolioViewCountView, UploadChunkView, UploadFinalizeView, UploadSessionCreateView, UploadSessionDetailView,
+)
+
+
+class TempMediaMixin:
+    """Stores files under a temporary MEDIA_ROOT, inside ``self.tmp``, for each test."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=os.path.join(self.tmp, 'media')))
+
+
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='artist')
+        cls.items = [
+            PortfolioItem.objects.create(user=cls.user, title=f'Item {i}', file='portfolio/item.pdf')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        # No flusher thread: it would write on its own connection, outside
+        # the test transaction. Only the explicit flushes below write.
+        self.enterContext(mock.patch.object(ViewCounter, 'start'))
+        self.counter = ViewCounter(flush_interval=3600, max_pending=10 ** 6)
+
+    def tearDown(self):
+        self.counter.stop()
+
+    def views(self, item):
+        item.refresh_from_db()
+        return item.views_count
+
+    def test_concurrent_views_are_not_lost(self):
+        item = self.items[0]
+
+        def view_many():
+            for _ in range(500):
+                self.counter.increment(item.id)
+
+        threads = [threading.Thread(target=view_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.counter.pending_for([item.id]), {item.id: 4000})
+        self.assertEqual(self.counter.flush(), 4000)
+        self.assertEqual(self.views(item), 4000)
+        self.assertEqual(self.counter.pending_for([item.id]), {})
+
+    def test_one_update_per_distinct_increment(self):
+        for item, count in zip(self.items, (2, 2, 5)):
+            self.counter.increment(item.id, count)
+        # SAVEPOINT, two UPDATEs, RELEASE; then the feed reads the items'
+        # scores and drops entries of unapproved ones.
+        with self.assertNumQueries(6):
+            self.counter.flush()
+        self.assertEqual([self.views(item) for item in self.items], [2, 2, 5])
+
+    def test_failed_flush_keeps_pending_views(self):
+        item = self.items[1]
+        self.counter.increment(item.id, 3)
+        with mock.patch('django.db.models.QuerySet.update', side_effect=RuntimeError('locked')), \
+                self.assertLogs('portfolio.counters'):
+            self.assertEqual(self.counter.flush(), 0)
+        self.assertEqual(self.counter.pending_for([item.id]), {item.id: 3})
+        self.counter.flush()
+        self.assertEqual(self.views(item), 3)
+
+    def test_unique_viewers(self):
+        item = self.items[2]
+        for viewer in range(300):
+            for _ in range(3):
+                self.counter.increment(item.id, viewer=viewer)
+        with mock.patch('portfolio.counters._counter', self.counter):
+            self.assertAlmostEqual(get_unique_viewers(item), 300, delta=15)
+            self.counter.flush()
+            item.refresh_from_db()
+            self.assertEqual(item.views_count, 900)
+            self.assertAlmostEqual(item.unique_viewers, 300, delta=15)
+            self.assertEqual(ViewerSketch.objects.get(item=item).unique_viewers, item.unique_viewers)
+            # Repeat viewers do not move the estimate; new ones do.
+            for viewer in range(250, 400):
+                self.counter.increment(item.id, viewer=viewer)
+            self.counter.flush()
+            item.refresh_from_db()
+            self.assertAlmostEqual(item.unique_viewers, 400, delta=20)
+            self.assertEqual(get_unique_viewers(item, days=1), item.unique_viewers)
+
+    def test_stop_flushes_on_the_calling_thread(self):
+        flushed_on = []
+        flush = self.counter.flush
+        self.counter.flush = lambda: flushed_on.append(threading.current_thread()) or flush()
+        # The flusher thread proper; start() is patched out above.
+        self.counter._thread = threading.Thread(target=self.counter._run)
+        self.counter._thread.start()
+        self.counter.increment(self.items[0].id, 2)
+        self.counter.stop()
+        self.assertFalse(self.counter._thread.is_alive())
+        self.assertEqual(flushed_on, [threading.current_thread()])
+        self.assertEqual(self.views(self.items[0]), 2)
+
+    def test_tests_count_views_synchronously(self):
+        # Set by edusprint.test_runner.TestRunner.
+        self.assertFalse(get_counter_config()['ENABLED'])
+
+
+class HyperLogLogTests(TestCase):
+    def test_estimates_within_a_few_percent(self):
+        for cardinality in (10, 1000, 50000):
+            sketch = HyperLogLog()
+            for value in range(cardinality):
+                sketch.add(f'user-{value}')
+            self.assertAlmostEqual(sketch.count(), cardinality, delta=max(2, cardinality * 0.05))
+
+    def test_merge_and_serialization(self):
+        monday, tuesday = HyperLogLog(), HyperLogLog()
+        for value in range(3000):
+            monday.add(value)
+        for value in range(2000, 5000):
+            tuesday.add(value)
+        data = monday.to_bytes()
+        self.assertLess(len(data), 4200)
+        merged = HyperLogLog.from_bytes(data).merge(tuesday)
+        self.assertAlmostEqual(merged.count(), 5000, delta=250)
+        self.assertLess(len(HyperLogLog().to_bytes()), 100)
+        with self.assertRaises(ValueError):
+            merged.merge(HyperLogLog(precision=10))
+
+
+@override_settings(PORTFOLIO_VIEW_COUNTER={'ENABLED': True, 'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 10 ** 6})
+class PortfolioViewCountViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(username='owner')
+        cls.visitor = CustomUser.objects.create(username='visitor')
+        cls.item = PortfolioItem.objects.create(
+            user=cls.owner, title='Approved', file='portfolio/a.pdf', status='approved', views_count=10)
+        cls.draft = PortfolioItem.objects.create(user=cls.owner, title='Draft', file='portfolio/b.pdf')
+
+    def tearDown(self):
+        get_counter().discard([self.item.id, self.draft.id])
+
+    def call(self, method, item, user):
+        request = getattr(APIRequestFactory(), method)(f'/api/portfolio/{item.id}/views/')
+        force_authenticate(request, user=user)
+        return PortfolioViewCountView.as_view()(request, pk=item.id)
+
+    def test_counts_include_unflushed_views(self):
+        for _ in range(3):
+            self.assertEqual(self.call('post', self.item, self.visitor).status_code, 202)
+        self.call('post', self.item, self.owner)
+        response = self.call('get', self.item, self.visitor)
+        self.assertEqual(response.data, {'id': self.item.id, 'views_count': 14, 'unique_viewers': 2})
+        self.assertEqual(PortfolioItem.objects.get(id=self.item.id).views_count, 10)
+
+    def test_drafts_are_visible_to_their_owner_only(self):
+        self.assertEqual(self.call('get', self.draft, self.visitor).status_code, 404)
+        self.assertEqual(self.call('get', self.draft, self.owner).status_code, 200)
+
+
+class PortfolioListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='student')
+        other = CustomUser.objects.create(username='someone-else')
+        PortfolioItem.objects.create(user=other, title='Not mine', file='portfolio/x.pdf')
+        now = timezone.now()
+        for n in range(5):
+            item = PortfolioItem.objects.create(
+                user=cls.user, title=f'Item {n}', description='long ' * 100, file=f'portfolio/{n}.pdf')
+            # Two items share a timestamp, so the id tiebreak matters.
+            PortfolioItem.objects.filter(id=item.id).update(created_at=now - timedelta(hours=min(n, 3)))
+
+    def get(self, query='', **headers):
+        request = APIRequestFactory().get(f'/api/portfolio/{query}', **headers)
+        force_authenticate(request, user=self.user)
+        response = PortfolioListCreateView.as_view()(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_pages_newest_first(self):
+        titles = []
+        query = '?page_size=2'
+        while query is not None:
+            response = self.get(query)
+            titles += [item['title'] for item in response.data['results']]
+            next_link = response.data['next']
+            query = next_link[next_link.index('?'):] if next_link else None
+        self.assertEqual(titles, ['Item 0', 'Item 1', 'Item 2', 'Item 3', 'Item 4'])
+
+    def test_sparse_fields(self):
+        with self.assertNumQueries(2):  # ETag aggregate, then the page.
+            response = self.get('?fields=title,views_count')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'views_count'})
+        self.assertEqual(self.get('?fields=title,password').status_code, 400)
+
+    def test_sparse_fields_load_only_those_columns(self):
+        request = APIRequestFactory().get('/api/portfolio/?fields=title')
+        force_authenticate(request, user=self.user)
+        with mock.patch.object(PortfolioCursorPagination, 'paginate_queryset', autospec=True,
+                               side_effect=PortfolioCursorPagination.paginate_queryset) as paginate:
+            PortfolioListCreateView.as_view()(request)
+        queryset = paginate.call_args.args[1]
+        self.assertEqual(queryset.query.deferred_loading, ({'id', 'title', 'created_at'}, False))
+
+    def test_unflushed_viewers(self):
+        self.enterContext(mock.patch.object(ViewCounter, 'start'))
+        counter = ViewCounter(flush_interval=3600, max_pending=10 ** 6)
+        self.addCleanup(counter.stop)
+        self.enterContext(mock.patch('portfolio.counters._counter', counter))
+        etag = self.get('?fields=unique_viewers')['ETag']
+        for item in PortfolioItem.objects.filter(user=self.user):
+            counter.increment(item.id, viewer=item.id)
+        # ETag aggregate, the page, then every pending item's sketch at once.
+        with self.assertNumQueries(3):
+            response = self.get('?fields=unique_viewers', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['unique_viewers'] for item in response.data['results']], [1] * 5)
+        etag = response['ETag']
+        counter.increment(PortfolioItem.objects.filter(user=self.user).first().id, viewer=0)
+        self.assertEqual(self.get('?fields=unique_viewers', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_conditional_get(self):
+        response = self.get('?fields=title')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.get('?fields=title', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        # Another representation has another tag.
+        self.assertNotEqual(self.get('?fields=status')['ETag'], etag)
+        PortfolioItem.objects.filter(user=self.user, title='Item 3').update(views_count=7)
+        self.assertEqual(self.get('?fields=title', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        item = PortfolioItem.objects.get(title='Item 4')
+        item.title = 'Renamed'
+        item.save()
+        etag = self.get()['ETag']
+        PortfolioItem.objects.create(user=self.user, title='New', file='portfolio/new.pdf')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(PORTFOLIO_VIEW_COUNTER={'ENABLED': False},
+                   PORTFOLIO_FEED={'RECENCY_HOURS': 12, 'VIEW_WEIGHT': 1.0, 'FEATURED_BOOST': 2.0})
+class PortfolioFeedTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='creator')
+
+    def make_item(self, title, hours_ago=0, **fields):
+        item = PortfolioItem.objects.create(user=self.user, title=title, file='portfolio/x.pdf', **fields)
+        # Backdated with a save, as if it had been created then.
+        item.created_at = timezone.now() - timedelta(hours=hours_ago)
+        item.save()
+        return item
+
+    def feed(self, query=''):
+        request = APIRequestFactory().get(f'/api/portfolio/feed/{query}')
+        return PortfolioFeedView.as_view()(request).data
+
+    def titles(self, query=''):
+        return [item['title'] for item in self.feed(query)['results']]
+
+    def admin_action(self, action, *items):
+        admin = PortfolioItemAdmin(PortfolioItem, AdminSite())
+        with mock.patch.object(admin, 'message_user'):
+            getattr(admin, action)(RequestFactory().post('/'), PortfolioItem.objects.filter(
+                id__in=[item.id for item in items]))
+
+    def test_ranking_mixes_recency_views_and_featured(self):
+        self.make_item('Draft', status='draft')
+        self.make_item('New', status='approved')
+        self.make_item('Older', hours_ago=6, status='approved')
+        self.make_item('Popular but old', hours_ago=20, status='approved', views_count=999)
+        self.make_item('Featured but old', hours_ago=20, status='approved', is_featured=True)
+        self.assertEqual(self.titles(), ['Popular but old', 'Featured but old', 'New', 'Older'])
+        page = self.feed('?page_size=2')
+        self.assertEqual(len(page['results']), 2)
+        self.assertEqual(self.titles(page['next'][page['next'].index('?'):]), ['New', 'Older'])
+
+    def test_owners_cannot_approve_or_feature_their_items(self):
+        request = APIRequestFactory().post('/api/portfolio/', {
+            'title': 'Mine', 'file': SimpleUploadedFile('work.pdf', b'work'),
+            'status': 'approved', 'is_featured': True,
+        }, format='multipart')
+        force_authenticate(request, user=self.user)
+        response = PortfolioListCreateView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        item = PortfolioItem.objects.get(id=response.data['id'])
+        self.assertEqual((item.status, item.is_featured), ('draft', False))
+        self.assertEqual(self.titles(), [])
+
+    def test_admin_actions_and_views_update_the_feed(self):
+        first = self.make_item('First', status='pending')
+        second = self.make_item('Second', hours_ago=1, status='pending')
+        self.assertEqual(self.titles(), [])
+        self.admin_action('approve_items', first, second)
+        self.assertEqual(self.titles(), ['First', 'Second'])
+        self.admin_action('feature_items', second)
+        self.assertEqual(self.titles(), ['Second', 'First'])
+        self.admin_action('unfeature_items', second)
+        for _ in range(30):
+            second.increment_views()
+        self.assertEqual(self.titles(), ['Second', 'First'])
+        self.admin_action('reset_views', second)
+        self.assertEqual(self.titles(), ['First', 'Second'])
+        self.admin_action('reject_items', first)
+        self.assertEqual(self.titles(), ['Second'])
+        second.delete()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_reads_do_not_grow_with_the_table(self):
+        for n in range(30):
+            self.make_item(f'Item {n}', hours_ago=n, status='approved')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.feed('?page_size=10')['results']), 10)
+
+
+class PortfolioSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create(username='priya', email='priya@example.com')
+        reader = CustomUser.objects.create(username='reader')
+
+        def make(title, description='', status='approved'):
+            return PortfolioItem.objects.create(
+                user=cls.author, title=title, description=description, status=status, file='portfolio/x.pdf')
+        cls.robotics = make('Robotics club project', 'A line-following robot.')
+        cls.essay = make('Scholarship essay', 'Why I want to study robotics.')
+        cls.draft = make('Robotics draft', status='draft')
+        cls.poster = make('Science fair poster')
+        Comment.objects.create(portfolio_item=cls.poster, user=reader, content='Great robotics poster!', is_approved=True)
+        Comment.objects.create(portfolio_item=cls.poster, user=reader, content='Spam about telescopes')
+
+    def search(self, params):
+        request = APIRequestFactory().get('/api/portfolio/search/', params)
+        return PortfolioSearchView.as_view()(request)
+
+    def ids(self, params):
+        response = self.search(params)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def admin_search(self, term):
+        admin = PortfolioItemAdmin(PortfolioItem, AdminSite())
+        queryset, _ = admin.get_search_results(None, PortfolioItem.objects.all(), term)
+        return set(queryset.values_list('id', flat=True))
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.ids({'q': 'robotics'}), [self.robotics.id, self.essay.id, self.poster.id])
+        self.assertEqual(self.ids({'q': 'robot line'}), [self.robotics.id])
+        self.assertEqual(self.ids({'q': 'telescopes'}), [])
+        self.assertEqual(self.ids({'q': 'priya fair'}), [self.poster.id])
+        self.assertEqual(self.search({'q': ' '}).status_code, 400)
+        page = self.search({'q': 'robotics', 'page_size': 2}).data
+        self.assertEqual(len(page['results']), 2)
+        self.assertIn('page=2', page['next'])
+
+    def test_index_follows_changes(self):
+        self.poster.title = 'Astronomy poster'
+        self.poster.save()
+        self.assertEqual(self.ids({'q': 'astronomy'}), [self.poster.id])
+        spam = Comment.objects.get(content__startswith='Spam')
+        admin = CommentAdmin(Comment, AdminSite())
+        with mock.patch.object(admin, 'message_user'):
+            admin.approve_comments(None, Comment.objects.filter(id=spam.id))
+        self.assertEqual(self.ids({'q': 'telescopes'}), [self.poster.id])
+        spam.delete()
+        self.assertEqual(self.ids({'q': 'telescopes'}), [])
+        self.author.username = 'priya_k'
+        self.author.save()
+        self.assertEqual(len(self.ids({'q': 'priya_k'})), 3)
+        self.essay.delete()
+        self.assertEqual(self.ids({'q': 'scholarship'}), [])
+        self.robotics.status = 'rejected'
+        self.robotics.save()
+        self.assertEqual(self.ids({'q': 'line'}), [])
+
+    def test_approved_items_are_found_before_the_feed_has_them(self):
+        # Approved with a queryset update: no signal adds a feed entry.
+        PortfolioItem.objects.filter(id=self.draft.id).update(status='approved')
+        FeedEntry.objects.filter(item=self.poster).delete()
+        self.assertFalse(FeedEntry.objects.filter(item__in=[self.draft, self.poster]).exists())
+        self.assertEqual(self.ids({'q': 'robotics'}),
+                         [self.draft.id, self.robotics.id, self.essay.id, self.poster.id])
+
+    def test_admin_search_uses_the_index(self):
+        self.assertEqual(self.admin_search('robotics'), {self.robotics.id, self.essay.id, self.draft.id, self.poster.id})
+        self.assertEqual(self.admin_search('PRIYA@example.com'), {
+            self.robotics.id, self.essay.id, self.draft.id, self.poster.id})
+        self.assertEqual(self.admin_search('draft'), {self.draft.id})
+
+    def test_like_fallback(self):
+        with mock.patch.object(portfolio_index, 'is_available', return_value=False):
+            self.assertEqual(self.ids({'q': 'robotics'}), [self.robotics.id, self.essay.id, self.poster.id])
+            self.assertEqual(self.admin_search('draft'), {self.draft.id})
+
+
+class ChunkedUploadTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='uploader')
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(
+            PORTFOLIO_UPLOADS={'TEMP_DIR': os.path.join(self.tmp, 'parts'), 'MAX_CHUNK_SIZE': 1000}))
+        self.data = os.urandom(2500)
+
+    def call(self, view, method, path, data=None, pk=None, **extra):
+        factory = APIRequestFactory()
+        if method == 'put':
+            request = factory.put(path, data, content_type='application/octet-stream', **extra)
+        else:
+            request = getattr(factory, method)(path, data, format='json')
+        force_authenticate(request, user=self.user)
+        return view.as_view()(request, **({'pk': pk} if pk else {}))
+
+    def start(self, **extra):
+        data = {'filename': '../portfolio.pdf', 'size': len(self.data), **extra}
+        response = self.call(UploadSessionCreateView, 'post', '/api/portfolio/uploads/', data)
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def put(self, upload_id, offset, chunk, **extra):
+        return self.call(UploadChunkView, 'put', f'/api/portfolio/uploads/{upload_id}/chunk/?offset={offset}',
+                         chunk, pk=upload_id, **extra)
+
+    def finalize(self, upload_id, **data):
+        return self.call(UploadFinalizeView, 'post', f'/api/portfolio/uploads/{upload_id}/finalize/',
+                         {'title': 'Thesis', **data}, pk=upload_id)
+
+    def test_upload_resume_and_finalize(self):
+        upload_id = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(self.put(upload_id, 0, self.data[:1000]).data['received'], 1000)
+        # A replayed or out-of-order chunk is refused with the offset to resume from.
+        response = self.put(upload_id, 0, self.data[:1000])
+        self.assertEqual((response.status_code, response.data['received']), (409, 1000))
+        response = self.put(upload_id, 1000, self.data[1000:2000],
+                            HTTP_X_CHUNK_SHA256=hashlib.sha256(b'other').hexdigest())
+        self.assertEqual((response.status_code, response.data['received']), (400, 1000))
+        self.assertEqual(self.finalize(upload_id).status_code, 409)
+        detail = self.call(UploadSessionDetailView, 'get', f'/api/portfolio/uploads/{upload_id}/', pk=upload_id)
+        offset = detail.data['received']
+        for start in range(offset, len(self.data), 1000):
+            self.assertEqual(self.put(upload_id, start, self.data[start:start + 1000]).status_code, 200)
+        # Finalizing cannot publish the file without review.
+        response = self.finalize(upload_id, status='approved')
+        self.assertEqual(response.status_code, 201, response.data)
+        item = PortfolioItem.objects.get(id=response.data['id'])
+        self.assertEqual((item.title, item.user, item.status), ('Thesis', self.user, 'pending'))
+        with item.file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.data)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).item, item)
+        self.assertFalse(os.path.exists(temp_path(UploadSession.objects.get(id=upload_id))))
+        self.assertEqual(self.finalize(upload_id).status_code, 409)
+
+    def test_checksum_mismatch_discards_upload(self):
+        upload_id = self.start(sha256='0' * 64)
+        for start in range(0, len(self.data), 1000):
+            self.put(upload_id, start, self.data[start:start + 1000])
+        self.assertEqual(self.finalize(upload_id).status_code, 422)
+        self.assertFalse(UploadSession.objects.filter(id=upload_id).exists())
+        self.assertFalse(PortfolioItem.objects.exists())
+
+    def test_failed_chunk_rewinds_past_later_chunks(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, self.data[:1000]).status_code, 200)
+        test = self
+
+        class DroppedConnection:
+            # The next chunk is reserved and written while this one is
+            # still arriving; then this one is cut short.
+            def read(self, size):
+                test.assertEqual(test.put(upload_id, 2000, test.data[2000:]).status_code, 200)
+                raise OSError('connection reset')
+
+        session = UploadSession.objects.get(id=upload_id)
+        with self.assertRaises(OSError):
+            append_chunk(session, 1000, DroppedConnection(), 1000)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).received, 1000)
+        self.assertEqual(self.finalize(upload_id).status_code, 409)
+        for start in (1000, 2000):
+            self.assertEqual(self.put(upload_id, start, self.data[start:start + 1000]).status_code, 200)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201, response.data)
+        with PortfolioItem.objects.get(id=response.data['id']).file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.data)
+
+    def test_chunk_limits(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, self.data[:1001]).status_code, 413)
+        self.assertEqual(self.put(upload_id, 2000, self.data[:1000]).status_code, 400)
+
+    def test_cleanup_removes_expired_uploads(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.data[:1000])
+        path = temp_path(UploadSession.objects.get(id=upload_id))
+        self.assertEqual(cleanup_expired(), (0, 0))
+        self.assertEqual(cleanup_expired(now=timezone.now() + timedelta(days=2)), (1, 0))
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def upload(self):
+        upload_id = self.start()
+        for start in range(0, len(self.data), 1000):
+            self.put(upload_id, start, self.data[start:start + 1000])
+        return upload_id
+
+    def test_file_is_stored_outside_the_transaction(self):
+        storage = PortfolioItem._meta.get_field('file').storage
+        depth = len(connection.atomic_blocks)
+        save = storage.save
+        saved_at_depth = []
+
+        def save_outside(name, content):
+            saved_at_depth.append(len(connection.atomic_blocks))
+            return save(name, content)
+
+        with mock.patch.object(storage, 'save', side_effect=save_outside):
+            first = self.finalize(self.upload())
+            second = self.finalize(self.upload())
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        # The second upload found the first one's file and did not copy it.
+        self.assertEqual(saved_at_depth, [depth])
+        name = PortfolioItem.objects.get(id=first.data['id']).file.name
+        self.assertEqual(PortfolioItem.objects.get(id=second.data['id']).file.name, name)
+        self.assertEqual(Blob.objects.get(name=name).ref_count, 2)
+
+    def test_failed_finalize_removes_the_stored_file(self):
+        upload_id = self.upload()
+        with mock.patch.object(PortfolioItem, 'save', side_effect=RuntimeError('locked')), \
+                self.assertRaises(RuntimeError):
+            self.finalize(upload_id)
+        storage = PortfolioItem._meta.get_field('file').storage
+        self.assertEqual(list(storage.blob_names()), [])
+        self.assertFalse(Blob.objects.exists())
+        # The session is left as it was, so finalizing can be retried.
+        session = UploadSession.objects.get(id=upload_id)
+        self.assertEqual(session.status, UploadSession.UPLOADING)
+        self.assertTrue(os.path.exists(temp_path(session)))
+        self.assertEqual(self.finalize(upload_id).status_code, 201)
+
+    def test_known_content_is_not_uploaded_again(self):
+        other = CustomUser.objects.create(username='classmate')
+        draft = PortfolioItem(user=other, title='Draft', status='draft')
+        draft.file.save('certificate.pdf', ContentFile(self.data))
+        digest = hashlib.sha256(self.data).hexdigest()
+        # Someone else's unpublished file is not offered for reuse.
+        self.assertEqual(UploadSession.objects.get(id=self.start(sha256=digest)).received, 0)
+        PortfolioItem.objects.filter(id=draft.id).update(status='approved')
+        upload_id = self.start(sha256=digest)
+        session = UploadSession.objects.get(id=upload_id)
+        self.assertEqual(session.received, session.size)
+        self.assertFalse(os.path.exists(temp_path(session)))
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201, response.data)
+        item = PortfolioItem.objects.get(id=response.data['id'])
+        self.assertEqual(item.file.name, draft.file.name)
+        self.assertEqual(Blob.objects.get(name=item.file.name).ref_count, 2)
+
+
+@override_settings(PORTFOLIO_RENDITIONS={'ENABLED': False}, PORTFOLIO_BLOBS={'GRACE_HOURS': 1})
+class BlobStorageTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='archivist')
+
+    def make_item(self, name, content):
+        item = PortfolioItem(user=self.user, title=name)
+        item.file.save(name, ContentFile(content))
+        return item
+
+    def age(self, name, hours=2):
+        """Make a blob look unused for ``hours``."""
+        past = timezone.now() - timedelta(hours=hours)
+        Blob.objects.filter(name=name).update(updated_at=past)
+        os.utime(PortfolioItem._meta.get_field('file').storage.path(name), (past.timestamp(), past.timestamp()))
+
+    def test_identical_files_are_stored_once_and_counted(self):
+        first = self.make_item('Certificate.PDF', b'certificate')
+        second = self.make_item('copy.pdf', b'certificate')
+        digest = hashlib.sha256(b'certificate').hexdigest()
+        self.assertEqual(first.file.name, f'portfolio/blobs/{digest[:2]}/{digest}.pdf')
+        self.assertEqual(second.file.name, first.file.name)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.sha256, blob.size, blob.ref_count), (digest, 11, 2))
+        second.file.save('other.pdf', ContentFile(b'something else'))
+        first.delete()
+        self.assertEqual(Blob.objects.get(name=first.file.name).ref_count, 0)
+        self.assertEqual(Blob.objects.get(name=second.file.name).ref_count, 1)
+        # Reference-neutral saves do not touch the counts.
+        second.title = 'Renamed'
+        second.save()
+        self.assertEqual(Blob.objects.get(name=second.file.name).ref_count, 1)
+
+    def test_collect_garbage(self):
+        storage = PortfolioItem._meta.get_field('file').storage
+        kept = self.make_item('kept.pdf', b'kept')
+        gone = self.make_item('gone.pdf', b'gone')
+        recent = self.make_item('recent.pdf', b'recent')
+        name = gone.file.name
+        gone.delete()
+        recent.delete()
+        self.age(name)
+        orphan = storage.save('stray.pdf', ContentFile(b'stray'))
+        self.age(orphan)
+        self.assertEqual(collect_garbage(dry_run=True)['blobs'], 1)
+        self.assertTrue(storage.exists(name))
+        removed = collect_garbage()
+        self.assertEqual((removed['blobs'], removed['orphans']), (1, 1))
+        self.assertFalse(storage.exists(name) or storage.exists(orphan))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        # Referenced, or unreferenced only recently: kept.
+        self.assertTrue(storage.exists(kept.file.name))
+        self.assertTrue(Blob.objects.filter(name=recent.file.name).exists())
+
+    def test_renditions_are_collected_with_their_blob(self):
+        storage = PortfolioItem._meta.get_field('thumbnail').storage
+        gone = self.make_item('gone.png', b'gone')
+        kept = self.make_item('kept.png', b'kept')
+        for item in (gone, kept):
+            save_renditions(item.id, item.file.name, source_digest(item), {'thumbnail': b't', 'preview': b'p'}, 'JPEG')
+            item.refresh_from_db()
+        renditions = [gone.thumbnail.name, gone.preview.name, kept.thumbnail.name, kept.preview.name]
+        gone.delete()
+        self.age(gone.file.name)
+        past = (timezone.now() - timedelta(hours=2)).timestamp()
+        for name in renditions:
+            os.utime(storage.path(name), (past, past))
+        self.assertEqual(collect_garbage(dry_run=True)['renditions'], 2)
+        removed = collect_garbage()
+        self.assertEqual((removed['blobs'], removed['renditions']), (1, 2))
+        self.assertFalse(storage.exists(renditions[0]) or storage.exists(renditions[1]))
+        # Still in use by an item.
+        self.assertTrue(storage.exists(renditions[2]) and storage.exists(renditions[3]))
+
+    def test_reused_blob_is_not_collected(self):
+        storage = PortfolioItem._meta.get_field('file').storage
+        item = self.make_item('a.pdf', b'shared')
+        name = item.file.name
+        item.delete()
+        self.age(name)
+        # Stored again after the reference was dropped, but before the
+        # item that will use it is saved.
+        self.assertEqual(storage.save('b.pdf', ContentFile(b'shared')), name)
+        self.assertEqual(collect_garbage()['blobs'], 0)
+        self.assertTrue(storage.exists(name))
+
+    def test_recount(self):
+        item = self.make_item('a.pdf', b'content')
+        # Queryset updates bypass the signals.
+        PortfolioItem.objects.create(user=self.user, title='b', file=item.file.name)
+        PortfolioItem.objects.filter(id=item.id).update(file='portfolio/legacy.pdf')
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(recount(), 1)
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+
+@override_settings(PORTFOLIO_RENDITIONS={'ENABLED': False})
+class PortfolioFileViewTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(username='filmmaker')
+        cls.viewer = CustomUser.objects.create(username='audience')
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(range(256)) * 40
+        self.item = PortfolioItem(user=self.owner, title='Showreel', status='draft')
+        self.item.file.save('showreel.mp4', ContentFile(self.data))
+
+    def get(self, user=None, query='', **headers):
+        request = APIRequestFactory().get(f'/api/portfolio/{self.item.id}/file/{query}', **headers)
+        force_authenticate(request, user=user or self.owner)
+        response = PortfolioFileView.as_view()(request, pk=self.item.id)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_whole_file_with_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.data).hexdigest()}"')
+        self.assertEqual((response['Content-Type'], response['Accept-Ranges']), ('video/mp4', 'bytes'))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=1000-1099')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1099/{len(self.data)}')
+        self.assertEqual((response['Content-Length'], self.body(response)), ('100', self.data[1000:1100]))
+        self.assertEqual(self.body(self.get(HTTP_RANGE='bytes=-10')), self.data[-10:])
+        self.assertEqual(self.body(self.get(HTTP_RANGE='bytes=10200-')), self.data[10200:])
+        response = self.get(HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.data)}'))
+        # Several ranges, or a stale If-Range: the whole file.
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_access(self):
+        self.assertEqual(self.get(user=self.viewer).status_code, 404)
+        PortfolioItem.objects.filter(id=self.item.id).update(status='approved')
+        self.assertEqual(self.get(user=self.viewer).status_code, 200)
+        self.assertEqual(self.get(query='?rendition=thumbnail').status_code, 404)
+        self.assertEqual(self.get(query='?rendition=original').status_code, 400)
+
+    def test_anonymous_access_to_approved_items(self):
+        def get_anonymously():
+            request = APIRequestFactory().get(f'/api/portfolio/{self.item.id}/file/')
+            response = PortfolioFileView.as_view()(request, pk=self.item.id)
+            self.addCleanup(response.close)
+            return response
+
+        self.assertEqual(get_anonymously().status_code, 404)
+        PortfolioItem.objects.filter(id=self.item.id).update(status='approved')
+        response = get_anonymously()
+        self.assertEqual((response.status_code, self.body(response)), (200, self.data))
+
+    def test_serializers_link_to_this_view(self):
+        request = APIRequestFactory().get('/api/portfolio/')
+        url = f'http://testserver/api/portfolio/{self.item.id}/file/'
+        data = PortfolioItemSerializer(self.item, context={'request': request}).data
+        self.assertEqual((data['file'], data['thumbnail'], data['preview']), (url, None, None))
+        self.item.thumbnail = self.item.preview = 'portfolio/renditions/still.jpg'
+        data = FeedItemSerializer(self.item, context={'request': request}).data
+        self.assertEqual((data['thumbnail'], data['preview']), (f'{url}?rendition=thumbnail', f'{url}?rendition=preview'))
+        self.assertNotIn('/media/', str(PortfolioItemSerializer(self.item).data))
+
+    @override_settings(PORTFOLIO_MEDIA={'OFFLOAD': 'x-accel-redirect'})
+    def test_offload_to_front_server(self):
+        response = self.get(query='?download=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.item.file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+
+
+@override_settings(PORTFOLIO_RENDITIONS={'WORKERS': 0, 'SIZES': {'thumbnail': (50, 50), 'preview': (300, 300)}})
+class RenditionTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='photographer')
+
+    def make_item(self, name, content):
+        item = PortfolioItem(user=self.user, title=name)
+        item.file.save(name, ContentFile(content), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        item.refresh_from_db()
+        return item
+
+    def png(self, size=(1200, 800), color='teal'):
+        output = io.BytesIO()
+        Image.new('RGBA', size, color).save(output, 'PNG')
+        return output.getvalue()
+
+    def test_images_get_content_hashed_renditions_after_save(self):
+        item = self.make_item('photo.png', self.png())
+        digest = hashlib.sha256(item.file.read()).hexdigest()
+        self.assertEqual(item.renditions_source, item.file.name)
+        self.assertEqual(item.thumbnail.name, f'portfolio/{digest[:32]}.thumbnail.jpg')
+        with Image.open(item.thumbnail) as thumbnail:
+            self.assertEqual(thumbnail.size, (50, 33))
+        with Image.open(item.preview) as preview:
+            self.assertEqual(preview.size, (300, 200))
+        self.assertLess(item.thumbnail.size, 5000)
+        # Same content, same renditions.
+        copy = self.make_item('copy.png', self.png())
+        self.assertEqual(copy.thumbnail.name, item.thumbnail.name)
+
+    def test_render_reads_lazily_and_reuses_the_blob_digest(self):
+        output = io.BytesIO()
+        Image.new('RGB', (4000, 3000), 'olive').save(output, 'JPEG')
+        with mock.patch('portfolio.renditions.file_sha256') as file_sha256, \
+                mock.patch('PIL.JpegImagePlugin.JpegImageFile.draft', autospec=True,
+                           side_effect=JpegImageFile.draft) as draft:
+            item = self.make_item('large.jpg', output.getvalue())
+        file_sha256.assert_not_called()
+        # Decoded at a reduced scale that still covers the 300px preview.
+        self.assertEqual(draft.call_args.args[1:], (None, (300, 300)))
+        self.assertEqual(item.thumbnail.name, f'portfolio/{item.file.storage.digest(item.file.name)[:32]}.thumbnail.jpg')
+        with Image.open(item.preview) as preview:
+            self.assertEqual(preview.size, (300, 225))
+
+    def test_non_images_have_no_renditions(self):
+        item = self.make_item('essay.pdf', b'%PDF-1.4')
+        self.assertEqual((item.thumbnail.name, item.renditions_source), ('', item.file.name))
+
+    def test_renditions_are_not_attached_to_a_replaced_file(self):
+        item = self.make_item('photo.png', self.png())
+        stale = PortfolioItem.objects.get(id=item.id)
+        item.file.save('other.png', ContentFile(self.png(color='navy')), save=False)
+        PortfolioItem.objects.filter(id=item.id).update(file=item.file.name)
+        self.assertFalse(render_item(stale))
+
+    def test_pool_workers_are_not_forked(self):
+        # Forking the multi-threaded web process could copy held locks.
+        with process_pool(1) as pool:
+            self.assertIn(pool._mp_context.get_start_method(), ('forkserver', 'spawn'))
+
+    def test_backfill_command(self):
+        with override_settings(PORTFOLIO_RENDITIONS={'ENABLED': False}):
+            item = self.make_item('old.png', self.png())
+        self.assertEqual(item.thumbnail.name, '')
+        # The worker processes cannot see this test's transaction, so the
+        # command renders with a pool but saves in this process.
+        call_command('generate_renditions', workers=1, stdout=io.StringIO())
+        item.refresh_from_db()
+        self.assertTrue(item.thumbnail.name.endswith('.thumbnail.jpg'))
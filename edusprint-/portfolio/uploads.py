@@ -0,0 +1,255 @@
+"""Chunked, resumable uploads of portfolio files.
+
+A client opens an UploadSession with the file's name and size (and
+optionally its SHA-256), PUTs the bytes in chunks at increasing offsets,
+and finalizes the session into a PortfolioItem. Chunks are streamed from
+the request into a temporary file in fixed-size blocks, so server memory
+does not depend on chunk or file size. After a dropped connection the
+client asks for the session's offset and carries on from there.
+
+A chunk reserves its byte range with a conditional UPDATE on the session's
+offset before writing, so concurrent or replayed chunks for the same range
+are turned away. If a chunk does not arrive whole, the offset is moved
+back to where it started, even past chunks reserved after it, so the
+client resends everything from there and no unwritten range is ever
+counted as received. Abandoned sessions expire and are removed by the
+cleanup_uploads command.
+
+If the declared SHA-256 and size match a file that is already stored, the
+session starts out complete and finalizing reuses that file, so a re-upload
+costs a lookup instead of a transfer. Only files the user could already
+see (their own items, or approved ones) are reused this way; knowing a
+digest must not be enough to obtain someone else's file.
+
+Finalizing hashes the received file and moves it into content-addressed
+storage (or finds it already there) before the transaction that creates
+the item, which then only writes a few rows.
+"""
+import hashlib
+import math
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .blobs import find_blob, get_storage
+from .models import PortfolioItem, UploadSession
+
+DEFAULTS = {
+    # Where partial uploads are kept; should be on the same disk as MEDIA_ROOT.
+    'TEMP_DIR': os.path.join(settings.BASE_DIR, 'tmp', 'uploads'),
+    'MAX_FILE_SIZE': 2 * 1024 ** 3,
+    'MAX_CHUNK_SIZE': 8 * 1024 ** 2,
+    # Sessions expire this many hours after their last chunk.
+    'EXPIRY_HOURS': 24,
+}
+
+# Bytes read from the request and written to disk at a time.
+BLOCK_SIZE = 64 * 1024
+
+
+def get_config():
+    """Return the PORTFOLIO_UPLOADS setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'PORTFOLIO_UPLOADS', {}))
+    return config
+
+
+class UploadError(Exception):
+    """An upload request that cannot be carried out, with the HTTP status to report."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def temp_path(session):
+    return os.path.join(str(get_config()['TEMP_DIR']), f'{session.id}.part')
+
+
+def expiry(now=None):
+    return (now or timezone.now()) + timedelta(hours=get_config()['EXPIRY_HOURS'])
+
+
+def start_session(user, filename, size, sha256='', content_type=''):
+    config = get_config()
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('filename is required.')
+    if not 0 < size <= config['MAX_FILE_SIZE']:
+        raise UploadError(f"size must be between 1 and {config['MAX_FILE_SIZE']} bytes.")
+    sha256 = (sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('sha256 must be a hex SHA-256 digest.')
+    blob = reusable_blob(user, sha256, size) if sha256 else None
+    session = UploadSession.objects.create(
+        user=user, filename=filename, size=size, sha256=sha256, content_type=content_type[:100],
+        expires_at=expiry(), blob=blob, received=size if blob else 0,
+    )
+    if blob:
+        return session
+    os.makedirs(str(config['TEMP_DIR']), exist_ok=True)
+    open(temp_path(session), 'wb').close()
+    return session
+
+
+def reusable_blob(user, sha256, size):
+    """A stored file with this content that ``user`` may reuse, or None."""
+    blob = find_blob(sha256, size)
+    if blob is None:
+        return None
+    visible = PortfolioItem.objects.filter(file=blob.name).filter(Q(user=user) | Q(status='approved'))
+    return blob if visible.exists() else None
+
+
+def append_chunk(session, offset, stream, length, chunk_sha256=''):
+    """Write ``length`` bytes read from ``stream`` at ``offset``; returns the new offset."""
+    if session.status != UploadSession.UPLOADING:
+        raise UploadError('Upload is already finalized.', 409)
+    if not 0 < length <= get_config()['MAX_CHUNK_SIZE']:
+        raise UploadError(f"Chunks must be between 1 and {get_config()['MAX_CHUNK_SIZE']} bytes.", 413)
+    if offset + length > session.size:
+        raise UploadError('Chunk extends past the declared file size.')
+    end = offset + length
+    reserved = UploadSession.objects.filter(
+        id=session.id, status=UploadSession.UPLOADING, received=offset,
+    ).update(received=end, expires_at=expiry())
+    if not reserved:
+        raise UploadError('Chunk does not start at the current offset.', 409)
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(temp_path(session), 'r+b') as handle:
+            handle.seek(offset)
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                handle.write(block)
+                digest.update(block)
+                written += len(block)
+            if written < length:
+                raise UploadError('Chunk ended before Content-Length bytes were received.')
+            if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                raise UploadError('Chunk checksum does not match.')
+    except BaseException:
+        # Give the range back so the client can resend it. Later chunks may
+        # have been reserved meanwhile, so this cannot wait for the offset
+        # to still be ``end``: anything past ``offset`` is resent.
+        UploadSession.objects.filter(
+            id=session.id, status=UploadSession.UPLOADING, received__gt=offset,
+        ).update(received=offset)
+        raise
+    session.received = end
+    return end
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize(session, **item_fields):
+    """Turn a fully received upload into a PortfolioItem with the given fields."""
+    if session.status != UploadSession.UPLOADING:
+        raise UploadError('Upload is already finalized.', 409)
+    if session.received != session.size:
+        raise UploadError(f'Upload is incomplete: {session.received} of {session.size} bytes received.', 409)
+    if session.blob_id:
+        return finalize_from_blob(session, **item_fields)
+    path = temp_path(session)
+    if os.path.getsize(path) != session.size:
+        abort(session)
+        raise UploadError('The received file has the wrong size; the upload was discarded.', 422)
+    digest = file_sha256(path)
+    if session.sha256 and digest != session.sha256:
+        abort(session)
+        raise UploadError('File checksum does not match; the upload was discarded.', 422)
+    # Store the file before opening the transaction: copying up to
+    # MAX_FILE_SIZE bytes must not hold the database write lock.
+    storage = get_storage()
+    name = storage.blob_name(digest, session.filename)
+    stored_at = None
+    if not storage.touch(name):
+        with open(path, 'rb') as handle:
+            # Storage copies the file over in chunks.
+            name = storage.save(name, File(handle))
+        stored_at = os.path.getmtime(storage.path(name))
+    try:
+        with transaction.atomic():
+            claimed = UploadSession.objects.filter(id=session.id, status=UploadSession.UPLOADING).update(
+                status=UploadSession.COMPLETE)
+            if not claimed:
+                raise UploadError('Upload is already finalized.', 409)
+            # Saving the item adds the Blob row and its reference.
+            item = PortfolioItem(user=session.user, file=name, **item_fields)
+            item.save()
+            session.status = UploadSession.COMPLETE
+            session.item = item
+            session.save(update_fields=['item'])
+    except BaseException:
+        if stored_at is not None:
+            # Only this upload's copy: if another one has touched the file
+            # since, it is using it.
+            storage.delete_if_unused_since(name, math.nextafter(stored_at, math.inf))
+        raise
+    os.remove(path)
+    return item
+
+
+def finalize_from_blob(session, **item_fields):
+    """Finalize a session that matched a stored file: the item reuses it."""
+    if not get_storage().touch(session.blob.name):
+        # Collected since the session started.
+        abort(session)
+        raise UploadError('The stored copy of this file is gone; start the upload again.', 409)
+    with transaction.atomic():
+        claimed = UploadSession.objects.filter(id=session.id, status=UploadSession.UPLOADING).update(
+            status=UploadSession.COMPLETE)
+        if not claimed:
+            raise UploadError('Upload is already finalized.', 409)
+        item = PortfolioItem(user=session.user, file=session.blob.name, **item_fields)
+        item.save()
+        session.status = UploadSession.COMPLETE
+        session.item = item
+        session.save(update_fields=['item'])
+    return item
+
+
+def abort(session):
+    path = temp_path(session)
+    session.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def cleanup_expired(now=None):
+    """Delete expired unfinished sessions and stray partial files; returns (sessions, files) removed."""
+    now = now or timezone.now()
+    sessions = 0
+    for session in UploadSession.objects.filter(status=UploadSession.UPLOADING, expires_at__lt=now).iterator():
+        abort(session)
+        sessions += 1
+    files = 0
+    temp_dir = str(get_config()['TEMP_DIR'])
+    if os.path.isdir(temp_dir):
+        live = {str(session_id) for session_id in UploadSession.objects.filter(
+            status=UploadSession.UPLOADING).values_list('id', flat=True)}
+        cutoff = (now - timedelta(hours=get_config()['EXPIRY_HOURS'])).timestamp()
+        for name in os.listdir(temp_dir):
+            path = os.path.join(temp_dir, name)
+            if (name.endswith('.part') and name[:-len('.part')] not in live
+                    and os.path.getmtime(path) < cutoff):
+                os.remove(path)
+                files += 1
+    return sessions, files
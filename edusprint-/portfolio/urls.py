@@ -1,7 +1,19 @@
 from django.urls import path
-from .views import PortfolioListCreateView, PortfolioDeleteView
+from .views import (
+    PortfolioListCreateView, PortfolioDeleteView, PortfolioFeedView, PortfolioSearchView, PortfolioViewCountView,
+    PortfolioFileView,
+    UploadSessionCreateView, UploadSessionDetailView, UploadChunkView, UploadFinalizeView,
+)
 
 urlpatterns = [
     path('', PortfolioListCreateView.as_view(), name='portfolio-list-create'),
+    path('feed/', PortfolioFeedView.as_view(), name='portfolio-feed'),
+    path('search/', PortfolioSearchView.as_view(), name='portfolio-search'),
     path('<int:pk>/', PortfolioDeleteView.as_view(), name='portfolio-delete'),
+    path('<int:pk>/views/', PortfolioViewCountView.as_view(), name='portfolio-views'),
+    path('<int:pk>/file/', PortfolioFileView.as_view(), name='portfolio-file'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='portfolio-upload-create'),
+    path('uploads/<uuid:pk>/', UploadSessionDetailView.as_view(), name='portfolio-upload-detail'),
+    path('uploads/<uuid:pk>/chunk/', UploadChunkView.as_view(), name='portfolio-upload-chunk'),
+    path('uploads/<uuid:pk>/finalize/', UploadFinalizeView.as_view(), name='portfolio-upload-finalize'),
 ]
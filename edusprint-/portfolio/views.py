@@ -1,17 +1,110 @@
-from rest_framework import generics, permissions
-from .models import PortfolioItem
-from .serializers import PortfolioItemSerializer
+import hashlib
+from django.db.models import Count, Max, Q, Sum
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from rest_framework import generics, permissions, serializers, status
+from rest_framework.response import Response
+from edusprint.pagination import RankedPagination
+from . import media, uploads
+from .counters import get_unique_viewers, get_views, load_viewer_sketches, pending_version, record_view
+from .models import FeedEntry, PortfolioItem, UploadSession
+from .pagination import FeedPagination, PortfolioCursorPagination
+from .search import search_items
+from .serializers import FeedItemSerializer, PortfolioItemSerializer, UploadFinalizeSerializer, UploadSessionSerializer
 
 class PortfolioListCreateView(generics.ListCreateAPIView):
+    """The user's items, newest first, a page at a time.
+
+    ``?fields=title,status`` limits both the response and the columns
+    loaded. Listings carry an ETag derived from one aggregate query, so a
+    client polling with If-None-Match gets a bodiless 304 until something
+    changes.
+    """
     serializer_class = PortfolioItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PortfolioCursorPagination
 
     def get_queryset(self):
         return PortfolioItem.objects.filter(user=self.request.user)
 
+    def get_requested_fields(self):
+        """The serializer fields named by ``?fields=``, or None for all of them."""
+        if self.request.method != 'GET' or not self.request.query_params.get('fields'):
+            return None
+        fields = [name.strip() for name in self.request.query_params['fields'].split(',') if name.strip()]
+        unknown = set(fields) - set(self.serializer_class().fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}."})
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_etag(self):
+        # Views and unique viewers are written with queryset updates that
+        # leave updated_at alone, so their totals are part of the tag, as
+        # are the views this process has not flushed yet.
+        stats = self.get_queryset().aggregate(
+            latest=Max('updated_at'), count=Count('id'), views=Sum('views_count'), viewers=Sum('unique_viewers'))
+        key = f"{self.request.user.pk}|{stats}|{pending_version()}|{self.request.get_full_path()}"
+        return '"%s"' % hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_requested_fields()
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            queryset = self.filter_queryset(self.get_queryset()).defer('viewers_sketch')
+            if fields is not None:
+                queryset = queryset.only(*self.serializer_class.model_fields(fields), 'created_at')
+            page = self.paginate_queryset(queryset)
+            if fields is None or 'unique_viewers' in fields:
+                load_viewer_sketches(page)
+            response = self.get_paginated_response(self.get_serializer(page, many=True, fields=fields).data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+class PortfolioFeedView(generics.ListAPIView):
+    """Approved items from everyone, best first; featured, recent and much-viewed items rank higher.
+
+    Reads the precomputed FeedEntry table (see portfolio.feed), so a page
+    costs one indexed query regardless of how many items there are.
+    """
+    serializer_class = FeedItemSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = FeedPagination
+
+    def get_queryset(self):
+        return FeedEntry.objects.select_related('item__user', 'item__category').defer('item__viewers_sketch')
+
+    def list(self, request, *args, **kwargs):
+        entries = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer([entry.item for entry in entries], many=True)
+        return self.get_paginated_response(serializer.data)
+
+class PortfolioSearchView(generics.ListAPIView):
+    """Approved items matching ``q`` in their title, description, approved comments or author, best first.
+
+    Paginated by ``page`` and ``page_size``; see portfolio.search for how
+    matches are found and ranked.
+    """
+    serializer_class = FeedItemSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = RankedPagination
+
+    def list(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'q is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginator.paginate_search(lambda limit, offset: search_items(text, limit, offset), request)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
 class PortfolioDeleteView(generics.DestroyAPIView):
     queryset = PortfolioItem.objects.all()
     serializer_class = PortfolioItemSerializer
@@ -19,3 +112,162 @@ class PortfolioDeleteView(generics.DestroyAPIView):
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
+
+class PortfolioViewCountView(generics.GenericAPIView):
+    """GET the view counts of an item (including unflushed views); POST to count a view.
+
+    ``?days=N`` adds the estimated unique viewers over the last N days.
+    """
+    queryset = PortfolioItem.objects.all()
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return self.queryset.filter(Q(status='approved') | Q(user=self.request.user))
+
+    def get(self, request, *args, **kwargs):
+        item = self.get_object()
+        data = self.counts(item)
+        if request.query_params.get('days'):
+            try:
+                days = int(request.query_params['days'])
+            except ValueError:
+                days = 0
+            if not 1 <= days <= 366:
+                return Response({'error': 'days must be between 1 and 366.'}, status=status.HTTP_400_BAD_REQUEST)
+            data['recent_unique_viewers'] = get_unique_viewers(item, days)
+        return Response(data)
+
+    def post(self, request, *args, **kwargs):
+        item = self.get_object()
+        record_view(item.id, viewer=request.user.id)
+        return Response(self.counts(item), status=status.HTTP_202_ACCEPTED)
+
+    def counts(self, item):
+        return {'id': item.id, 'views_count': get_views(item), 'unique_viewers': get_unique_viewers(item)}
+
+class PortfolioFileView(generics.GenericAPIView):
+    """GET an item's file, or ``?rendition=thumbnail|preview`` of an image.
+
+    Supports Range and conditional requests; ``?download=1`` asks the
+    browser to save it. See portfolio.media for how the bytes are sent.
+    Files of approved items are public, like the feed they appear in;
+    others are only served to their owner.
+    """
+    queryset = PortfolioItem.objects.all()
+    permission_classes = [permissions.AllowAny]
+    RENDITIONS = ('thumbnail', 'preview')
+
+    def get_queryset(self):
+        visible = Q(status='approved')
+        if self.request.user.is_authenticated:
+            visible |= Q(user=self.request.user)
+        return self.queryset.filter(visible)
+
+    def get(self, request, *args, **kwargs):
+        item = self.get_object()
+        rendition = request.query_params.get('rendition')
+        if rendition and rendition not in self.RENDITIONS:
+            return Response({'error': f"rendition must be one of {', '.join(self.RENDITIONS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        field = getattr(item, rendition or 'file')
+        if not field:
+            raise Http404('No such file.')
+        download = request.query_params.get('download') == '1'
+        download_name = None
+        if download and not rendition:
+            # Stored names are content hashes; offer the name it was uploaded under.
+            download_name = UploadSession.objects.filter(item=item).values_list('filename', flat=True).first()
+        try:
+            return media.serve(request, field.storage, field.name, download_name=download_name,
+                               as_attachment=download)
+        except FileNotFoundError:
+            raise Http404('No such file.')
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """Start a chunked upload: POST ``filename``, ``size`` and optionally ``sha256`` and ``content_type``.
+
+    If ``received`` already equals ``size`` the file is stored already and
+    the upload can be finalized straight away.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'error': 'size must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = uploads.start_session(
+                request.user, request.data.get('filename'), size,
+                sha256=request.data.get('sha256', ''), content_type=request.data.get('content_type', ''),
+            )
+        except uploads.UploadError as exc:
+            return Response({'error': exc.message}, status=exc.status_code)
+        data = self.get_serializer(session).data
+        data['max_chunk_size'] = uploads.get_config()['MAX_CHUNK_SIZE']
+        return Response(data, status=status.HTTP_201_CREATED)
+
+class UploadSessionDetailView(generics.RetrieveDestroyAPIView):
+    """GET an upload's progress (``received`` is the offset to resume from); DELETE to abort it."""
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        if instance.status == UploadSession.COMPLETE:
+            instance.delete()
+        else:
+            uploads.abort(instance)
+
+class UploadChunkView(generics.GenericAPIView):
+    """PUT the next chunk of an upload as the raw request body.
+
+    The ``offset`` query parameter must equal the bytes received so far;
+    an optional ``X-Chunk-SHA256`` header is checked against the chunk. The
+    body is streamed to disk without being loaded into memory.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def put(self, request, *args, **kwargs):
+        session = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset'))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'offset must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # request.stream reads straight from the client; the body is
+            # never parsed or buffered.
+            received = uploads.append_chunk(
+                session, offset, request.stream, length, request.headers.get('X-Chunk-SHA256', ''))
+        except uploads.UploadError as exc:
+            session.refresh_from_db(fields=['received'])
+            return Response({'error': exc.message, 'received': session.received}, status=exc.status_code)
+        return Response({'received': received, 'size': session.size})
+
+class UploadFinalizeView(generics.GenericAPIView):
+    """Turn a complete upload into a PortfolioItem pending review; POST ``title`` and optionally
+    ``description`` and ``category``."""
+    serializer_class = UploadFinalizeSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        session = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            item = uploads.finalize(session, status='pending', **serializer.validated_data)
+        except uploads.UploadError as exc:
+            return Response({'error': exc.message}, status=exc.status_code)
+        return Response(PortfolioItemSerializer(item, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
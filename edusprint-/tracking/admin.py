@@ -1,5 +1,40 @@
 from django.contrib import admin
-from .models import RequestLog
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .archive import stream_gzip
+from .models import RequestLog, RequestLogRollup
 
-# Register your models here.
-admin.site.register(RequestLog)
+@admin.register(RequestLog)
+class RequestLogAdmin(admin.ModelAdmin):
+    list_display = ('timestamp', 'method', 'path', 'status_code', 'duration_ms', 'user')
+    list_filter = ('method', 'status_code')
+    search_fields = ('path',)
+    ordering = ('-id',)
+    list_select_related = ('user',)
+    # Avoid a COUNT(*) over the whole table on every changelist page.
+    show_full_result_count = False
+
+    actions = ['export_ndjson', 'export_csv']
+
+    def _export(self, queryset, fmt):
+        response = StreamingHttpResponse(stream_gzip(queryset, fmt), content_type='application/gzip')
+        filename = f"requestlog-{timezone.now():%Y%m%d-%H%M%S}.{fmt}.gz"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def export_ndjson(self, request, queryset):
+        """Stream selected rows as gzip-compressed NDJSON"""
+        return self._export(queryset, 'ndjson')
+    export_ndjson.short_description = "Export selected logs as NDJSON (gzip)"
+
+    def export_csv(self, request, queryset):
+        """Stream selected rows as gzip-compressed CSV"""
+        return self._export(queryset, 'csv')
+    export_csv.short_description = "Export selected logs as CSV (gzip)"
+
+@admin.register(RequestLogRollup)
+class RequestLogRollupAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'resolution', 'method', 'path', 'status_code', 'count', 'estimated_count', 'max_duration_ms')
+    list_filter = ('resolution', 'method', 'status_code')
+    search_fields = ('path',)
+    ordering = ('-bucket',)
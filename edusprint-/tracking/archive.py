@@ -0,0 +1,243 @@
+"""Streaming export of RequestLog rows to gzip-compressed NDJSON or CSV.
+
+Rows are read in keyset order (``id > last_id``) in fixed-size chunks, so
+memory use stays constant however large the table is, and are written to
+one file per UTC day. Archives can be scanned again with ``iter_archive``
+without loading them into the database.
+
+Re-running an archive is safe and only costs the new rows: each day's
+file has a small ``.<name>.mark`` file next to it recording the highest id
+archived and how many bytes of the archive are complete. Rows at or below
+that id are skipped, new rows are appended as a new gzip member, and
+anything past the recorded size (left by an interrupted run) is cut off
+before appending.
+"""
+import contextlib
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import zlib
+
+from django.conf import settings
+
+FIELDS = [
+    'id', 'timestamp', 'user_id', 'method', 'path', 'url_name', 'status_code', 'remote_addr',
+    'query_params', 'body', 'body_size', 'body_sha256', 'duration_ms', 'db_time_ms',
+    'query_count', 'response_size', 'sample_weight',
+]
+
+FORMATS = ('ndjson', 'csv')
+
+
+def iter_rows(queryset, chunk_size=2000):
+    """Yield the rows of a RequestLog queryset as dicts, in id order, one chunk at a time."""
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id').values(*FIELDS)[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1]['id']
+
+
+def _serialize(row):
+    row = dict(row)
+    row['timestamp'] = row['timestamp'].isoformat()
+    return row
+
+
+def encode_row(row, fmt):
+    """Encode one row as an NDJSON line or a CSV line."""
+    row = _serialize(row)
+    if fmt == 'ndjson':
+        return json.dumps(row, ensure_ascii=False) + '\n'
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(['' if row[field] is None else row[field] for field in FIELDS])
+    return buffer.getvalue()
+
+
+def csv_header():
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(FIELDS)
+    return buffer.getvalue()
+
+
+def archive_filename(day, fmt):
+    return f'requestlog-{day.isoformat()}.{fmt}.gz'
+
+
+class DailyArchiveWriter:
+    """Writes rows to one gzip file per UTC day, adding to existing archives.
+
+    Rows are appended as a new gzip member, which gzip readers treat as a
+    continuation of the same stream; the existing contents are never read
+    or copied. The day's mark is only updated on close(), so an
+    interrupted run leaves the archives as they were. Rows already in a
+    day's file (by id) are skipped.
+    """
+
+    def __init__(self, output_dir, fmt='ndjson'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown archive format {fmt!r}; expected one of {FORMATS}")
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.files = {}
+        # Day -> (highest id already archived for it, complete size of its file).
+        self.marks = {}
+        # Day -> highest id written to it by this run.
+        self.written_ids = {}
+        self.paths = []
+        self.rows_written = 0
+        self.rows_skipped = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _path_for(self, day):
+        return os.path.join(self.output_dir, archive_filename(day, self.fmt))
+
+    def _archived_id(self, day):
+        if day not in self.marks:
+            self.marks[day] = load_mark(self._path_for(day))
+        return self.marks[day][0]
+
+    def _file_for(self, day):
+        entry = self.files.get(day)
+        if entry is None:
+            path = self._path_for(day)
+            size = self.marks[day][1]
+            if not size:
+                # Marked before anything is written, so a run interrupted
+                # while creating the file leaves nothing that counts.
+                write_mark(path, 0, 0)
+            raw = open(path, 'r+b' if size else 'wb')
+            # Drop whatever an interrupted run appended past the mark.
+            raw.seek(size)
+            raw.truncate()
+            handle = io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode='wb'), encoding='utf-8', newline='')
+            if not size and self.fmt == 'csv':
+                handle.write(csv_header())
+            entry = self.files[day] = (handle, raw, path)
+            self.paths.append(path)
+        return entry[0]
+
+    def write(self, row):
+        day = row['timestamp'].date()
+        if row['id'] <= self._archived_id(day):
+            self.rows_skipped += 1
+            return
+        self._file_for(day).write(encode_row(row, self.fmt))
+        self.written_ids[day] = row['id']
+        self.rows_written += 1
+
+    def close(self):
+        """Finish every file and record its new mark."""
+        for day, (handle, raw, path) in self.files.items():
+            handle.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+            size = raw.tell()
+            raw.close()
+            write_mark(path, self.written_ids[day], size)
+        self.files = {}
+
+    def abort(self):
+        """Discard everything written since the files were opened."""
+        for day, (handle, raw, path) in self.files.items():
+            with contextlib.suppress(Exception):
+                handle.close()  # Ends the gzip member, which is cut off below.
+            raw.truncate(self.marks[day][1])
+            raw.close()
+            if not self.marks[day][1]:
+                os.remove(path)
+                os.remove(mark_path(path))
+        self.files = {}
+        self.paths = []
+
+
+def archive_queryset(queryset, output_dir, fmt='ndjson', chunk_size=2000):
+    """Archive a queryset's rows into daily files; returns (rows written, max id, paths).
+
+    The max id counts rows skipped as already archived, so they can be
+    deleted as well.
+    """
+    writer = DailyArchiveWriter(output_dir, fmt)
+    max_id = None
+    try:
+        for row in iter_rows(queryset, chunk_size):
+            writer.write(row)
+            max_id = row['id']
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.rows_written, max_id, writer.paths
+
+
+def stream_gzip(queryset, fmt='ndjson', chunk_size=2000):
+    """Yield a gzip-compressed export of a queryset, for streaming HTTP responses."""
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container.
+    if fmt == 'csv':
+        yield compressor.compress(csv_header().encode('utf-8'))
+    for row in iter_rows(queryset, chunk_size):
+        data = compressor.compress(encode_row(row, fmt).encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_archive(path):
+    """Yield the rows of an archive file as dicts, without touching the database."""
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as handle:
+        if path.endswith('.csv.gz'):
+            for record in csv.reader(handle):
+                if record == FIELDS:
+                    continue
+                yield dict(zip(FIELDS, record))
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def max_archived_id(path):
+    """The highest row id in an archive file, or 0 if it has no rows."""
+    return max((int(row['id']) for row in iter_archive(path)), default=0)
+
+
+def mark_path(path):
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f'.{filename}.mark')
+
+
+def load_mark(path):
+    """(highest archived id, complete size) of an archive file; (0, 0) if there is none.
+
+    Archives without a usable mark (written before marks existed, or
+    replaced by hand) are scanned once and marked.
+    """
+    if not os.path.exists(path):
+        return 0, 0
+    try:
+        with open(mark_path(path), encoding='utf-8') as handle:
+            mark = json.load(handle)
+        if mark['size'] <= os.path.getsize(path):
+            return mark['max_id'], mark['size']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    max_id, size = max_archived_id(path), os.path.getsize(path)
+    write_mark(path, max_id, size)
+    return max_id, size
+
+
+def write_mark(path, max_id, size):
+    directory, filename = os.path.split(mark_path(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=filename, suffix='.part')
+    with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+        json.dump({'max_id': max_id, 'size': size}, handle)
+    os.replace(temp_path, mark_path(path))
+
+
+def default_archive_dir():
+    return str(getattr(settings, 'REQUEST_LOG_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archives', 'request_logs')))
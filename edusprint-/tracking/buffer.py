@@ -0,0 +1,207 @@
+"""Buffered, batched writer for RequestLog rows.
+
+Requests hand compact log records to a bounded in-process queue and return
+immediately. A background flusher thread drains the queue and writes the
+records with ``bulk_create`` whenever a batch fills up or the flush interval
+elapses, and whatever is still queued is flushed when the process exits.
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Set to False to write every record synchronously (one INSERT each).
+    'ENABLED': True,
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    # Seconds between flushes when the batch size is not reached.
+    'FLUSH_INTERVAL': 2.0,
+    # What to do when the queue is full: 'drop_newest', 'drop_oldest' or
+    # 'block' (wait up to BLOCK_TIMEOUT seconds, then drop the new record).
+    'OVERFLOW': 'drop_newest',
+    'BLOCK_TIMEOUT': 0.05,
+}
+
+OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+
+def get_config():
+    """Return the REQUEST_LOG_BUFFER setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REQUEST_LOG_BUFFER', {}))
+    return config
+
+
+class RequestLogBuffer:
+    """Bounded queue of RequestLog field dicts with a background flusher."""
+
+    def __init__(self, max_queue_size=10000, batch_size=500, flush_interval=2.0,
+                 overflow='drop_newest', block_timeout=0.05):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {OVERFLOW_POLICIES}")
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    def start(self):
+        """Start the flusher thread if it is not already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='request-log-flusher', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def enqueue(self, record):
+        """Queue a record without touching the database. Returns False if it was dropped."""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if not self._handle_overflow(record):
+                with self._lock:
+                    self.dropped += 1
+                return False
+        if self.queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _handle_overflow(self, record):
+        if self.overflow == 'block':
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                return False
+        if self.overflow == 'drop_oldest':
+            try:
+                self.queue.get_nowait()
+                with self._lock:
+                    self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+                return True
+            except queue.Full:
+                return False
+        return False
+
+    def _drain(self, limit):
+        records = []
+        while len(records) < limit:
+            try:
+                records.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def flush(self):
+        """Write everything currently queued in batches; returns the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                records = self._drain(self.batch_size)
+                if not records:
+                    break
+                written += self._write(records)
+        return written
+
+    def _write(self, records):
+        from .models import RequestLog
+        try:
+            RequestLog.objects.bulk_create([RequestLog(**record) for record in records])  # type: ignore
+        except Exception:
+            logger.exception('Dropped %d request log records that could not be written', len(records))
+            with self._lock:
+                self.dropped += len(records)
+            return 0
+        with self._lock:
+            self.written += len(records)
+        return len(records)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                # stop() writes what is left, on its own thread.
+                break
+            if self.queue.empty():
+                continue
+            self.flush()
+            # This thread lives for the whole process, so release the
+            # connection the same way Django does at the end of a request.
+            close_old_connections()
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher thread and write out anything still queued."""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Return the process-wide buffer, creating it from settings on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = get_config()
+                _buffer = RequestLogBuffer(
+                    max_queue_size=config['MAX_QUEUE_SIZE'],
+                    batch_size=config['BATCH_SIZE'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    overflow=config['OVERFLOW'],
+                    block_timeout=config['BLOCK_TIMEOUT'],
+                )
+    return _buffer
+
+
+def log_request(record):
+    """Record a request log entry, buffered unless buffering is disabled."""
+    if not get_config()['ENABLED']:
+        from .models import RequestLog
+        RequestLog.objects.create(**record)  # type: ignore
+        return True
+    return get_buffer().enqueue(record)
+
+
+async def alog_request(record):
+    """Async variant of log_request that never blocks the event loop.
+
+    Enqueueing is non-blocking, so it runs inline; synchronous writes and the
+    'block' overflow policy are handed to a worker thread instead.
+    """
+    config = get_config()
+    if config['ENABLED'] and config['OVERFLOW'] != 'block':
+        return get_buffer().enqueue(record)
+    return await sync_to_async(log_request)(record)
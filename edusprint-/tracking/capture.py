@@ -0,0 +1,103 @@
+"""Bounded request body capture for the tracking middleware.
+
+Instead of storing whole request bodies, the middleware records a short
+prefix, the byte count and a SHA-256 of the payload. The capture mode is
+chosen per path prefix and per content type:
+
+* ``'none'``   - record nothing about the body.
+* ``'meta'``   - record the byte count from Content-Length only; the body is
+  never read.
+* ``'prefix'`` - record a bounded prefix, the byte count and a hash.
+
+Bodies are only read when they are small (MAX_READ_BYTES) and not a
+multipart stream, so logging never makes Django buffer an upload that would
+otherwise be streamed to disk by the upload handlers.
+"""
+import hashlib
+
+from django.conf import settings
+from django.http.request import RawPostDataException
+
+CAPTURE_MODES = ('none', 'meta', 'prefix')
+
+DEFAULTS = {
+    'DEFAULT_MODE': 'prefix',
+    'MAX_PREFIX_BYTES': 1024,
+    # Bodies larger than this are never read just for logging.
+    'MAX_READ_BYTES': 64 * 1024,
+    # Content type (without parameters) -> mode.
+    'CONTENT_TYPES': {
+        'multipart/form-data': 'meta',
+        'application/octet-stream': 'meta',
+    },
+    # Path prefix -> mode; the longest matching prefix wins and takes
+    # precedence over the content type.
+    'PATHS': {},
+}
+
+CAPTURED_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+def get_config():
+    """Return the REQUEST_LOG_BODY_CAPTURE setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REQUEST_LOG_BODY_CAPTURE', {}))
+    return config
+
+
+def get_capture_mode(request, config=None):
+    """Pick the capture mode for a request from its path and content type."""
+    config = config or get_config()
+    if request.method not in CAPTURED_METHODS:
+        return 'none'
+    matches = [prefix for prefix in config['PATHS'] if request.path.startswith(prefix)]
+    if matches:
+        mode = config['PATHS'][max(matches, key=len)]
+    else:
+        mode = config['CONTENT_TYPES'].get(request.content_type, config['DEFAULT_MODE'])
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"Unknown body capture mode {mode!r}; expected one of {CAPTURE_MODES}")
+    return mode
+
+
+def _content_length(request):
+    try:
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_body(request, config):
+    """Return the raw body if it is safe to read for logging, else None."""
+    # A body that something else already read is free to inspect.
+    if hasattr(request, '_body'):
+        return request._body
+    if request.content_type == 'multipart/form-data':
+        return None
+    length = _content_length(request)
+    if length is None or length > config['MAX_READ_BYTES']:
+        return None
+    try:
+        return request.body
+    except RawPostDataException:
+        return None
+
+
+def capture_body(request):
+    """Return the ``body``, ``body_size`` and ``body_sha256`` fields for a RequestLog."""
+    config = get_config()
+    mode = get_capture_mode(request, config)
+    captured = {'body': '', 'body_size': None, 'body_sha256': ''}
+    if mode == 'none':
+        return captured
+
+    raw = _read_body(request, config) if mode == 'prefix' else None
+    if raw is None:
+        captured['body_size'] = _content_length(request)
+        return captured
+
+    prefix = raw[:config['MAX_PREFIX_BYTES']]
+    captured['body'] = prefix.decode('utf-8', errors='replace')
+    captured['body_size'] = len(raw)
+    captured['body_sha256'] = hashlib.sha256(raw).hexdigest()
+    return captured
@@ -0,0 +1,54 @@
+"""Per-request SQL query counting and timing.
+
+An execute wrapper is installed on every database connection as it is
+opened. It only does work while a request is being measured: the middleware
+puts a QueryStats object into a context variable for the duration of the
+request, and queries run outside a measured request (such as the tracking
+buffer's own flushes) pass straight through.
+"""
+import contextvars
+import time
+
+_current_stats = contextvars.ContextVar('tracking_query_stats', default=None)
+
+
+class QueryStats:
+    """Number of queries and total time spent in the database, in seconds."""
+
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def start_measuring():
+    """Begin collecting query stats for the current context; returns (stats, token)."""
+    stats = QueryStats()
+    return stats, _current_stats.set(stats)
+
+
+def stop_measuring(token):
+    try:
+        _current_stats.reset(token)
+    except ValueError:
+        # The token came from a copied context (e.g. across sync_to_async).
+        _current_stats.set(None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.duration += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver that adds the recorder to a connection once."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
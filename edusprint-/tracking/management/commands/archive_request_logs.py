@@ -0,0 +1,55 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from tracking.archive import FORMATS, archive_queryset, default_archive_dir
+from tracking.models import RequestLog
+from tracking.rollups import delete_in_batches, get_retention_config, rolled_up_until
+
+
+class Command(BaseCommand):
+    help = 'Stream RequestLog rows into gzip-compressed NDJSON or CSV files, one per day.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive rows logged before this date (YYYY-MM-DD, UTC).')
+        parser.add_argument('--older-than-days', type=int,
+                            help='Archive rows older than this many days (default: REQUEST_LOG_RETENTION RAW_DAYS).')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output-dir', default=None, help='Directory for the archive files.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows read per query.')
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete the archived rows afterwards, except those not rolled up yet.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            day = parse_date(options['before'])
+            if day is None:
+                raise CommandError('--before must be a date in YYYY-MM-DD format.')
+            cutoff = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+        else:
+            days = options['older_than_days']
+            if days is None:
+                days = get_retention_config()['RAW_DAYS']
+            cutoff = timezone.now() - timedelta(days=days)
+
+        queryset = RequestLog.objects.filter(timestamp__lt=cutoff)  # type: ignore
+        output_dir = options['output_dir'] or default_archive_dir()
+        written, max_id, paths = archive_queryset(queryset, output_dir, options['format'], options['chunk_size'])
+        for path in paths:
+            self.stdout.write(f'  {path}')
+        self.stdout.write(f'Archived {written} rows logged before {cutoff:%Y-%m-%d %H:%M} UTC.')
+
+        if options['delete'] and max_id is not None:
+            # As with prune, rows not covered by the hourly rollups yet are
+            # kept, so archiving never loses data from the rollups.
+            covered = rolled_up_until()
+            if covered is None:
+                self.stdout.write('Nothing deleted: no rows have been rolled up yet.')
+            else:
+                # Ids only grow, so id <= max_id only matches rows that were written.
+                to_delete = RequestLog.objects.filter(timestamp__lt=min(cutoff, covered), id__lte=max_id)  # type: ignore
+                deleted = delete_in_batches(to_delete, get_retention_config()['BATCH_SIZE'])
+                self.stdout.write(f'Deleted {deleted} archived rows.')
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,70 @@
+import asyncio
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from tracking.buffer import get_buffer
+from tracking.models import RequestLog
+
+DEFAULT_PATHS = ['/', '/api/consultancy/consultants/', '/api/consultancy/slots/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare in-process WSGI and ASGI request throughput on the API endpoints, '
+        'running the full middleware stack.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS, help='Paths to request.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per path and handler.')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Concurrent requests in flight on the ASGI handler.')
+        parser.add_argument('--keep-logs', action='store_true',
+                            help='Keep the RequestLog rows written by the benchmark.')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        # Requests carry a marker query string so the log rows they produce
+        # can be told apart from real traffic and removed afterwards.
+        marker = f'benchmark={uuid.uuid4().hex}'
+        try:
+            for path in options['paths']:
+                url = f'{path}?{marker}'
+                wsgi = self.run_wsgi(url, options)
+                asgi = asyncio.run(self.run_asgi(url, options))
+                self.stdout.write(
+                    f"{path:40} WSGI {wsgi:8.1f} req/s   ASGI {asgi:8.1f} req/s   "
+                    f"({asgi / wsgi:.2f}x)"
+                )
+        finally:
+            get_buffer().flush()
+            if not options['keep_logs']:
+                deleted, _ = RequestLog.objects.filter(query_params=marker).delete()  # type: ignore
+                self.stdout.write(f"Removed {deleted} benchmark log rows.")
+
+    def run_wsgi(self, path, options):
+        client = Client()
+        client.get(path)
+        count = options['requests']
+        start = time.perf_counter()
+        for _ in range(count):
+            client.get(path)
+        return count / (time.perf_counter() - start)
+
+    async def run_asgi(self, path, options):
+        client = AsyncClient()
+        await client.get(path)
+        count = options['requests']
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def fetch():
+            async with semaphore:
+                await client.get(path)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(count)))
+        return count / (time.perf_counter() - start)
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from tracking.archive import iter_archive
+
+
+class Command(BaseCommand):
+    help = 'Scan RequestLog archive files and print matching rows as NDJSON, without loading them into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Archive files (.ndjson.gz or .csv.gz).')
+        parser.add_argument('--path-prefix', help='Only rows whose path starts with this prefix.')
+        parser.add_argument('--method', help='Only rows with this HTTP method.')
+        parser.add_argument('--status', help='Only rows with this status code.')
+        parser.add_argument('--count', action='store_true', help='Print only the number of matching rows.')
+
+    def handle(self, *args, **options):
+        matched = 0
+        for path in options['files']:
+            for row in iter_archive(path):
+                if options['path_prefix'] and not row['path'].startswith(options['path_prefix']):
+                    continue
+                if options['method'] and row['method'] != options['method'].upper():
+                    continue
+                if options['status'] and str(row['status_code']) != options['status']:
+                    continue
+                matched += 1
+                if not options['count']:
+                    self.stdout.write(json.dumps(row, ensure_ascii=False))
+        if options['count']:
+            self.stdout.write(str(matched))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from tracking.rollups import prune, rollup_all
+
+
+class Command(BaseCommand):
+    help = 'Aggregate RequestLog rows into per-minute and per-hour rollups, optionally pruning old rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help='Apply the REQUEST_LOG_RETENTION policy after rolling up.')
+        parser.add_argument('--raw-days', type=int, help='Keep raw rows for this many days.')
+        parser.add_argument('--minute-days', type=int, help='Keep minute rollups for this many days.')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per DELETE statement.')
+
+    def handle(self, *args, **options):
+        written = rollup_all()
+        self.stdout.write(f"Rollups written: {written['minute']} minute, {written['hour']} hour buckets.")
+        if options['prune']:
+            deleted = prune(
+                raw_days=options['raw_days'],
+                minute_rollup_days=options['minute_days'],
+                batch_size=options['batch_size'],
+            )
+            self.stdout.write(f"Pruned {deleted['raw']} raw rows and {deleted['minute_rollups']} minute rollups.")
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -1,26 +1,96 @@
 """Middleware for logging each request to the RequestLog model."""
-from .models import RequestLog
-from django.utils.deprecation import MiddlewareMixin
-
-# Logs every incoming request to the database
-class RequestLogMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        user = request.user if request.user.is_authenticated else None
-        path = request.path
-        method = request.method
-        remote_addr = request.META.get('REMOTE_ADDR')
-        query_params = request.META.get('QUERY_STRING', '')
-        body = ''
-        if method in ['POST', 'PUT', 'PATCH']:
-            try:
-                body = request.body.decode('utf-8')
-            except Exception:
-                body = str(request.body)
-        RequestLog.objects.create(  # type: ignore
-            user=user,
-            path=path,
-            method=method,
-            remote_addr=remote_addr,
-            query_params=query_params,
-            body=body
-        ) 
\ No newline at end of file
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils import timezone
+from django.utils.functional import LazyObject, empty
+
+from .buffer import alog_request, log_request
+from .capture import capture_body
+from .instrumentation import start_measuring, stop_measuring
+from .sampling import get_policy
+
+
+def _user_is_loaded(request):
+    """True if reading request.user will not hit the database."""
+    user = getattr(request, 'user', None)
+    return not isinstance(user, LazyObject) or user._wrapped is not empty
+
+
+# Logs requests once their response is ready, together with their wall
+# time, DB time and query count. The sampling policy decides which requests
+# are logged; records are handed to the tracking buffer, which writes them in
+# batches off the request path.
+#
+# The middleware runs natively under both WSGI and ASGI, so Django does not
+# have to hop threads around it, and the async path never blocks the loop.
+class RequestLogMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if get_policy().is_excluded(request.path):
+            return self.get_response(request)
+        arrived_at, started = timezone.now(), time.perf_counter()
+        stats, token = start_measuring()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_measuring(token)
+        record = self.build_record(request, response, arrived_at, started, stats)
+        if record is not None:
+            user = getattr(request, 'user', None)
+            record['user_id'] = user.pk if user is not None and user.is_authenticated else None
+            log_request(record)
+        return response
+
+    async def __acall__(self, request):
+        if get_policy().is_excluded(request.path):
+            return await self.get_response(request)
+        arrived_at, started = timezone.now(), time.perf_counter()
+        stats, token = start_measuring()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_measuring(token)
+        record = self.build_record(request, response, arrived_at, started, stats)
+        if record is not None:
+            if _user_is_loaded(request):
+                user = getattr(request, 'user', None)
+            else:
+                user = await request.auser()
+            record['user_id'] = user.pk if user is not None and user.is_authenticated else None
+            await alog_request(record)
+        return response
+
+    def build_record(self, request, response, arrived_at, started, stats):
+        """Return the RequestLog fields for a finished request, or None if it is not sampled."""
+        duration_ms = (time.perf_counter() - started) * 1000
+        resolver_match = request.resolver_match
+        url_name = resolver_match.view_name if resolver_match else ''
+        weight = get_policy().sample(request.path, request.method, response.status_code, duration_ms, url_name)
+        if weight is None:
+            return None
+        return {
+            'path': request.path,
+            'method': request.method,
+            'timestamp': arrived_at,
+            'remote_addr': request.META.get('REMOTE_ADDR'),
+            'query_params': request.META.get('QUERY_STRING', ''),
+            **capture_body(request),
+            'url_name': url_name,
+            'status_code': response.status_code,
+            'duration_ms': duration_ms,
+            'db_time_ms': stats.duration * 1000,
+            'query_count': stats.count,
+            'response_size': None if response.streaming else len(response.content),
+            'sample_weight': weight,
+        }
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0002_requestlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlog',
+            name='body_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='body_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0004_requestlog_timings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('path', models.CharField(max_length=512)),
+                ('method', models.CharField(max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_duration_ms', models.FloatField(default=0)),
+                ('max_duration_ms', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-bucket'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='requestlog',
+            index=models.Index(fields=['timestamp'], name='tracking_log_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestlog',
+            index=models.Index(fields=['path', 'timestamp'], name='tracking_log_path_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestlogrollup',
+            index=models.Index(fields=['resolution', 'path', 'bucket'], name='tracking_rollup_path_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='requestlogrollup',
+            constraint=models.UniqueConstraint(fields=('resolution', 'bucket', 'path', 'method', 'status_code'), name='tracking_rollup_unique_bucket'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+def copy_counts(apps, schema_editor):
+    # Rows logged before sampling each stand for exactly one request.
+    RequestLogRollup = apps.get_model('tracking', 'RequestLogRollup')
+    RequestLogRollup.objects.update(estimated_count=models.F('count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0005_requestlog_indexes_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlog',
+            name='sample_weight',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddField(
+            model_name='requestlogrollup',
+            name='estimated_count',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(copy_counts, migrations.RunPython.noop),
+    ]
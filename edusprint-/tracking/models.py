@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 # Create your models here.
 
@@ -7,10 +8,66 @@ class RequestLog(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
     path = models.CharField(max_length=512)
     method = models.CharField(max_length=10)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set from the request's arrival time, since rows are written later in batches.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     remote_addr = models.GenericIPAddressField(null=True, blank=True)
     query_params = models.TextField(blank=True)
+    # Bounded prefix of the request body; see tracking/capture.py.
     body = models.TextField(blank=True)
+    body_size = models.PositiveBigIntegerField(null=True, blank=True)
+    body_sha256 = models.CharField(max_length=64, blank=True)
+    # Filled in once the response is ready; null for rows logged before
+    # the middleware measured requests.
+    url_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    duration_ms = models.FloatField(null=True, blank=True)
+    db_time_ms = models.FloatField(null=True, blank=True)
+    query_count = models.PositiveIntegerField(null=True, blank=True)
+    response_size = models.PositiveBigIntegerField(null=True, blank=True)
+    # Number of requests this row stands for (1 / sampling rate).
+    sample_weight = models.FloatField(default=1.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='tracking_log_timestamp_idx'),
+            models.Index(fields=['path', 'timestamp'], name='tracking_log_path_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.method} {self.path} at {self.timestamp}"
+
+class RequestLogRollup(models.Model):
+    """Request counters for one (path, method, status) in one time bucket."""
+    RESOLUTION_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+    ]
+
+    resolution = models.CharField(max_length=6, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    path = models.CharField(max_length=512)
+    method = models.CharField(max_length=10)
+    # 0 when the raw rows predate status code tracking.
+    status_code = models.PositiveSmallIntegerField(default=0)
+    # Rows logged, and the number of requests they stand for once sample
+    # weights are applied. total_duration_ms is weighted the same way.
+    count = models.PositiveIntegerField(default=0)
+    estimated_count = models.FloatField(default=0)
+    total_duration_ms = models.FloatField(default=0)
+    max_duration_ms = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['resolution', 'bucket', 'path', 'method', 'status_code'],
+                name='tracking_rollup_unique_bucket',
+            ),
+        ]
+        # The unique constraint already indexes (resolution, bucket, ...).
+        indexes = [
+            models.Index(fields=['resolution', 'path', 'bucket'], name='tracking_rollup_path_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} [{self.status_code}] {self.resolution} {self.bucket}: {self.count}"
@@ -0,0 +1,177 @@
+"""Time-bucketed rollups and retention for RequestLog.
+
+Raw rows are aggregated into per-minute counters keyed by (path, method,
+status), and minute counters are aggregated into per-hour counters. Each run
+recomputes the newest bucket it already wrote, so rows flushed late by the
+tracking buffer are still counted. Raw rows are only pruned once they are
+covered by hourly rollups.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour, TruncMinute
+from django.utils import timezone
+
+from .models import RequestLog, RequestLogRollup
+
+RESOLUTIONS = {
+    'minute': (TruncMinute, timedelta(minutes=1)),
+    'hour': (TruncHour, timedelta(hours=1)),
+}
+
+RETENTION_DEFAULTS = {
+    'RAW_DAYS': 30,
+    'MINUTE_ROLLUP_DAYS': 7,
+    'BATCH_SIZE': 5000,
+}
+
+# Only roll up buckets that closed at least this long ago, to give the
+# tracking buffer time to flush.
+SETTLE_DELAY = timedelta(minutes=1)
+
+# Rollups are computed in windows of this size to bound memory use.
+CHUNK = timedelta(hours=6)
+
+
+def get_retention_config():
+    config = dict(RETENTION_DEFAULTS)
+    config.update(getattr(settings, 'REQUEST_LOG_RETENTION', {}))
+    return config
+
+
+def truncate(value, resolution):
+    if resolution == 'minute':
+        return value.replace(second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(rollups):
+    RequestLogRollup.objects.bulk_create(  # type: ignore
+        rollups,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['resolution', 'bucket', 'path', 'method', 'status_code'],
+        update_fields=['count', 'estimated_count', 'total_duration_ms', 'max_duration_ms'],
+    )
+    return len(rollups)
+
+
+def _aggregate_minutes(start, end):
+    rows = (
+        RequestLog.objects.filter(timestamp__gte=start, timestamp__lt=end)  # type: ignore
+        .annotate(bucket=TruncMinute('timestamp'), status=Coalesce('status_code', Value(0)))
+        .values('bucket', 'path', 'method', 'status')
+        .annotate(
+            total=Count('id'),
+            estimated=Sum('sample_weight'),
+            total_duration=Coalesce(Sum(F('duration_ms') * F('sample_weight')), Value(0.0)),
+            max_duration=Max('duration_ms'),
+        )
+    )
+    return [
+        RequestLogRollup(
+            resolution='minute', bucket=row['bucket'], path=row['path'], method=row['method'],
+            status_code=row['status'], count=row['total'], estimated_count=row['estimated'],
+            total_duration_ms=row['total_duration'], max_duration_ms=row['max_duration'],
+        )
+        for row in rows
+    ]
+
+
+def _aggregate_hours(start, end):
+    rows = (
+        RequestLogRollup.objects.filter(resolution='minute', bucket__gte=start, bucket__lt=end)  # type: ignore
+        .annotate(hour=TruncHour('bucket'))
+        .values('hour', 'path', 'method', 'status_code')
+        .annotate(
+            total=Sum('count'),
+            estimated=Sum('estimated_count'),
+            total_duration=Sum('total_duration_ms'),
+            max_duration=Max('max_duration_ms'),
+        )
+        .order_by()
+    )
+    return [
+        RequestLogRollup(
+            resolution='hour', bucket=row['hour'], path=row['path'], method=row['method'],
+            status_code=row['status_code'], count=row['total'], estimated_count=row['estimated'],
+            total_duration_ms=row['total_duration'], max_duration_ms=row['max_duration'],
+        )
+        for row in rows
+    ]
+
+
+def _start_for(resolution):
+    """First bucket to (re)compute: the newest existing one, else the oldest source row."""
+    latest = RequestLogRollup.objects.filter(resolution=resolution).aggregate(latest=Max('bucket'))['latest']  # type: ignore
+    if latest is not None:
+        return latest
+    if resolution == 'minute':
+        oldest = RequestLog.objects.order_by('timestamp').values_list('timestamp', flat=True).first()  # type: ignore
+    else:
+        oldest = RequestLogRollup.objects.filter(resolution='minute').order_by('bucket').values_list('bucket', flat=True).first()  # type: ignore
+    return truncate(oldest, resolution) if oldest is not None else None
+
+
+def rollup(resolution, now=None):
+    """Bring the rollups of one resolution up to date; returns the number of buckets written."""
+    _, step = RESOLUTIONS[resolution]
+    end = truncate((now or timezone.now()) - SETTLE_DELAY, resolution)
+    start = _start_for(resolution)
+    if start is None:
+        return 0
+    aggregate = _aggregate_minutes if resolution == 'minute' else _aggregate_hours
+    written = 0
+    while start < end:
+        chunk_end = min(start + max(CHUNK, step), end)
+        written += _upsert(aggregate(start, chunk_end))
+        start = chunk_end
+    return written
+
+
+def rollup_all(now=None):
+    """Update minute rollups from raw rows, then hour rollups from minute rollups."""
+    return {resolution: rollup(resolution, now) for resolution in ('minute', 'hour')}
+
+
+def delete_in_batches(queryset, batch_size):
+    """Delete a queryset's rows with one bounded DELETE per batch; returns the row count."""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+
+def rolled_up_until():
+    """End of the newest hour bucket; raw rows before this are covered by rollups."""
+    latest = RequestLogRollup.objects.filter(resolution='hour').aggregate(latest=Max('bucket'))['latest']  # type: ignore
+    return latest + RESOLUTIONS['hour'][1] if latest is not None else None
+
+
+def prune(raw_days=None, minute_rollup_days=None, batch_size=None, now=None):
+    """Delete raw rows and minute rollups past their retention, in bounded batches.
+
+    Raw rows newer than the last hourly rollup are always kept so that
+    pruning never loses data that has not been aggregated yet.
+    """
+    config = get_retention_config()
+    raw_days = config['RAW_DAYS'] if raw_days is None else raw_days
+    minute_rollup_days = config['MINUTE_ROLLUP_DAYS'] if minute_rollup_days is None else minute_rollup_days
+    batch_size = batch_size or config['BATCH_SIZE']
+    now = now or timezone.now()
+
+    result = {'raw': 0, 'minute_rollups': 0}
+    covered = rolled_up_until()
+    if covered is not None:
+        cutoff = min(now - timedelta(days=raw_days), covered)
+        result['raw'] = delete_in_batches(RequestLog.objects.filter(timestamp__lt=cutoff), batch_size)  # type: ignore
+        # Minute rollups feed the hourly ones, so keep those not yet covered either.
+        minute_cutoff = min(now - timedelta(days=minute_rollup_days), covered)
+        result['minute_rollups'] = delete_in_batches(
+            RequestLogRollup.objects.filter(resolution='minute', bucket__lt=minute_cutoff),  # type: ignore
+            batch_size,
+        )
+    return result
@@ -0,0 +1,120 @@
+"""Sampling policy for request logging.
+
+Each request is logged with a probability picked from per-URL-name,
+per-path and per-method rates. Errors and slow requests are always logged,
+excluded prefixes are never logged, and when the number of logged requests
+goes over MAX_WRITES_PER_SECOND the sampled rates are scaled down until it
+fits again.
+Every logged row carries ``sample_weight = 1 / rate`` so totals can still be
+estimated by summing weights.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULTS = {
+    'DEFAULT_RATE': 1.0,
+    # Method -> rate, e.g. {'GET': 0.2}.
+    'METHOD_RATES': {},
+    # Path prefix -> rate; the longest matching prefix wins over the method rate.
+    'PATH_RATES': {},
+    # Resolved URL name -> rate; wins over path and method rates.
+    'URL_NAME_RATES': {},
+    'EXCLUDE_PREFIXES': [],
+    # Responses with a status code at or above this are always logged.
+    'ALWAYS_LOG_STATUS': 500,
+    # Requests slower than this are always logged; None disables the rule.
+    'ALWAYS_LOG_SLOWER_THAN_MS': 1000,
+    # Budget of sampled writes per second per process; None disables
+    # adaptive down-sampling.
+    'MAX_WRITES_PER_SECOND': None,
+}
+
+
+def get_config():
+    """Return the REQUEST_LOG_SAMPLING setting merged over the defaults."""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REQUEST_LOG_SAMPLING', {}))
+    return config
+
+
+class SamplingPolicy:
+    """Decides whether to log a request and with which sample weight."""
+
+    # Length of the window over which the write rate is measured, in seconds.
+    window = 1.0
+
+    def __init__(self, config):
+        self.default_rate = config['DEFAULT_RATE']
+        self.method_rates = config['METHOD_RATES']
+        self.path_rates = config['PATH_RATES']
+        self.url_name_rates = config['URL_NAME_RATES']
+        self.exclude_prefixes = tuple(config['EXCLUDE_PREFIXES'])
+        self.always_log_status = config['ALWAYS_LOG_STATUS']
+        self.always_log_slower_than_ms = config['ALWAYS_LOG_SLOWER_THAN_MS']
+        self.max_writes_per_second = config['MAX_WRITES_PER_SECOND']
+        self.adaptive_factor = 1.0
+        self._lock = threading.Lock()
+        self._window_started = time.monotonic()
+        # Writes the requests seen in the window would cost at the base rates.
+        self._window_demand = 0.0
+
+    def is_excluded(self, path):
+        return path.startswith(self.exclude_prefixes)
+
+    def base_rate(self, path, method, url_name=''):
+        if url_name in self.url_name_rates:
+            return self.url_name_rates[url_name]
+        matches = [prefix for prefix in self.path_rates if path.startswith(prefix)]
+        if matches:
+            return self.path_rates[max(matches, key=len)]
+        return self.method_rates.get(method, self.default_rate)
+
+    def _adapt(self, base_rate):
+        """Count a request's expected writes and adjust the adaptive factor once per window.
+
+        Runs for every request, logged or not, so the window keeps moving
+        while the factor is low and the rate recovers once a burst is over.
+        """
+        if self.max_writes_per_second is None:
+            return
+        with self._lock:
+            self._window_demand += base_rate
+            now = time.monotonic()
+            elapsed = now - self._window_started
+            if elapsed < self.window:
+                return
+            demand = self._window_demand / elapsed
+            self.adaptive_factor = min(1.0, self.max_writes_per_second / demand) if demand else 1.0
+            self._window_started = now
+            self._window_demand = 0.0
+
+    def sample(self, path, method, status_code, duration_ms, url_name=''):
+        """Return the sample weight to log the request with, or None to skip it."""
+        if self.is_excluded(path):
+            return None
+        always = status_code >= self.always_log_status or (
+            self.always_log_slower_than_ms is not None and duration_ms >= self.always_log_slower_than_ms)
+        base_rate = 0.0 if always else self.base_rate(path, method, url_name)
+        self._adapt(base_rate)
+        if always:
+            return 1.0
+        rate = base_rate * self.adaptive_factor
+        if rate <= 0:
+            return None
+        if rate < 1.0 and random.random() >= rate:
+            return None
+        return 1.0 / min(rate, 1.0)
+
+
+_policy = None
+
+
+def get_policy():
+    """Return the process-wide sampling policy built from settings."""
+    global _policy
+    if _policy is None:
+        _policy = SamplingPolicy(get_config())
+    return _policy
@@ -0,0 +1,46 @@
+"""Latency statistics over RequestLog rows."""
+from itertools import groupby
+
+PERCENTILES = (50, 95, 99)
+
+
+def weighted_percentile(sorted_pairs, pct):
+    """Percentile of (value, weight) pairs sorted by value.
+
+    Rows carry their sample weight, so always-logged slow requests do not
+    skew the percentiles of a sampled endpoint.
+    """
+    threshold = sum(weight for _, weight in sorted_pairs) * pct / 100
+    cumulative = 0.0
+    for value, weight in sorted_pairs:
+        cumulative += weight
+        if cumulative >= threshold:
+            return value
+    return sorted_pairs[-1][0]
+
+
+def latency_by_url_name(queryset):
+    """Return p50/p95/p99 latency, average DB time and queries per URL name.
+
+    Rows are streamed ordered by (url_name, duration_ms), so only one URL
+    name's durations are held in memory at a time.
+    """
+    rows = (
+        queryset.filter(duration_ms__isnull=False)
+        .order_by('url_name', 'duration_ms')
+        .values_list('url_name', 'duration_ms', 'db_time_ms', 'query_count', 'sample_weight')
+        .iterator()
+    )
+    summary = []
+    for url_name, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        total_weight = sum(row[4] for row in group)
+        durations = [(row[1], row[4]) for row in group]
+        entry = {'url_name': url_name, 'count': len(group), 'estimated_count': round(total_weight)}
+        for pct in PERCENTILES:
+            entry[f'p{pct}_ms'] = round(weighted_percentile(durations, pct), 2)
+        entry['avg_db_time_ms'] = round(sum((row[2] or 0) * row[4] for row in group) / total_weight, 2)
+        entry['avg_query_count'] = round(sum((row[3] or 0) * row[4] for row in group) / total_weight, 2)
+        summary.append(entry)
+    summary.sort(key=lambda entry: entry['p95_ms'], reverse=True)
+    return summary
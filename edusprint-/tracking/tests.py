@@ -1,3 +1,437 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, empty
+
+from users.models import CustomUser
+from .archive import iter_archive, stream_gzip
+from .buffer import RequestLogBuffer, get_config, log_request
+from .capture import DEFAULTS as CAPTURE_DEFAULTS, capture_body, get_capture_mode
+from .instrumentation import record_query, start_measuring, stop_measuring
+from .middleware import RequestLogMiddleware
+from .models import RequestLog, RequestLogRollup
+from .rollups import prune, rolled_up_until, rollup_all
+from .sampling import DEFAULTS as SAMPLING_DEFAULTS, SamplingPolicy
+from .stats import latency_by_url_name
+
+
+def make_record(path='/api/things/', **fields):
+    return {'path': path, 'method': 'GET', 'timestamp': timezone.now(), **fields}
+
+
+class RequestLogBufferTests(TestCase):
+    def setUp(self):
+        # No flusher thread: it would write on its own connection, outside
+        # the test transaction. Only the explicit flushes below write.
+        self.enterContext(mock.patch.object(RequestLogBuffer, 'start'))
+
+    def test_flush_writes_in_batches(self):
+        buffer = RequestLogBuffer(batch_size=2, flush_interval=3600)
+        for n in range(5):
+            self.assertTrue(buffer.enqueue(make_record(f'/page/{n}/')))
+        self.assertEqual(RequestLog.objects.count(), 0)
+        with self.assertNumQueries(3):
+            self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(buffer.written, 5)
+        self.assertEqual(
+            sorted(RequestLog.objects.values_list('path', flat=True)), [f'/page/{n}/' for n in range(5)])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_overflow_policies(self):
+        for overflow, accepted, kept in [
+            ('drop_newest', False, ['/0/', '/1/']),
+            ('drop_oldest', True, ['/1/', '/2/']),
+            ('block', False, ['/0/', '/1/']),
+        ]:
+            with self.subTest(overflow=overflow):
+                buffer = RequestLogBuffer(max_queue_size=2, overflow=overflow, block_timeout=0.01)
+                self.assertTrue(buffer.enqueue(make_record('/0/')))
+                self.assertTrue(buffer.enqueue(make_record('/1/')))
+                self.assertEqual(buffer.enqueue(make_record('/2/')), accepted)
+                self.assertEqual(buffer.dropped, 1)
+                self.assertEqual([record['path'] for record in buffer._drain(10)], kept)
+        with self.assertRaises(ValueError):
+            RequestLogBuffer(overflow='drop_everything')
+
+    def test_failed_write_is_dropped_and_counted(self):
+        buffer = RequestLogBuffer(batch_size=10)
+        buffer.enqueue(make_record())
+        buffer.enqueue(make_record())
+        with mock.patch('django.db.models.QuerySet.bulk_create', side_effect=RuntimeError('disk full')), \
+                self.assertLogs('tracking.buffer'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual((buffer.dropped, buffer.written), (2, 0))
+        self.assertTrue(buffer.queue.empty())
+
+    def test_stop_flushes_what_is_queued(self):
+        buffer = RequestLogBuffer(flush_interval=3600)
+        buffer.enqueue(make_record())
+        buffer.stop()
+        self.assertEqual(RequestLog.objects.count(), 1)
+
+    def test_stop_flushes_on_the_calling_thread(self):
+        buffer = RequestLogBuffer(flush_interval=3600)
+        flushed_on = []
+        flush = buffer.flush
+        buffer.flush = lambda: flushed_on.append(threading.current_thread()) or flush()
+        # The flusher thread proper; start() is patched out above.
+        buffer._thread = threading.Thread(target=buffer._run)
+        buffer._thread.start()
+        buffer.enqueue(make_record())
+        buffer.stop()
+        self.assertFalse(buffer._thread.is_alive())
+        self.assertEqual(flushed_on, [threading.current_thread()])
+        self.assertEqual(RequestLog.objects.count(), 1)
+
+    def test_tests_write_synchronously(self):
+        # Set by edusprint.test_runner.TestRunner.
+        self.assertFalse(get_config()['ENABLED'])
+
+    @override_settings(REQUEST_LOG_BUFFER={'ENABLED': False})
+    def test_unbuffered_writes_immediately(self):
+        with mock.patch('tracking.buffer.get_buffer') as get_buffer:
+            self.assertTrue(log_request(make_record('/direct/')))
+        get_buffer.assert_not_called()
+        self.assertTrue(RequestLog.objects.filter(path='/direct/').exists())
+
+
+@override_settings(REQUEST_LOG_BODY_CAPTURE={
+    **CAPTURE_DEFAULTS, 'MAX_PREFIX_BYTES': 16, 'MAX_READ_BYTES': 4096, 'PATHS': {'/api/login/': 'meta'},
+})
+class BodyCaptureTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_records_a_bounded_prefix_size_and_hash(self):
+        body = json.dumps({'title': 'x' * 1000}).encode()
+        captured = capture_body(self.factory.post('/api/portfolio/', body, content_type='application/json'))
+        self.assertEqual(captured, {
+            'body': body[:16].decode(), 'body_size': len(body), 'body_sha256': hashlib.sha256(body).hexdigest(),
+        })
+
+    def test_credentials_are_logged_by_size_only(self):
+        body = json.dumps({'username': 'student', 'password': 'hunter2'}).encode()
+        request = self.factory.post('/api/login/', body, content_type='application/json')
+        self.assertEqual(capture_body(request), {'body': '', 'body_size': len(body), 'body_sha256': ''})
+        # The body was not read, so the view can still stream it.
+        self.assertFalse(hasattr(request, '_body'))
+
+    def test_large_and_multipart_bodies_are_never_read(self):
+        large = self.factory.post('/api/portfolio/', b'x' * 5000, content_type='text/plain')
+        upload = self.factory.post('/api/portfolio/', {'file': SimpleUploadedFile('cv.pdf', b'%PDF' * 10)})
+        for request in (large, upload):
+            captured = capture_body(request)
+            self.assertEqual((captured['body'], captured['body_sha256']), ('', ''))
+            self.assertEqual(captured['body_size'], int(request.META['CONTENT_LENGTH']))
+            self.assertFalse(hasattr(request, '_body'))
+
+    def test_modes(self):
+        self.assertEqual(get_capture_mode(self.factory.get('/api/portfolio/')), 'none')
+        self.assertEqual(get_capture_mode(self.factory.post('/api/login/sso/', {})), 'meta')
+        self.assertEqual(capture_body(self.factory.delete('/api/portfolio/1/', b'{}')),
+                         {'body': '', 'body_size': None, 'body_sha256': ''})
+        with override_settings(REQUEST_LOG_BODY_CAPTURE={'DEFAULT_MODE': 'everything'}), \
+                self.assertRaises(ValueError):
+            get_capture_mode(self.factory.post('/api/portfolio/', b'{}', content_type='application/json'))
+
+
+@override_settings(REQUEST_LOG_BUFFER={'ENABLED': False})
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        # Log every request, whatever the project's sampling settings.
+        policy = SamplingPolicy(dict(SAMPLING_DEFAULTS))
+        self.enterContext(mock.patch('tracking.middleware.get_policy', return_value=policy))
+
+    def test_counts_queries_only_while_measuring(self):
+        connection.ensure_connection()
+        self.assertIn(record_query, connection.execute_wrappers)
+        CustomUser.objects.count()
+        stats, token = start_measuring()
+        CustomUser.objects.count()
+        CustomUser.objects.exists()
+        stop_measuring(token)
+        CustomUser.objects.count()
+        self.assertEqual(stats.count, 2)
+        self.assertGreater(stats.duration, 0)
+
+    def test_middleware_records_latency_db_time_and_queries(self):
+        def view(request):
+            CustomUser.objects.count()
+            CustomUser.objects.exists()
+            return HttpResponse('hello')
+
+        request = RequestFactory().get('/api/things/', {'page': 2})
+        request.user = CustomUser.objects.create(username='reader')
+        RequestLogMiddleware(view)(request)
+        log = RequestLog.objects.get()
+        self.assertEqual((log.path, log.query_params, log.user, log.status_code), (
+            '/api/things/', 'page=2', request.user, 200))
+        # The log's own INSERT happens after measuring stops.
+        self.assertEqual((log.query_count, log.response_size, log.sample_weight), (2, 5, 1.0))
+        self.assertGreater(log.db_time_ms, 0)
+        self.assertGreaterEqual(log.duration_ms, log.db_time_ms)
+
+    def test_latency_percentiles_are_weighted(self):
+        now = timezone.now()
+        RequestLog.objects.bulk_create(
+            [RequestLog(path='/a/', method='GET', timestamp=now, url_name='fast', duration_ms=ms, db_time_ms=1,
+                        query_count=2, sample_weight=10) for ms in range(1, 11)]
+            # Always-logged slow requests stand for one request each.
+            + [RequestLog(path='/a/', method='GET', timestamp=now, url_name='fast', duration_ms=5000,
+                          sample_weight=1)]
+            + [RequestLog(path='/b/', method='GET', timestamp=now, url_name='slow', duration_ms=900)]
+        )
+        slow, fast = latency_by_url_name(RequestLog.objects.all())
+        self.assertEqual(slow['url_name'], 'slow')
+        self.assertEqual((fast['count'], fast['estimated_count']), (11, 101))
+        self.assertEqual((fast['p50_ms'], fast['p95_ms'], fast['p99_ms']), (6, 10, 10))
+        self.assertEqual(fast['avg_query_count'], round(2 * 100 / 101, 2))
+
+
+class RollupTests(TestCase):
+    now = datetime(2026, 1, 1, 12, 30, tzinfo=dt_timezone.utc)
+
+    def log(self, hour, minute, status_code=200, duration_ms=10.0, sample_weight=1.0):
+        return RequestLog.objects.create(
+            path='/api/a/', method='GET', timestamp=self.now.replace(hour=hour, minute=minute),
+            status_code=status_code, duration_ms=duration_ms, sample_weight=sample_weight)
+
+    def hour(self, hour, status_code=200):
+        return RequestLogRollup.objects.get(
+            resolution='hour', bucket=self.now.replace(hour=hour, minute=0), status_code=status_code)
+
+    def test_rollups_and_late_rows(self):
+        self.log(10, 5, duration_ms=10)
+        self.log(10, 5, duration_ms=30)
+        self.log(10, 5, status_code=500)
+        self.log(11, 20, sample_weight=4)
+        self.log(12, 29)  # Not settled yet.
+        self.assertEqual(rollup_all(self.now), {'minute': 3, 'hour': 3})
+        ok = self.hour(10)
+        self.assertEqual((ok.count, ok.estimated_count, ok.total_duration_ms, ok.max_duration_ms), (2, 2, 40, 30))
+        self.assertEqual(self.hour(10, status_code=500).count, 1)
+        self.assertEqual((self.hour(11).count, self.hour(11).estimated_count), (1, 4))
+        self.assertFalse(RequestLogRollup.objects.filter(bucket__gte=self.now.replace(minute=0)).exists())
+
+        # A row flushed late into the newest bucket is counted on the next run.
+        self.log(11, 20)
+        rollup_all(self.now)
+        self.assertEqual((self.hour(11).count, self.hour(11).estimated_count), (2, 5))
+        self.assertEqual(RequestLogRollup.objects.filter(resolution='hour').count(), 3)
+
+    def test_prune_keeps_rows_not_rolled_up(self):
+        for hour in (10, 11, 12):
+            self.log(hour, 5)
+        self.assertEqual(prune(raw_days=0, minute_rollup_days=0, now=self.now), {'raw': 0, 'minute_rollups': 0})
+        self.assertEqual(RequestLog.objects.count(), 3)
+
+        rollup_all(self.now)
+        self.assertEqual(rolled_up_until(), self.now.replace(minute=0))
+        # The 12:05 row and its minute rollup are newer than the last hour bucket.
+        self.assertEqual(prune(raw_days=0, minute_rollup_days=0, batch_size=1, now=self.now),
+                         {'raw': 2, 'minute_rollups': 2})
+        self.assertEqual(list(RequestLog.objects.values_list('timestamp__hour', flat=True)), [12])
+        self.assertEqual(RequestLogRollup.objects.filter(resolution='minute').count(), 1)
+        self.assertEqual(RequestLogRollup.objects.filter(resolution='hour').count(), 2)
+        # Retention windows still apply to covered rows.
+        self.log(11, 6)
+        self.assertEqual(prune(raw_days=1, now=self.now)['raw'], 0)
+
+
+class SamplingPolicyTests(SimpleTestCase):
+    def policy(self, **config):
+        return SamplingPolicy({**SAMPLING_DEFAULTS, **config})
+
+    def test_rates_by_url_name_path_and_method(self):
+        policy = self.policy(
+            METHOD_RATES={'GET': 0.5}, PATH_RATES={'/api/': 0.2, '/api/portfolio/': 0.1},
+            URL_NAME_RATES={'homepage': 0.0}, EXCLUDE_PREFIXES=['/static/'])
+        self.assertEqual(policy.base_rate('/api/portfolio/1/', 'GET'), 0.1)
+        self.assertEqual(policy.base_rate('/api/login/', 'GET'), 0.2)
+        self.assertEqual(policy.base_rate('/dashboard/', 'GET'), 0.5)
+        self.assertEqual(policy.base_rate('/dashboard/', 'POST'), 1.0)
+        self.assertEqual(policy.base_rate('/api/portfolio/', 'GET', 'homepage'), 0.0)
+        with mock.patch('tracking.sampling.random.random', return_value=0.05):
+            self.assertEqual(policy.sample('/api/portfolio/1/', 'GET', 200, 5), 10.0)
+            self.assertIsNone(policy.sample('/', 'GET', 200, 5, 'homepage'))
+            self.assertIsNone(policy.sample('/static/app.css', 'GET', 500, 5000))
+        with mock.patch('tracking.sampling.random.random', return_value=0.5):
+            self.assertIsNone(policy.sample('/api/portfolio/1/', 'GET', 200, 5))
+
+    def test_errors_and_slow_requests_are_always_logged(self):
+        policy = self.policy(DEFAULT_RATE=0.0, ALWAYS_LOG_SLOWER_THAN_MS=500)
+        self.assertIsNone(policy.sample('/', 'GET', 404, 499))
+        self.assertEqual(policy.sample('/', 'GET', 503, 1), 1.0)
+        self.assertEqual(policy.sample('/', 'GET', 200, 500), 1.0)
+
+    def test_adapts_to_the_write_budget(self):
+        with mock.patch('tracking.sampling.time.monotonic', return_value=100.0) as clock:
+            policy = self.policy(MAX_WRITES_PER_SECOND=10)
+            for _ in range(99):
+                self.assertEqual(policy.sample('/', 'GET', 200, 5), 1.0)
+            clock.return_value = 101.0
+            policy.sample('/', 'GET', 200, 5)
+            self.assertAlmostEqual(policy.adaptive_factor, 0.1)
+            with mock.patch('tracking.sampling.random.random', return_value=0.05):
+                self.assertAlmostEqual(policy.sample('/', 'GET', 200, 5), 10.0)
+            # Errors are logged whatever the budget.
+            self.assertEqual(policy.sample('/', 'GET', 500, 5), 1.0)
+            # Requests that are not logged still move the window, so the
+            # rate recovers once the burst is over.
+            clock.return_value = 101.5
+            with mock.patch('tracking.sampling.random.random', return_value=0.99):
+                for _ in range(5):
+                    self.assertIsNone(policy.sample('/', 'GET', 200, 5))
+            clock.return_value = 102.0
+            self.assertEqual(policy.sample('/', 'GET', 200, 5), 1.0)
+            self.assertEqual(policy.adaptive_factor, 1.0)
+
+
+@override_settings(REQUEST_LOG_BUFFER={'ENABLED': False})
+class AsyncMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='async-reader')
+
+    def setUp(self):
+        policy = SamplingPolicy({**SAMPLING_DEFAULTS, 'EXCLUDE_PREFIXES': ['/static/']})
+        self.enterContext(mock.patch('tracking.middleware.get_policy', return_value=policy))
+
+    async def view(self, request):
+        await CustomUser.objects.acount()
+        return HttpResponse('hello', status=201)
+
+    def request(self, path='/api/things/'):
+        request = RequestFactory().post(path, b'{"a": 1}', content_type='application/json')
+        request.user = SimpleLazyObject(lambda: self.user)
+
+        async def auser():
+            return self.user
+
+        request.auser = auser
+        return request
+
+    def test_runs_natively_in_both_modes(self):
+        self.assertTrue(iscoroutinefunction(RequestLogMiddleware(self.view)))
+        self.assertFalse(iscoroutinefunction(RequestLogMiddleware(lambda request: HttpResponse())))
+
+    async def test_logs_without_loading_the_user_synchronously(self):
+        request = self.request()
+        response = await RequestLogMiddleware(self.view)(request)
+        self.assertEqual(response.status_code, 201)
+        # The user came from auser(), not from evaluating request.user.
+        self.assertIs(request.user._wrapped, empty)
+        log = await RequestLog.objects.aget()
+        self.assertEqual((log.user_id, log.method, log.status_code, log.query_count), (self.user.id, 'POST', 201, 1))
+        self.assertEqual((log.body, log.body_size), ('{"a": 1}', 8))
+
+    @override_settings(REQUEST_LOG_BUFFER={'ENABLED': True})
+    async def test_buffered_records_are_queued_on_the_loop(self):
+        with mock.patch('tracking.buffer.get_buffer') as get_buffer, \
+                mock.patch('tracking.buffer.sync_to_async') as sync_to_async:
+            await RequestLogMiddleware(self.view)(self.request())
+        sync_to_async.assert_not_called()
+        record = get_buffer.return_value.enqueue.call_args.args[0]
+        self.assertEqual((record['path'], record['user_id']), ('/api/things/', self.user.id))
+
+    async def test_excluded_paths_are_not_logged(self):
+        response = await RequestLogMiddleware(self.view)(self.request('/static/app.css'))
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(await RequestLog.objects.aexists())
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.output_dir = self.enterContext(tempfile.TemporaryDirectory())
+        for day, path in [(1, '/a/'), (1, '/b/'), (2, '/c/')]:
+            self.log(day, path)
+
+    def log(self, day, path):
+        return RequestLog.objects.create(
+            path=path, method='GET', timestamp=datetime(2026, 1, day, 10, tzinfo=dt_timezone.utc),
+            status_code=200, duration_ms=1.5, body='{"é": 1}', body_size=9)
+
+    def archive(self, *args):
+        call_command('archive_request_logs', '--before', '2026-01-03', '--output-dir', self.output_dir, *args,
+                     stdout=io.StringIO())
+
+    def archived(self, day, fmt='ndjson'):
+        return list(iter_archive(os.path.join(self.output_dir, f'requestlog-2026-01-0{day}.{fmt}.gz')))
+
+    def test_round_trip(self):
+        for fmt in ('ndjson', 'csv'):
+            with self.subTest(fmt=fmt):
+                self.archive('--format', fmt, '--chunk-size', '2')
+                rows = self.archived(1, fmt)
+                self.assertEqual([row['path'] for row in rows], ['/a/', '/b/'])
+                self.assertEqual(rows[0]['body'], '{"é": 1}')
+                self.assertEqual(str(rows[0]['duration_ms']), '1.5')
+                self.assertEqual(rows[0]['timestamp'], '2026-01-01T10:00:00+00:00')
+                self.assertEqual([row['path'] for row in self.archived(2, fmt)], ['/c/'])
+        self.assertEqual(RequestLog.objects.count(), 3)
+        lines = gzip.decompress(b''.join(stream_gzip(RequestLog.objects.all(), 'csv'))).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('id,timestamp,'))
+
+    def test_rerunning_does_not_duplicate_rows(self):
+        self.archive()
+        self.archive()
+        self.log(1, '/late/')
+        self.archive()
+        self.assertEqual([row['path'] for row in self.archived(1)], ['/a/', '/b/', '/late/'])
+        self.assertEqual(len(self.archived(2)), 1)
+
+    def test_interrupted_run_leaves_archives_alone(self):
+        self.archive()
+        self.log(1, '/late/')
+        with mock.patch('tracking.archive.encode_row', side_effect=RuntimeError('disk full')), \
+                self.assertRaises(RuntimeError):
+            self.archive()
+        self.assertEqual([row['path'] for row in self.archived(1)], ['/a/', '/b/'])
+        self.assertEqual(sorted(os.listdir(self.output_dir)), [
+            '.requestlog-2026-01-01.ndjson.gz.mark', '.requestlog-2026-01-02.ndjson.gz.mark',
+            'requestlog-2026-01-01.ndjson.gz', 'requestlog-2026-01-02.ndjson.gz'])
+
+    def test_rerunning_appends_without_reading_the_archives(self):
+        self.archive()
+        self.log(1, '/late/')
+        with mock.patch('tracking.archive.iter_archive', side_effect=AssertionError('archive was read')):
+            self.archive()
+        self.assertEqual([row['path'] for row in self.archived(1)], ['/a/', '/b/', '/late/'])
+
+    def test_leftovers_past_the_mark_are_cut_off(self):
+        self.archive()
+        path = os.path.join(self.output_dir, 'requestlog-2026-01-01.ndjson.gz')
+        with open(path, 'ab') as handle:
+            handle.write(b'half a gzip member')
+        self.log(1, '/late/')
+        self.archive()
+        self.assertEqual([row['path'] for row in self.archived(1)], ['/a/', '/b/', '/late/'])
+        # Archives without a mark are scanned instead.
+        os.remove(os.path.join(self.output_dir, '.requestlog-2026-01-01.ndjson.gz.mark'))
+        self.archive()
+        self.assertEqual(len(self.archived(1)), 3)
+
+    def test_delete_keeps_rows_not_rolled_up(self):
+        self.archive('--delete')
+        self.assertEqual(RequestLog.objects.count(), 3)
+        # Hourly rollups cover January 1st only.
+        RequestLogRollup.objects.create(
+            resolution='hour', bucket=datetime(2026, 1, 1, 23, tzinfo=dt_timezone.utc), path='/a/', method='GET')
+        self.archive('--delete')
+        self.assertEqual(list(RequestLog.objects.values_list('path', flat=True)), ['/c/'])
+        self.assertEqual(len(self.archived(1)), 2)
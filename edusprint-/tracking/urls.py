@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import LatencyPercentilesView, RequestRollupView
+
+urlpatterns = [
+    path('latency/', LatencyPercentilesView.as_view(), name='tracking-latency'),
+    path('rollups/', RequestRollupView.as_view(), name='tracking-rollups'),
+]
@@ -1,3 +1,72 @@
-from django.shortcuts import render
+from datetime import timedelta
 
-# Create your views here.
+from django.db.models import Q, Sum
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import RequestLog, RequestLogRollup
+from .stats import latency_by_url_name
+
+class LatencyPercentilesView(APIView):
+    """p50/p95/p99 request latency per URL name over the last ``minutes``."""
+    permission_classes = [permissions.IsAdminUser]
+    max_window_minutes = 7 * 24 * 60
+
+    def get(self, request):
+        try:
+            minutes = int(request.query_params.get('minutes', 60))
+        except ValueError:
+            return Response({'error': 'minutes must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        minutes = min(max(minutes, 1), self.max_window_minutes)
+        since = timezone.now() - timedelta(minutes=minutes)
+        queryset = RequestLog.objects.filter(timestamp__gte=since)  # type: ignore
+        return Response({
+            'since': since,
+            'minutes': minutes,
+            'results': latency_by_url_name(queryset),
+        })
+
+class RequestRollupView(APIView):
+    """Request counts per time bucket, read only from the rollup tables."""
+    permission_classes = [permissions.IsAdminUser]
+    max_window_hours = 90 * 24
+
+    def get(self, request):
+        resolution = request.query_params.get('resolution', 'hour')
+        if resolution not in dict(RequestLogRollup.RESOLUTION_CHOICES):
+            return Response({'error': 'resolution must be minute or hour.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            hours = int(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({'error': 'hours must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        hours = min(max(hours, 1), self.max_window_hours)
+        since = timezone.now() - timedelta(hours=hours)
+
+        queryset = RequestLogRollup.objects.filter(resolution=resolution, bucket__gte=since)  # type: ignore
+        path = request.query_params.get('path')
+        if path:
+            queryset = queryset.filter(path=path)
+        buckets = (
+            queryset.values('bucket')
+            .annotate(
+                requests=Sum('estimated_count'),
+                server_errors=Sum('estimated_count', filter=Q(status_code__gte=500), default=0),
+                total_duration_ms=Sum('total_duration_ms'),
+            )
+            .order_by('bucket')
+        )
+        return Response({
+            'resolution': resolution,
+            'since': since,
+            'results': [
+                {
+                    'bucket': row['bucket'],
+                    'count': round(row['requests']),
+                    'server_errors': round(row['server_errors']),
+                    'avg_duration_ms': round(row['total_duration_ms'] / row['requests'], 2) if row['requests'] else None,
+                }
+                for row in buckets
+            ],
+        })